@@ -1,8 +1,18 @@
 from django.contrib import admin
-from .models import Equation, GraphConfig
+from .models import Equation, GraphConfig, SharedGraph
+from .search import search
+
+
+class IndexedSearchMixin:
+    """Admin search through api.search (the indexes) rather than icontains over search_fields"""
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return search(queryset, search_term, extra_fields=('user__username',)), False
 
 @admin.register(Equation)
-class EquationAdmin(admin.ModelAdmin):
+class EquationAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('expression', 'user', 'color', 'visible', 'created_at')
     list_filter = ('user', 'visible', 'created_at')
     search_fields = ('expression', 'user__username')
@@ -16,7 +26,7 @@ class EquationAdmin(admin.ModelAdmin):
         return qs.filter(user=request.user)
 
 @admin.register(GraphConfig)
-class GraphConfigAdmin(admin.ModelAdmin):
+class GraphConfigAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('name', 'user', 'xMin', 'xMax', 'yMin', 'yMax', 'gridVisible', 'is_saved', 'created_at')
     list_filter = ('user', 'gridVisible', 'is_saved', 'created_at')
     search_fields = ('name', 'user__username', 'description')
@@ -28,3 +38,18 @@ class GraphConfigAdmin(admin.ModelAdmin):
         if request.user.is_superuser:
             return qs
         return qs.filter(user=request.user)
+
+@admin.register(SharedGraph)
+class SharedGraphAdmin(admin.ModelAdmin):
+    list_display = ('key', 'user', 'graph_config', 'created_at')
+    list_filter = ('user', 'created_at')
+    readonly_fields = ('key', 'graph_config', 'user', 'content', 'etag', 'created_at')
+    ordering = ('-created_at',)
+    list_per_page = 20
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        if request.user.is_superuser:
+            return qs
+        return qs.filter(user=request.user)
+
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+        from . import metrics, signals  # noqa: F401
+        from .search import repair_sqlite_triggers
+        post_migrate.connect(repair_sqlite_triggers, sender=self)
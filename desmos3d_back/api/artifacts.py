@@ -0,0 +1,109 @@
+"""
+Precomputed evaluation results kept as immutable binary artifacts.
+
+Dense samples and high-resolution meshes requested in the binary format
+(``Accept: application/octet-stream``) are written once, as the
+``Float32BufferRenderer`` bytes of the result, to the storage configured by
+``settings.ARTIFACTS`` and named by a hash of everything they depend on:
+normalized expressions, bounds, resolution and ``ENGINE_VERSION``. Repeat
+requests from any process or node find the artifact and are redirected to
+it (or served from it) instead of evaluating again. As the content of a name
+never changes, the storage can send it with far-future cache headers.
+
+Artifacts hold only the computed content: rows that share it share the file,
+so per-row fields such as equation ids and colors are left out.
+"""
+import hashlib
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.http import HttpResponse, HttpResponseRedirect
+from django.utils.module_loading import import_string
+
+from .cache import get_cache
+from .expressions import ExpressionError, normalize
+from .renderers import Float32BufferRenderer
+
+# Part of every artifact name: bump it when evaluation results change
+ENGINE_VERSION = 1
+
+
+def get_artifact_storage():
+    options = settings.ARTIFACTS
+    return import_string(options['STORAGE'])(**options.get('OPTIONS', {}))
+
+
+def artifact_expression(text):
+    """Normalized text of an expression, or the text itself if it does not tokenize"""
+    try:
+        return normalize(text)
+    except ExpressionError:
+        return text
+
+
+def artifact_name(kind, *parts):
+    """Storage name of the ``kind`` artifact computed from ``parts`` (JSON-serializable)"""
+    key = json.dumps([ENGINE_VERSION, kind, *parts], separators=(',', ':'))
+    return '{}/{}.d3db'.format(kind, hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+
+def wants_artifact(request, points):
+    """Whether a binary response of about ``points`` samples should go through an artifact"""
+    renderer = getattr(request, 'accepted_renderer', None)
+    return (settings.ARTIFACTS['ENABLED'] and points >= settings.ARTIFACTS['MIN_POINTS']
+            and renderer is not None and renderer.format == Float32BufferRenderer.format)
+
+
+def stored_artifact(name):
+    """Redirect to (or serve) the artifact ``name``, or None if it was never stored"""
+    storage = get_artifact_storage()
+    stored = get_cache('ARTIFACTS')
+    if name not in stored and not storage.exists(name):
+        return None
+    stored.set(name, True)
+    return _artifact_response(storage, name)
+
+
+def store_artifact(name, data):
+    """Store the binary rendering of ``data`` as the artifact ``name`` and respond with it"""
+    storage = get_artifact_storage()
+    content = Float32BufferRenderer().render(data)
+    saved = storage.save(name, ContentFile(content))
+    if saved != name:
+        # Stored concurrently by another process: keep one copy
+        storage.delete(saved)
+    get_cache('ARTIFACTS').set(name, True)
+    return _artifact_response(storage, name, content)
+
+
+def artifact_response(name, compute):
+    """
+    Redirect to (or serve) the artifact ``name``, storing the binary
+    rendering of ``compute()`` under it first if no process has yet.
+    ``compute`` may raise ExpressionError; nothing is stored then.
+    """
+    response = stored_artifact(name)
+    if response is None:
+        response = store_artifact(name, compute())
+    return response
+
+
+async def aartifact_response(name, compute):
+    """``artifact_response`` for async views, ``compute`` being a coroutine function"""
+    response = await sync_to_async(stored_artifact)(name)
+    if response is None:
+        response = await sync_to_async(store_artifact)(name, await compute())
+    return response
+
+
+def _artifact_response(storage, name, content=None):
+    if settings.ARTIFACTS['REDIRECT']:
+        return HttpResponseRedirect(storage.url(name))
+    if content is None:
+        with storage.open(name) as artifact:
+            content = artifact.read()
+    response = HttpResponse(content, content_type=Float32BufferRenderer.media_type)
+    response['ETag'] = '"{}"'.format(name.rsplit('/', 1)[-1].split('.')[0])
+    return response
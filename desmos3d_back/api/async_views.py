@@ -0,0 +1,166 @@
+"""
+Async variants of the compute-heavy endpoints, for the ASGI deployment.
+
+``sample``, ``mesh`` and ``evaluate`` mirror the actions of the same names on
+the viewsets (without ``?stream=1``, which stays on the sync endpoints),
+parsing requests and shaping responses with the same helpers in ``views.py``.
+The ORM is used through Django's async API and evaluation jobs are awaited
+with ``arun_job``, so a slow evaluation holds neither a thread nor the event loop
+while other requests are served. When the client disconnects, the ASGI
+application in ``desmos3d/asgi.py`` cancels the request and the in-flight
+job's worker is killed.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAcceptable
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.views import exception_handler
+
+from .artifacts import aartifact_response, artifact_expression, wants_artifact
+from .cache import get_compiled_expression
+from .expressions import ExpressionError
+from .implicit import aimplicit_mesh
+from .models import Equation, GraphConfig
+from .renderers import ARRAY_RENDERERS
+from .sampling import surface_grid
+from .views import (
+    _batch_job, _compile_batch, _evaluate_config, _evaluated, _int_param, _mesh_bounds, _mesh_points,
+    _meshes, _meshes_artifact, _meshes_artifact_name, _sample_job, _samples, _samples_artifact_name,
+    _surface
+)
+from .workers import arun_job, error_data
+from . import jobs
+
+
+def _negotiate(request):
+    """Select the array renderer the request accepts, falling back to JSON"""
+    renderers = [renderer() for renderer in ARRAY_RENDERERS]
+    try:
+        request.accepted_renderer, request.accepted_media_type = (
+            DefaultContentNegotiation().select_renderer(request, renderers))
+    except NotAcceptable:
+        request.accepted_renderer, request.accepted_media_type = renderers[0], renderers[0].media_type
+
+
+def _render(request, data, status_code=status.HTTP_200_OK):
+    """Render ``data`` with the renderer selected by ``_negotiate``"""
+    renderer, media_type = request.accepted_renderer, request.accepted_media_type
+    content = renderer.render(data, media_type, {'request': request})
+    if renderer.charset:
+        media_type = f'{media_type}; charset={renderer.charset}'
+    return HttpResponse(content, status=status_code, content_type=media_type)
+
+
+def async_api_view(methods):
+    """
+    Turn ``view(request, user, ...)`` into an async Django view: wrap the
+    request for DRF parsing and content negotiation, authenticate it with the
+    configured DRF authentication classes, and render errors like DRF does.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            request = Request(
+                request,
+                parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES],
+                authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES],
+            )
+            _negotiate(request)
+            if request.method not in methods:
+                return _render(request, {'detail': f'Method "{request.method}" not allowed.'},
+                               status.HTTP_405_METHOD_NOT_ALLOWED)
+            try:
+                user = await sync_to_async(lambda: request.user)()
+                if not user.is_authenticated:
+                    return _render(request, {'detail': 'Authentication credentials were not provided.'},
+                                   status.HTTP_401_UNAUTHORIZED)
+                return await view(request, user, *args, **kwargs)
+            except APIException as exc:
+                response = exception_handler(exc, {})
+                return _render(request, response.data, response.status_code)
+            except ObjectDoesNotExist:
+                return _render(request, {'detail': 'Not found.'}, status.HTTP_404_NOT_FOUND)
+            except ExpressionError as exc:
+                return _render(request, error_data(exc),
+                               getattr(exc, 'status_code', status.HTTP_400_BAD_REQUEST))
+
+        # DRF checks CSRF itself for session-authenticated requests
+        wrapper.csrf_exempt = True
+        return wrapper
+    return decorator
+
+
+@async_api_view(['GET'])
+async def sample(request, user, pk):
+    """Async ``EquationViewSet.sample``"""
+    equation = await Equation.objects.select_related('graph_config').aget(pk=pk, user=user)
+    config = equation.graph_config or GraphConfig()
+    compiled = get_compiled_expression(equation.expression)
+    sampling, job, points = _sample_job(request, config, compiled)
+    if wants_artifact(request, points):
+        async def compute():
+            return {'expression': compiled.text, **_samples(config, sampling, *await arun_job(*job))}
+        return await aartifact_response(_samples_artifact_name(sampling, job), compute)
+    x, y = await arun_job(*job)
+
+    return _render(request, {
+        'id': equation.id,
+        'expression': equation.expression,
+        **_samples(config, sampling, x, y)
+    })
+
+
+@async_api_view(['GET'])
+async def mesh(request, user, pk):
+    """Async ``GraphConfigViewSet.mesh``"""
+    config = await GraphConfig.objects.aget(pk=pk, user=user)
+    bounds = _mesh_bounds(config)
+    x, y = surface_grid(config)
+    resolution = _int_param(request, 'resolution', settings.IMPLICIT_SURFACE_RESOLUTION)
+    equations = [equation async for equation in config.equations.filter(visible=True)]
+
+    async def surfaces(expressions):
+        results = []
+        for expression in expressions:
+            try:
+                compiled = get_compiled_expression(expression)
+                if compiled.kind == 'implicit':
+                    vertices, indices = await aimplicit_mesh(compiled, bounds, resolution)
+                else:
+                    vertices, indices = await arun_job(
+                        jobs.surface_mesh, compiled.text, x, y, config.zMin, config.zMax)
+            except ExpressionError as exc:
+                results.append(error_data(exc))
+                continue
+            results.append(_surface(vertices, indices))
+        return results
+
+    if wants_artifact(request, _mesh_points(equations, x, y, resolution)):
+        expressions = [artifact_expression(equation.expression) for equation in equations]
+
+        async def compute():
+            return _meshes_artifact(config, expressions, await surfaces(expressions))
+        return await aartifact_response(_meshes_artifact_name(config, expressions, resolution), compute)
+
+    return _render(request, _meshes(
+        config, equations, await surfaces([equation.expression for equation in equations])))
+
+
+@async_api_view(['POST'])
+async def evaluate(request, user, pk):
+    """Async ``GraphConfigViewSet.evaluate``"""
+    config = await GraphConfig.objects.aget(pk=pk, user=user)
+    _evaluate_config(request, config)
+    equations, compiled_list = _compile_batch(
+        [equation async for equation in config.equations.filter(visible=True)])
+    job = _batch_job(config, compiled_list)
+    values, operations = await arun_job(*job)
+
+    return _render(request, _evaluated(config, equations, compiled_list, job, values, operations))
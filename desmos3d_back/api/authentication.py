@@ -0,0 +1,78 @@
+"""
+Token authentication with the token lookup cached in Django's cache framework.
+
+``TokenAuthentication`` selects the Token and its User on every request.
+``CachedTokenAuthentication`` keeps the few user fields that permissions
+read (never the password hash) for TOKEN_CACHE['TIMEOUT'] seconds, and
+rebuilds the Token and User from them with the other fields deferred.
+Entries are dropped by the signal handlers in ``signals.py`` when the token
+is saved or deleted and when its user is saved (deactivated, renamed, made
+staff...) or deleted. Tokens are looked up
+on every request unless TOKEN_CACHE['ENABLED'].
+"""
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import router
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+# Loaded from the cache; other fields are read from the database on access
+USER_FIELDS = ('id', 'username', 'is_active', 'is_staff', 'is_superuser')
+
+
+def _cache():
+    return caches[settings.TOKEN_CACHE['ALIAS']]
+
+
+def token_cache_key(key):
+    # The key is a credential, keep only a digest of it in a shared cache
+    return 'auth-token:' + hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def user_tokens_key(user_id):
+    return f'auth-token-user:{user_id}'
+
+
+def forget_token(key):
+    _cache().delete(token_cache_key(key))
+
+
+def forget_user_tokens(user_id):
+    """Drop the cached token of a user, if any"""
+    cache = _cache()
+    cache_key = cache.get(user_tokens_key(user_id))
+    if cache_key is not None:
+        cache.delete_many([cache_key, user_tokens_key(user_id)])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Drop-in replacement for ``TokenAuthentication`` that caches valid tokens"""
+
+    def authenticate_credentials(self, key):
+        if not settings.TOKEN_CACHE['ENABLED']:
+            return super().authenticate_credentials(key)
+        cache = _cache()
+        cache_key = token_cache_key(key)
+        values = cache.get(cache_key)
+        if values is None:
+            user, token = super().authenticate_credentials(key)
+            values = {field: getattr(user, field) for field in USER_FIELDS}
+            timeout = settings.TOKEN_CACHE['TIMEOUT']
+            cache.set_many({cache_key: values, user_tokens_key(user.pk): cache_key}, timeout=timeout)
+            return (user, token)
+        return self._rebuild(key, values)
+
+    def _rebuild(self, key, values):
+        user_model = get_user_model()
+        # from_db() takes the values in the order of the model's fields
+        fields = [field.attname for field in user_model._meta.concrete_fields if field.attname in values]
+        user = user_model.from_db(router.db_for_read(user_model), fields, [values[field] for field in fields])
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed("User inactive or deleted.")
+        token_model = self.get_model()
+        token = token_model.from_db(router.db_for_read(token_model), ('key', 'user_id'), (key, user.pk))
+        token.user = user
+        return (user, token)
@@ -0,0 +1,128 @@
+"""
+In-process LRU caches shared by every view in the api app.
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .expressions import compile_expression, normalize
+
+
+def approximate_size(value):
+    """Rough size of a cached value in bytes"""
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(approximate_size(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(approximate_size(item) for item in value.values())
+    return sys.getsizeof(value)
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache bounded by entry count and approximate byte size.
+    """
+
+    def __init__(self, max_entries, max_bytes=None, sizeof=approximate_size):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, _ = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._data:
+                self.bytes -= self._data.pop(key)[1]
+            self._data[key] = (value, size)
+            self.bytes += size
+            while self._data and (
+                len(self._data) > self.max_entries
+                or (self.max_bytes is not None and self.bytes > self.max_bytes)
+            ):
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def get_or_create(self, key, factory):
+        """Return the cached value for ``key``, building it with ``factory()`` on a miss"""
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = factory()
+            self.set(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._data),
+            'bytes': self.bytes,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name):
+    """
+    Return the process-wide cache configured by ``settings.<name>``, a dict
+    with ``MAX_ENTRIES`` and optional ``MAX_BYTES``.
+    """
+    cache = _caches.get(name)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(name)
+            if cache is None:
+                options = getattr(settings, name)
+                cache = LRUCache(options['MAX_ENTRIES'], options.get('MAX_BYTES'))
+                _caches[name] = cache
+    return cache
+
+
+def all_cache_stats():
+    return {name: cache.stats() for name, cache in _caches.items()}
+
+
+def get_compiled_expression(text):
+    """Compile an expression, reusing the process-wide compiled-expression cache"""
+    key = normalize(text)
+    return get_cache('EXPRESSION_CACHE').get_or_create(key, lambda: compile_expression(key))
@@ -0,0 +1,78 @@
+"""
+Conditional GET for the model viewsets.
+
+Detail responses carry an ETag and a Last-Modified header derived from the
+row's ``updated_at``. List responses carry an ETag derived from the version
+of the user's collection, its row count and latest ``updated_at``, which is
+read with a single aggregate query. Equation changes touch their graph
+config (see ``signals.py``), so a config's ``updated_at`` also covers its
+nested equations.
+
+A request whose If-None-Match / If-Modified-Since matches gets a 304 before
+the rows are fetched and serialized.
+"""
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def _etag(request, *parts):
+    """Weak ETag of one version of a resource, in the representation the request negotiated"""
+    key = '|'.join(str(part) for part in (
+        request.user.pk, request.get_full_path(), getattr(request, 'accepted_media_type', ''), *parts))
+    return 'W/' + quote_etag(hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+
+def collection_version(queryset):
+    """(row count, latest updated_at) of a queryset, in one aggregate query"""
+    version = queryset.order_by().aggregate(count=Count('pk'), updated=Max('updated_at'))
+    return version['count'], version['updated']
+
+
+def conditional_response(request, respond, etag, last_modified=None):
+    """
+    Return a 304 if the request's validators match ``etag`` / ``last_modified``
+    (a datetime), otherwise the response built by ``respond()``, with the
+    validators set on it.
+    """
+    timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+    response = get_conditional_response(request._request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = respond()
+    if 200 <= response.status_code < 300 or response.status_code == 304:
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    Adds ETag / Last-Modified validators to ``list`` and ``retrieve`` of a
+    ModelViewSet whose model has an ``updated_at`` field.
+    """
+
+    def conditional_list(self, request, queryset, respond):
+        """Conditional response for a list of ``queryset``; ``respond()`` builds the full one"""
+        count, updated = collection_version(queryset)
+        return conditional_response(request, respond, _etag(request, 'list', count, updated))
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_list(
+            request, self.get_queryset(), lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        respond = lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            updated = (self.get_queryset().prefetch_related(None)
+                       .filter(**{self.lookup_field: kwargs[lookup_url_kwarg]})
+                       .values_list('updated_at', flat=True).first())
+        except (TypeError, ValueError, ValidationError):
+            updated = None
+        if updated is None:
+            return respond()  # the usual 404
+        return conditional_response(request, respond, _etag(request, 'detail', updated), updated)
@@ -0,0 +1,426 @@
+"""
+Safe parsing and vectorized evaluation of user expressions.
+
+Expressions use the same syntax as the mathjs-based frontend (``sin(x)``,
+``x^2 + 2x``, ``z = sin(x) * cos(y)``, ``x^2 + y^2 + z^2 = 1``). The text is
+tokenized and parsed into a small tuple-based AST; nothing is ever passed to
+``eval``. The AST is then compiled into a ``Program``: a flat list of NumPy
+operations in which structurally identical subtrees share one slot, so every
+subterm is computed once per evaluation over the whole grid.
+"""
+import hashlib
+import re
+
+import numpy as np
+
+
+class ExpressionError(ValueError):
+    """Raised when an expression cannot be parsed, compiled or evaluated"""
+
+
+MAX_DEPTH = 64
+
+VARIABLES = ('x', 'y', 'z')
+
+CONSTANTS = {
+    'pi': np.pi,
+    'PI': np.pi,
+    'e': np.e,
+    'E': np.e,
+    'tau': 2 * np.pi,
+}
+
+
+def _log(value, base=None):
+    if base is None:
+        return np.log(value)
+    return np.log(value) / np.log(base)
+
+
+def _reduce(ufunc):
+    def apply(*args):
+        result = args[0]
+        for arg in args[1:]:
+            result = ufunc(result, arg)
+        return result
+    return apply
+
+
+def _as_float(ufunc):
+    def apply(a, b):
+        return ufunc(a, b).astype(np.float64)
+    return apply
+
+
+# name -> (callable, min arity, max arity); None means variadic
+FUNCTIONS = {
+    'sin': (np.sin, 1, 1),
+    'cos': (np.cos, 1, 1),
+    'tan': (np.tan, 1, 1),
+    'asin': (np.arcsin, 1, 1),
+    'acos': (np.arccos, 1, 1),
+    'atan': (np.arctan, 1, 1),
+    'atan2': (np.arctan2, 2, 2),
+    'sinh': (np.sinh, 1, 1),
+    'cosh': (np.cosh, 1, 1),
+    'tanh': (np.tanh, 1, 1),
+    'asinh': (np.arcsinh, 1, 1),
+    'acosh': (np.arccosh, 1, 1),
+    'atanh': (np.arctanh, 1, 1),
+    'sec': (lambda a: 1 / np.cos(a), 1, 1),
+    'csc': (lambda a: 1 / np.sin(a), 1, 1),
+    'cot': (lambda a: 1 / np.tan(a), 1, 1),
+    'sqrt': (np.sqrt, 1, 1),
+    'cbrt': (np.cbrt, 1, 1),
+    'exp': (np.exp, 1, 1),
+    'log': (_log, 1, 2),
+    'ln': (np.log, 1, 1),
+    'log10': (np.log10, 1, 1),
+    'log2': (np.log2, 1, 1),
+    'abs': (np.abs, 1, 1),
+    'sign': (np.sign, 1, 1),
+    'floor': (np.floor, 1, 1),
+    'ceil': (np.ceil, 1, 1),
+    'round': (np.round, 1, 1),
+    'pow': (np.power, 2, 2),
+    'mod': (np.mod, 2, 2),
+    'min': (_reduce(np.minimum), 1, None),
+    'max': (_reduce(np.maximum), 1, None),
+}
+
+OPERATORS = {
+    '+': np.add,
+    '-': np.subtract,
+    '*': np.multiply,
+    '/': np.divide,
+    '%': np.mod,
+    '^': np.power,
+    '<': _as_float(np.less),
+    '<=': _as_float(np.less_equal),
+    '>': _as_float(np.greater),
+    '>=': _as_float(np.greater_equal),
+    '==': _as_float(np.equal),
+    '!=': _as_float(np.not_equal),
+}
+
+COMPARISONS = ('<', '<=', '>', '>=', '==', '!=')
+
+_TOKEN_RE = re.compile(r"""
+    \s*(?:
+        (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+      | (?P<name>[A-Za-z_][A-Za-z_0-9]*)
+      | (?P<op><=|>=|==|!=|\*\*|[-+*/^%(),=<>])
+    )""", re.VERBOSE)
+
+
+def tokenize(text):
+    """Split an expression into (kind, value) tokens"""
+    tokens = []
+    position = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN_RE.match(text, position)
+        if not match or match.end() == position:
+            raise ExpressionError(f"Unexpected character at position {position}: {text[position]!r}")
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'op' and value == '**':
+            value = '^'
+        tokens.append((kind, value))
+        position = match.end()
+    return tokens
+
+
+def normalize(text):
+    """
+    Canonical text of an expression: tokens joined by single spaces, so
+    spacing differences and ``**`` vs ``^`` map to the same string.
+    """
+    return ' '.join(value for _, value in tokenize(text))
+
+
+class _Parser:
+    """Recursive-descent parser producing tuple nodes:
+
+    ('num', value), ('var', name), ('neg', a), ('op', symbol, a, b),
+    ('call', name, args) and, at the root only, ('equation', lhs, rhs).
+    """
+
+    def __init__(self, text):
+        self.tokens = tokenize(text)
+        self.position = 0
+        self.depth = 0
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return (None, None)
+
+    def take(self, value=None):
+        token = self.peek()
+        if token[0] is None:
+            raise ExpressionError("Unexpected end of expression")
+        if value is not None and token[1] != value:
+            raise ExpressionError(f"Expected {value!r}, got {token[1]!r}")
+        self.position += 1
+        return token
+
+    def parse(self):
+        if not self.tokens:
+            raise ExpressionError("Expression is empty")
+        node = self.comparison()
+        if self.peek()[1] == '=':
+            self.take('=')
+            node = ('equation', node, self.comparison())
+        if self.peek()[0] is not None:
+            raise ExpressionError(f"Unexpected token {self.peek()[1]!r}")
+        return node
+
+    def enter(self):
+        self.depth += 1
+        if self.depth > MAX_DEPTH:
+            raise ExpressionError("Expression is nested too deeply")
+
+    def comparison(self):
+        node = self.additive()
+        if self.peek()[1] in COMPARISONS:
+            symbol = self.take()[1]
+            node = ('op', symbol, node, self.additive())
+        return node
+
+    def additive(self):
+        node = self.term()
+        while self.peek()[1] in ('+', '-'):
+            symbol = self.take()[1]
+            node = ('op', symbol, node, self.term())
+        return node
+
+    def term(self):
+        node = self.unary()
+        while True:
+            kind, value = self.peek()
+            if value in ('*', '/', '%'):
+                self.take()
+                node = ('op', value, node, self.unary())
+            elif kind in ('number', 'name') or value == '(':
+                # Implicit multiplication: 2x, 2 sin(x), (x + 1)(x - 1)
+                node = ('op', '*', node, self.power())
+            else:
+                return node
+
+    def unary(self):
+        value = self.peek()[1]
+        if value in ('-', '+'):
+            self.take()
+            self.enter()
+            operand = self.unary()
+            self.depth -= 1
+            return ('neg', operand) if value == '-' else operand
+        return self.power()
+
+    def power(self):
+        base = self.primary()
+        if self.peek()[1] == '^':
+            self.take()
+            self.enter()
+            exponent = self.unary()
+            self.depth -= 1
+            return ('op', '^', base, exponent)
+        return base
+
+    def primary(self):
+        kind, value = self.take()
+        if kind == 'number':
+            return ('num', float(value))
+        if kind == 'name':
+            if self.peek()[1] == '(':
+                return self.call(value)
+            if value in VARIABLES:
+                return ('var', value)
+            if value in CONSTANTS:
+                return ('num', float(CONSTANTS[value]))
+            raise ExpressionError(f"Unknown symbol {value!r}")
+        if value == '(':
+            self.enter()
+            node = self.comparison()
+            self.depth -= 1
+            self.take(')')
+            return node
+        raise ExpressionError(f"Unexpected token {value!r}")
+
+    def call(self, name):
+        if name not in FUNCTIONS:
+            raise ExpressionError(f"Unknown function {name!r}")
+        self.take('(')
+        self.enter()
+        args = [self.comparison()]
+        while self.peek()[1] == ',':
+            self.take(',')
+            args.append(self.comparison())
+        self.depth -= 1
+        self.take(')')
+        _, min_arity, max_arity = FUNCTIONS[name]
+        if len(args) < min_arity or (max_arity is not None and len(args) > max_arity):
+            raise ExpressionError(f"Wrong number of arguments for {name}()")
+        return ('call', name, tuple(args))
+
+
+def parse(text):
+    """Parse expression text into a tuple AST"""
+    return _Parser(text).parse()
+
+
+def variables_of(node):
+    """Return the set of variable names referenced by a node"""
+    tag = node[0]
+    if tag == 'var':
+        return {node[1]}
+    if tag == 'num':
+        return set()
+    if tag == 'neg':
+        return variables_of(node[1])
+    if tag == 'call':
+        return set().union(*(variables_of(arg) for arg in node[2]))
+    return variables_of(node[-2]) | variables_of(node[-1])
+
+
+class Program:
+    """
+    A flat list of NumPy operations built from one or more AST nodes.
+
+    Structurally identical subtrees map to the same slot, and subtrees made
+    only of constants are folded at compile time.
+    """
+
+    def __init__(self):
+        self.ops = []
+        self._slots = {}
+
+    def add(self, node):
+        """Compile a node and return the slot holding its value"""
+        slot = self._slots.get(node)
+        if slot is not None:
+            return slot
+        tag = node[0]
+        if tag == 'num':
+            op = ('const', np.float64(node[1]), ())
+        elif tag == 'var':
+            op = ('var', node[1], ())
+        else:
+            if tag == 'neg':
+                func, children = np.negative, (node[1],)
+            elif tag == 'op':
+                func, children = OPERATORS[node[1]], node[2:]
+            elif tag == 'call':
+                func, children = FUNCTIONS[node[1]][0], node[2]
+            else:
+                raise ExpressionError(f"Cannot compile node {tag!r}")
+            args = tuple(self.add(child) for child in children)
+            if all(self.ops[arg][0] == 'const' for arg in args):
+                with np.errstate(all='ignore'):
+                    value = func(*(self.ops[arg][1] for arg in args))
+                op = ('const', np.float64(value), ())
+            else:
+                op = ('apply', func, args)
+        self.ops.append(op)
+        slot = len(self.ops) - 1
+        self._slots[node] = slot
+        return slot
+
+    def run(self, env, outputs):
+        """
+        Evaluate the program and return the values of the ``outputs`` slots.
+        Intermediate arrays are released as soon as nothing else reads them.
+        """
+        if not outputs:
+            return []
+        last = max(outputs)
+        last_use = {}
+        for index in range(last + 1):
+            for arg in self.ops[index][2]:
+                last_use[arg] = index
+        keep = set(outputs)
+        values = [None] * (last + 1)
+        with np.errstate(all='ignore'):
+            for index in range(last + 1):
+                kind, payload, args = self.ops[index]
+                if kind == 'const':
+                    values[index] = payload
+                elif kind == 'var':
+                    if payload not in env:
+                        raise ExpressionError(f"No value for variable {payload!r}")
+                    values[index] = env[payload]
+                else:
+                    values[index] = payload(*(values[arg] for arg in args))
+                    for arg in args:
+                        if last_use.get(arg) == index and arg not in keep:
+                            values[arg] = None
+        return [values[slot] for slot in outputs]
+
+
+def as_grid(value, env):
+    """Broadcast a result to the shape of the input grid as float64"""
+    shape = np.broadcast_shapes(*(np.shape(array) for array in env.values()))
+    result = np.asarray(value, dtype=np.float64)
+    if result.shape != shape:
+        result = np.broadcast_to(result, shape).copy()
+    return result
+
+
+class CompiledExpression:
+    """
+    A parsed and compiled expression.
+
+    ``kind`` is ``'curve'`` for y = f(x), ``'surface'`` for z = f(x, y) and
+    ``'implicit'`` for F(x, y, z) = 0; ``node`` is the AST of f (or of F).
+    """
+
+    def __init__(self, text, node, kind):
+        self.text = text
+        self.node = node
+        self.kind = kind
+        self.variables = frozenset(variables_of(node))
+        self.program = Program()
+        self.root = self.program.add(node)
+
+    @property
+    def digest(self):
+        """Stable hash of the expression text, used in cache keys"""
+        return hashlib.sha1(self.text.encode('utf-8')).hexdigest()
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by this object, used by cache size limits"""
+        return 256 + 2 * len(self.text) + 128 * len(self.program.ops)
+
+    def evaluate(self, **env):
+        """Evaluate over NumPy arrays passed as keyword arguments (x=..., y=...)"""
+        value, = self.program.run(env, [self.root])
+        return as_grid(value, env)
+
+    def __repr__(self):
+        return f"<CompiledExpression {self.kind} {self.text!r}>"
+
+
+def _classify(node):
+    """Return (kind, body) for a parsed expression"""
+    if node[0] == 'equation':
+        lhs, rhs = node[1], node[2]
+        rhs_vars = variables_of(rhs)
+        if lhs == ('var', 'y') and rhs_vars <= {'x'}:
+            return 'curve', rhs
+        if lhs == ('var', 'z') and rhs_vars <= {'x', 'y'}:
+            return 'surface', rhs
+        return 'implicit', ('op', '-', lhs, rhs)
+    names = variables_of(node)
+    if names <= {'x'}:
+        return 'curve', node
+    if names <= {'x', 'y'}:
+        return 'surface', node
+    return 'implicit', node
+
+
+def compile_expression(text):
+    """Parse and compile expression text"""
+    kind, body = _classify(parse(text))
+    return CompiledExpression(text, body, kind)
@@ -0,0 +1,214 @@
+"""
+Triangle meshes of implicit surfaces F(x, y, z) = 0.
+
+The bounding box is divided into ``resolution`` cells per axis and processed
+in slabs of CHUNK_LAYERS cell layers along z. For each slab the scalar field
+is evaluated with one broadcast NumPy call, the cells whose corners change
+sign are selected, and each of them is polygonized by splitting the cube into
+six tetrahedra (marching tetrahedra, which needs no 256-case lookup table and
+vectorizes cleanly). Slabs are spread across the evaluation worker pool.
+
+Vertices sit on grid edges and are identified by a global edge key, so the
+slabs' partial meshes are stitched by key without duplicated seams.
+"""
+import numpy as np
+from django.conf import settings
+
+from .cache import get_cache, get_compiled_expression
+from .expressions import ExpressionError
+from .workers import map_jobs, amap_jobs
+
+CHUNK_LAYERS = 16
+
+# Cube corners as (di, dj, dk) offsets
+_CORNERS = np.array([
+    (0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0),
+    (0, 0, 1), (1, 0, 1), (1, 1, 1), (0, 1, 1),
+])
+# Six tetrahedra sharing the 0-6 diagonal; neighbouring cubes split shared faces the same way
+_TETRAHEDRA = np.array([
+    (0, 1, 2, 6), (0, 2, 3, 6), (0, 3, 7, 6),
+    (0, 7, 4, 6), (0, 4, 5, 6), (0, 5, 1, 6),
+])
+
+
+def _build_cases():
+    """
+    For each of the 16 inside/outside patterns of a tetrahedron, the triangles
+    to emit as triples of (inside vertex, outside vertex) edges.
+    """
+    cases = []
+    for case in range(16):
+        inside = [v for v in range(4) if case >> v & 1]
+        outside = [v for v in range(4) if not case >> v & 1]
+        if len(inside) == 1:
+            triangles = [[(inside[0], o) for o in outside]]
+        elif len(inside) == 3:
+            triangles = [[(i, outside[0]) for i in inside]]
+        elif len(inside) == 2:
+            (a, b), (c, d) = inside, outside
+            triangles = [[(a, c), (a, d), (b, d)], [(a, c), (b, d), (b, c)]]
+        else:
+            triangles = []
+        cases.append(triangles)
+    return cases
+
+
+_CASES = _build_cases()
+
+
+def polygonize_chunk(text, x, y, z, k_offset, shape):
+    """
+    Polygonize the cells between the z samples of one slab.
+
+    ``x``, ``y`` and ``z`` are the slab's axes, ``k_offset`` is the global index
+    of ``z[0]`` and ``shape`` the (nx, ny, nz) point counts of the whole grid.
+    Returns ``(keys, positions, triangles)``: the unique edge keys found in the
+    slab, their vertex positions, and triangles as (T, 3) arrays of edge keys.
+    This is an evaluation job, run through ``workers.map_jobs``.
+    """
+    compiled = get_compiled_expression(text)
+    field = compiled.evaluate(x=x[np.newaxis, np.newaxis, :],
+                              y=y[np.newaxis, :, np.newaxis],
+                              z=z[:, np.newaxis, np.newaxis])
+    nx, ny, nz = shape
+    finite = np.isfinite(field)
+    inside = field < 0
+
+    # Cells with a sign change and no NaN corners
+    def corners(grid):
+        return [grid[dk:grid.shape[0] - 1 + dk, dj:grid.shape[1] - 1 + dj, di:grid.shape[2] - 1 + di]
+                for di, dj, dk in _CORNERS]
+
+    corner_inside = corners(inside)
+    any_inside = np.logical_or.reduce(corner_inside)
+    all_inside = np.logical_and.reduce(corner_inside)
+    all_finite = np.logical_and.reduce(corners(finite))
+    ck, cj, ci = np.nonzero(any_inside & ~all_inside & all_finite)
+
+    empty = (np.empty(0, np.int64), np.empty((0, 3)), np.empty((0, 3), np.int64))
+    if not len(ci):
+        return empty
+
+    # Local (k, j, i) of the 8 corners of every active cell
+    local = np.stack([
+        np.stack([ck + dk, cj + dj, ci + di]) for di, dj, dk in _CORNERS
+    ], axis=2)
+    values = field[local[0], local[1], local[2]]
+    points = np.stack([x[local[2]], y[local[1]], z[local[0]]], axis=-1)
+    ids = ((local[0] + k_offset) * ny + local[1]) * nx + local[2]
+    total = nx * ny * nz
+
+    all_keys, all_positions, all_triangles = [], [], []
+    for tetrahedron in _TETRAHEDRA:
+        tet_values = values[:, tetrahedron]
+        tet_points = points[:, tetrahedron]
+        tet_ids = ids[:, tetrahedron]
+        case = ((tet_values < 0) * (1 << np.arange(4))).sum(axis=1)
+        for index, triangles in enumerate(_CASES):
+            if not triangles:
+                continue
+            cells = np.flatnonzero(case == index)
+            if not len(cells):
+                continue
+            for triangle in triangles:
+                keys = []
+                positions = []
+                midpoints = []
+                for a, b in triangle:
+                    ia, ib = tet_ids[cells, a], tet_ids[cells, b]
+                    # Order each edge by grid id so shared edges interpolate identically
+                    swap = ia > ib
+                    lo = np.where(swap, b, a)
+                    hi = np.where(swap, a, b)
+                    f_lo = tet_values[cells, lo]
+                    f_hi = tet_values[cells, hi]
+                    t = f_lo / (f_lo - f_hi)
+                    p_lo = tet_points[cells, lo]
+                    p_hi = tet_points[cells, hi]
+                    keys.append(np.minimum(ia, ib) * total + np.maximum(ia, ib))
+                    positions.append(p_lo + t[:, np.newaxis] * (p_hi - p_lo))
+                    midpoints.append((p_lo + p_hi) / 2)
+                keys = np.stack(keys, axis=1)
+                # Orient each triangle so its normal points from inside to outside. The triangle
+                # through the edge midpoints winds the same way, but unlike the interpolated one it
+                # never collapses when F is exactly 0 at a grid point.
+                normal = np.cross(midpoints[1] - midpoints[0], midpoints[2] - midpoints[0])
+                a, b = triangle[0]
+                outward = tet_points[cells, b] - tet_points[cells, a]
+                flip = (normal * outward).sum(axis=1) < 0
+                keys[flip] = keys[flip][:, [0, 2, 1]]
+                all_triangles.append(keys)
+                all_keys.extend(keys_column for keys_column in keys.T)
+                all_positions.extend(positions)
+
+    if not all_triangles:
+        return empty
+    keys = np.concatenate(all_keys)
+    positions = np.concatenate(all_positions)
+    keys, first = np.unique(keys, return_index=True)
+    return keys, positions[first], np.concatenate(all_triangles)
+
+
+def _validate(compiled, bounds, resolution):
+    if compiled.kind != 'implicit':
+        raise ExpressionError("Expression is not an implicit equation")
+    if not 2 <= resolution <= settings.IMPLICIT_SURFACE_MAX_RESOLUTION:
+        raise ExpressionError(
+            f"Resolution must be between 2 and {settings.IMPLICIT_SURFACE_MAX_RESOLUTION}")
+    x_min, x_max, y_min, y_max, z_min, z_max = bounds
+    if not np.isfinite(bounds).all():
+        raise ExpressionError("Bounds must be finite numbers")
+    if x_max <= x_min or y_max <= y_min or z_max <= z_min:
+        raise ExpressionError("Upper bound must be greater than lower bound")
+    return (compiled.digest, tuple(bounds), resolution)
+
+
+def implicit_mesh(compiled, bounds, resolution):
+    """
+    Mesh F(x, y, z) = 0 inside ``bounds`` (xMin, xMax, yMin, yMax, zMin, zMax)
+    with ``resolution`` cells per axis.
+
+    Returns float32 (N, 3) vertices and uint32 (M, 3) indices like
+    ``grid_mesh``. Results are cached per (expression, bounds, resolution).
+    """
+    key = _validate(compiled, bounds, resolution)
+    return get_cache('IMPLICIT_CACHE').get_or_create(
+        key, lambda: _merge(map_jobs(polygonize_chunk, _chunk_jobs(compiled.text, bounds, resolution))))
+
+
+async def aimplicit_mesh(compiled, bounds, resolution):
+    """``implicit_mesh`` for async views, awaiting the slabs with ``amap_jobs``"""
+    key = _validate(compiled, bounds, resolution)
+    cache = get_cache('IMPLICIT_CACHE')
+    mesh = cache.get(key)
+    if mesh is None:
+        mesh = _merge(await amap_jobs(polygonize_chunk, _chunk_jobs(compiled.text, bounds, resolution)))
+        cache.set(key, mesh)
+    return mesh
+
+
+def _chunk_jobs(text, bounds, resolution):
+    """Arguments of the polygonize_chunk job of every slab"""
+    x_min, x_max, y_min, y_max, z_min, z_max = bounds
+    x = np.linspace(x_min, x_max, resolution + 1)
+    y = np.linspace(y_min, y_max, resolution + 1)
+    z = np.linspace(z_min, z_max, resolution + 1)
+    shape = (len(x), len(y), len(z))
+
+    # Slabs overlap by one layer of points so every cell belongs to exactly one slab
+    return [
+        (text, x, y, z[start:start + CHUNK_LAYERS + 1], start, shape)
+        for start in range(0, resolution, CHUNK_LAYERS)
+    ]
+
+
+def _merge(results):
+    """Stitch the slabs' partial meshes into vertices and indices"""
+    keys = np.concatenate([result[0] for result in results])
+    positions = np.concatenate([result[1] for result in results])
+    triangles = np.concatenate([result[2] for result in results])
+    keys, first = np.unique(keys, return_index=True)
+    vertices = positions[first].astype(np.float32)
+    indices = np.searchsorted(keys, triangles).astype(np.uint32)
+    return vertices, indices
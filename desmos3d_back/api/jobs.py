@@ -0,0 +1,39 @@
+"""
+Evaluation jobs executed by ``workers.run_job``.
+
+Each job is a module-level function taking only picklable arguments
+(expression text rather than compiled objects), so it can run in an isolated
+worker process. Workers keep their own compiled-expression cache. The tile,
+implicit surface and thumbnail jobs live next to their helpers, in
+``tiles``, ``implicit`` and ``thumbnails``.
+"""
+from .cache import get_compiled_expression
+from .sampling import (
+    sample_curve, sample_curve_adaptive, evaluate_surface, evaluate_batch, grid_axis, grid_mesh
+)
+
+
+def sample_uniform(text, x_min, x_max, x_step):
+    return sample_curve(get_compiled_expression(text), x_min, x_max, x_step)
+
+
+def sample_adaptive(text, x_min, x_max, y_min, y_max, max_points):
+    return sample_curve_adaptive(get_compiled_expression(text), x_min, x_max, y_min, y_max, max_points)
+
+
+def curve_chunk(text, x_min, x_step, start, stop):
+    """Samples ``start`` to ``stop`` of a uniform grid"""
+    x = grid_axis(x_min, x_step, start, stop)
+    return x, get_compiled_expression(text).evaluate(x=x)
+
+
+def surface_mesh(text, x, y, z_min, z_max):
+    z = evaluate_surface(get_compiled_expression(text), x, y)
+    return grid_mesh(x, y, z, z_min, z_max)
+
+
+def batch(texts, x, y=None):
+    """Values of several expressions from one merged program, plus its size"""
+    values, program = evaluate_batch([get_compiled_expression(text) for text in texts], x, y)
+    return values, len(program.ops)
+
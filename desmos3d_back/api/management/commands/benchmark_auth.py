@@ -0,0 +1,44 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIRequestFactory
+
+from api.authentication import CachedTokenAuthentication
+
+
+class Command(BaseCommand):
+    help = ("Compare database round trips and time per request of TokenAuthentication "
+            "and CachedTokenAuthentication. Uses a throwaway user that is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        token_cache = {**settings.TOKEN_CACHE, 'ENABLED': True}
+        with override_settings(TOKEN_CACHE=token_cache), transaction.atomic():
+            user = User.objects.create_user(username='benchmark-auth', password=None)
+            token = Token.objects.create(user=user)
+            request = APIRequestFactory().get('/api/', HTTP_AUTHORIZATION=f'Token {token.key}')
+
+            results = {}
+            for authentication in (TokenAuthentication(), CachedTokenAuthentication()):
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    for _ in range(count):
+                        authenticated_user, _ = authentication.authenticate(request)
+                    elapsed = time.perf_counter() - start
+                assert authenticated_user.pk == user.pk
+                results[authentication.__class__.__name__] = (len(queries) / count, elapsed / count)
+            transaction.set_rollback(True)
+
+        for name, (queries, seconds) in results.items():
+            self.stdout.write(f"{name:28} {queries:6.3f} queries/request  {seconds * 1e6:8.1f} us/request")
+        saved = results['TokenAuthentication'][0] - results['CachedTokenAuthentication'][0]
+        self.stdout.write(f"Round trips saved per request: {saved:.3f}")
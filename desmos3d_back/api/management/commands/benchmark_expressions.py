@@ -0,0 +1,222 @@
+import json
+import math
+import operator
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from api.expressions import CompiledExpression, compile_expression, parse
+
+# Expression families: (expression, variables it is evaluated over)
+FAMILIES = {
+    'trig': ("sin(x) * cos(2x) + tan(x / 3)", 'x'),
+    'polynomial': ("3x^5 - 2x^4 + x^3 - 7x^2 + x - 1", 'x'),
+    'nested': ("sqrt(abs(sin(exp(cos(x) / 2)) + log(x^2 + 1)))", 'x'),
+    'piecewise': ("(x < 0) * x^2 + (x >= 0) * (x < 2) * sin(x) + (x >= 2) * 1/x", 'x'),
+    'implicit': ("x^2 + y^2 + z^2 - 25 + sin(x*y*z)", 'xyz'),
+}
+
+SIZES = [10 ** exponent for exponent in range(2, 8)]
+
+# The per-point baseline: like mathjs, compile the AST into nested closures
+# and call them once per point with a scope of plain floats.
+_PYTHON_OPERATORS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '%': math.fmod,
+    '^': math.pow,
+    '<': lambda a, b: float(a < b),
+    '<=': lambda a, b: float(a <= b),
+    '>': lambda a, b: float(a > b),
+    '>=': lambda a, b: float(a >= b),
+    '==': lambda a, b: float(a == b),
+    '!=': lambda a, b: float(a != b),
+}
+_PYTHON_FUNCTIONS = {
+    name: getattr(math, name)
+    for name in ('sin', 'cos', 'tan', 'asin', 'acos', 'atan', 'atan2', 'sinh', 'cosh', 'tanh',
+                 'asinh', 'acosh', 'atanh', 'sqrt', 'exp', 'log', 'log10', 'log2', 'floor', 'ceil')
+}
+_PYTHON_FUNCTIONS.update({'abs': abs, 'ln': math.log, 'pow': math.pow, 'mod': math.fmod,
+                          'min': min, 'max': max, 'round': round})
+
+
+def _python_compile(node):
+    """Closure evaluating ``node`` for one point, NaN where math raises"""
+    tag = node[0]
+    if tag == 'num':
+        value = float(node[1])
+        return lambda scope: value
+    if tag == 'var':
+        name = node[1]
+        return lambda scope: scope[name]
+    if tag == 'neg':
+        child = _python_compile(node[1])
+        return lambda scope: -child(scope)
+    if tag == 'op':
+        func, children = _PYTHON_OPERATORS[node[1]], [_python_compile(child) for child in node[2:]]
+    else:
+        func, children = _PYTHON_FUNCTIONS[node[1]], [_python_compile(child) for child in node[2]]
+
+    def apply(scope):
+        try:
+            return func(*[child(scope) for child in children])
+        except (ArithmeticError, ValueError):
+            return math.nan
+    return apply
+
+
+def _inputs(variables, size, rng):
+    """``size`` points spread over [-10, 10] in each variable"""
+    if variables == 'x':
+        return {'x': np.linspace(-10, 10, size)}
+    return {name: rng.uniform(-10, 10, size) for name in variables}
+
+
+def _best(func, repeat, min_seconds=0.2):
+    """Best seconds per call over ``repeat`` rounds of enough calls to last ``min_seconds``"""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds or loops >= 10 ** 6:
+            break
+        loops *= 10
+    best = elapsed / loops
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        best = min(best, (time.perf_counter() - start) / loops)
+    return best
+
+
+def _peak_bytes(func):
+    """Peak memory allocated while ``func`` runs, beyond what it started with"""
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - before
+
+
+def _array_allocations(compiled):
+    """Arrays allocated by one evaluation: one per operation that is not folded away, plus the result"""
+    return sum(1 for kind, _, _ in compiled.program.ops if kind == 'apply') + 1
+
+
+class Command(BaseCommand):
+    help = ("Benchmark parsing, compiling and evaluating expression families (trig, polynomial, nested, "
+            "piecewise, implicit) over grids of 10^2 to 10^7 points, against a pure-Python per-point "
+            "evaluator like the frontend's mathjs. Save runs with --output and diff them with --compare.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=lambda value: [int(float(size)) for size in value.split(',')],
+                            default=SIZES, help="Points per grid, e.g. 1e2,1e4,1e6")
+        parser.add_argument('--families', type=lambda value: value.split(','), default=list(FAMILIES))
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--baseline-max-points', type=int, default=100_000,
+                            help="Largest grid evaluated with the (slow) per-point baseline")
+        parser.add_argument('--output', help="Write the results to this JSON file")
+        parser.add_argument('--compare', help="Results of an earlier run to compare with")
+        parser.add_argument('--threshold', type=float, default=1.2,
+                            help="Report timings that got slower by more than this factor")
+
+    def handle(self, *args, **options):
+        unknown = set(options['families']) - set(FAMILIES)
+        if unknown:
+            raise CommandError(f"Unknown families {sorted(unknown)}, expected some of {', '.join(FAMILIES)}")
+
+        results = {
+            'python': sys.version.split()[0],
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor() or platform.machine(),
+            'families': {},
+        }
+        rng = np.random.default_rng(0)
+        for family in options['families']:
+            text, variables = FAMILIES[family]
+            results['families'][family] = self.benchmark(text, variables, rng, options)
+            self.report(family, results['families'][family])
+
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, indent=2, sort_keys=True)
+                file.write('\n')
+        if options['compare']:
+            with open(options['compare']) as file:
+                regressions = self.compare(json.load(file), results, options['threshold'])
+            if regressions:
+                raise CommandError(f"{regressions} timings regressed by more than {options['threshold']}x")
+
+    def benchmark(self, text, variables, rng, options):
+        compiled = compile_expression(text)
+        kind, body = compiled.kind, compiled.node
+        baseline = _python_compile(body)
+        result = {
+            'expression': text,
+            'kind': kind,
+            'operations': len(compiled.program.ops),
+            'parse_us': _best(lambda: parse(text), options['repeat']) * 1e6,
+            'compile_us': _best(lambda: CompiledExpression(text, body, kind), options['repeat']) * 1e6,
+            'sizes': {},
+        }
+        for size in options['sizes']:
+            env = _inputs(variables, size, rng)
+            seconds = _best(lambda: compiled.evaluate(**env), options['repeat'])
+            entry = {
+                'ns_per_point': seconds / size * 1e9,
+                'array_allocations': _array_allocations(compiled),
+                'peak_bytes': _peak_bytes(lambda: compiled.evaluate(**env)),
+            }
+            entry['peak_bytes_per_point'] = entry['peak_bytes'] / size
+            if size <= options['baseline_max_points']:
+                points = [dict(zip(env, values)) for values in zip(*(env[name].tolist() for name in env))]
+                baseline_seconds = _best(lambda: [baseline(scope) for scope in points], 1, min_seconds=0)
+                entry['baseline_ns_per_point'] = baseline_seconds / size * 1e9
+                entry['speedup'] = baseline_seconds / seconds
+            result['sizes'][str(size)] = entry
+        return result
+
+    def report(self, family, result):
+        self.stdout.write(f"{family}: {result['expression']}  ({result['operations']} operations, "
+                          f"parse {result['parse_us']:.1f} us, compile {result['compile_us']:.1f} us)")
+        for size, entry in result['sizes'].items():
+            line = (f"  {int(size):>10} points  {entry['ns_per_point']:9.2f} ns/point  "
+                    f"{entry['array_allocations']:3} arrays  peak {entry['peak_bytes'] / 2 ** 20:9.2f} MiB")
+            if 'baseline_ns_per_point' in entry:
+                line += f"  baseline {entry['baseline_ns_per_point']:9.1f} ns/point  x{entry['speedup']:.0f}"
+            self.stdout.write(line)
+
+    def compare(self, before, after, threshold):
+        """Print timings that differ by more than ``threshold``, returning how many got slower"""
+        regressions = 0
+        for family, result in after['families'].items():
+            previous = before.get('families', {}).get(family)
+            if previous is None:
+                continue
+            pairs = [(f'{family} parse', previous['parse_us'], result['parse_us']),
+                     (f'{family} compile', previous['compile_us'], result['compile_us'])]
+            pairs += [(f'{family} {size} points', previous['sizes'][size]['ns_per_point'], entry['ns_per_point'])
+                      for size, entry in result['sizes'].items() if size in previous['sizes']]
+            for label, old, new in pairs:
+                ratio = new / old if old else math.inf
+                if ratio > threshold:
+                    regressions += 1
+                    self.stdout.write(f"SLOWER  {label}: {old:.2f} -> {new:.2f} (x{ratio:.2f})")
+                elif ratio < 1 / threshold:
+                    self.stdout.write(f"faster  {label}: {old:.2f} -> {new:.2f} (x{ratio:.2f})")
+        return regressions
@@ -0,0 +1,309 @@
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from .seed_load_test import COLORS, EXPRESSIONS
+
+# Relative frequency of each operation in the default mix
+MIX = {
+    'login_user': 5,
+    'register_user': 2,
+    'save_current': 10,
+    'saved': 30,
+    'equation_list': 13,
+    'equation_create': 12,
+    'equation_retrieve': 12,
+    'equation_update': 10,
+    'equation_delete': 6,
+}
+
+
+def _parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name.strip() not in MIX:
+            raise CommandError(f"Unknown operation {name.strip()!r}, expected one of {', '.join(MIX)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Connection:
+    """Keep-alive HTTP/1.1 connection of one virtual user, reopened after errors"""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.connection = None
+
+    def request(self, method, path, body=None, token=None):
+        headers = {'Accept': 'application/json'}
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        if token:
+            headers['Authorization'] = f'Token {token}'
+        try:
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+            self.connection.request(method, path, body, headers)
+            response = self.connection.getresponse()
+            content = response.read()
+            if response.getheader('Connection', '').lower() == 'close':
+                self.close()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            return 0, None
+        try:
+            return response.status, json.loads(content) if content else None
+        except ValueError:
+            return response.status, None
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class VirtualUser:
+    """One client: logs in as a seeded user, then runs random operations from the mix"""
+
+    def __init__(self, connection, rng, username, password, prefix):
+        self.connection = connection
+        self.rng = rng
+        self.username = username
+        self.password = password
+        self.prefix = prefix
+        self.token = None
+        self.graph_ids = []
+        self.equation_ids = []
+
+    def next_operation(self, names, weights):
+        """Name of the next operation: a random one, or what it needs done first"""
+        if self.token is None:
+            return 'login_user'
+        name = self.rng.choices(names, weights)[0]
+        if name in ('equation_retrieve', 'equation_update', 'equation_delete') and not self.equation_ids:
+            name = 'equation_create'
+        if name == 'equation_create' and not self.graph_ids:
+            name = 'saved'
+        return name
+
+    def call(self, method, path, body=None):
+        return self.connection.request(method, path, body, self.token)
+
+    def login_user(self):
+        status, data = self.call('POST', '/api/auth/login/', {'username': self.username, 'password': self.password})
+        if status == 200:
+            self.token = data['token']
+        return status
+
+    def register_user(self):
+        username = f'{self.prefix}reg-{uuid.UUID(int=self.rng.getrandbits(128)).hex[:16]}'
+        status, _ = self.connection.request('POST', '/api/auth/register/', {
+            'username': username, 'email': f'{username}@example.com', 'password': self.password})
+        return status
+
+    def save_current(self):
+        status, data = self.call('POST', '/api/graph-configs/save_current/', {
+            'name': f'Load test {self.rng.randrange(10 ** 6)}',
+            'config': {'xMin': -5, 'xMax': 5, 'yMin': -5, 'yMax': 5},
+            'equations': [
+                {'expression': self.rng.choice(EXPRESSIONS), 'color': self.rng.choice(COLORS)}
+                for _ in range(self.rng.randint(1, 10))
+            ],
+        })
+        if status == 201:
+            self.graph_ids.append(data['id'])
+        return status
+
+    def saved(self):
+        status, data = self.call('GET', '/api/graph-configs/saved/')
+        if status == 200 and not self.graph_ids:
+            self.graph_ids = [config['id'] for config in data['results']]
+        return status
+
+    def equation_list(self):
+        status, _ = self.call('GET', '/api/equations/?fields=id,expression,color,visible')
+        return status
+
+    def equation_create(self):
+        status, data = self.call('POST', '/api/equations/', {
+            'expression': self.rng.choice(EXPRESSIONS),
+            'color': self.rng.choice(COLORS),
+            'graph_config': self.rng.choice(self.graph_ids),
+        })
+        if status == 201:
+            self.equation_ids.append(data['id'])
+        return status
+
+    def equation_retrieve(self):
+        status, _ = self.call('GET', f'/api/equations/{self.rng.choice(self.equation_ids)}/')
+        return status
+
+    def equation_update(self):
+        status, _ = self.call('PATCH', f'/api/equations/{self.rng.choice(self.equation_ids)}/',
+                              {'expression': self.rng.choice(EXPRESSIONS)})
+        return status
+
+    def equation_delete(self):
+        pk = self.equation_ids.pop(self.rng.randrange(len(self.equation_ids)))
+        status, _ = self.call('DELETE', f'/api/equations/{pk}/')
+        return status
+
+
+def _summary(samples, seconds):
+    """Throughput and latency percentiles of (status, latency) samples"""
+    latencies = np.array([latency for _, latency in samples], dtype=np.float64) * 1000
+    errors = sum(1 for status, _ in samples if not 200 <= status < 400)
+    if not len(latencies):
+        return {'requests': 0, 'errors': 0, 'throughput': 0.0}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'throughput': round(len(samples) / seconds, 2),
+        'mean_ms': round(float(latencies.mean()), 3),
+        'p50_ms': round(float(p50), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'max_ms': round(float(latencies.max()), 3),
+    }
+
+
+class Command(BaseCommand):
+    help = ("Drive the REST API with concurrent virtual users logged in as the users created by "
+            "seed_load_test, and print throughput and p50/p95/p99 latency per operation as JSON. "
+            "Starts a local server unless --url is given.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help="Base URL of a running server, e.g. http://127.0.0.1:8000")
+        parser.add_argument('--server', choices=['runserver', 'gunicorn'], default='runserver',
+                            help="Server to start when no --url is given")
+        parser.add_argument('--server-workers', type=int, default=os.cpu_count() or 1,
+                            help="gunicorn worker processes")
+        parser.add_argument('--concurrency', type=int, default=16, help="Virtual users")
+        parser.add_argument('--duration', type=float, default=30, help="Measured seconds")
+        parser.add_argument('--warmup', type=float, default=3, help="Seconds run before measuring")
+        parser.add_argument('--mix', type=_parse_mix, default=MIX,
+                            help="Operation weights, e.g. saved=3,equation_create=1")
+        parser.add_argument('--prefix', default='loadtest-')
+        parser.add_argument('--password', default='loadtest')
+        parser.add_argument('--seed', type=int, default=0, help="Random seed of the virtual users")
+        parser.add_argument('--output', help="Also write the JSON report to this file")
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        usernames = list(User.objects.filter(username__startswith=prefix)
+                         .exclude(username__startswith=f'{prefix}reg-')
+                         .order_by('pk').values_list('username', flat=True)[:100000])
+        if not usernames:
+            raise CommandError(f"No users named {prefix}*: run seed_load_test first")
+
+        server = None
+        if options['url']:
+            url = urlsplit(options['url'])
+            host, port = url.hostname, url.port or 80
+        else:
+            host, port = '127.0.0.1', _free_port()
+            server = self.start_server(options['server'], port, options['server_workers'])
+        try:
+            self.wait_for_server(host, port, server)
+            report = self.run(host, port, usernames, options)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait(10)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        self.stdout.write(output)
+
+    def start_server(self, kind, port, workers):
+        if kind == 'gunicorn':
+            command = [sys.executable, '-m', 'gunicorn', 'desmos3d.wsgi', '--bind', f'127.0.0.1:{port}',
+                       '--workers', str(workers), '--threads', '4', '--log-level', 'warning']
+        else:
+            command = [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{port}', '--noreload']
+        return subprocess.Popen(command, cwd=settings.BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def wait_for_server(self, host, port, server, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server is not None and server.poll() is not None:
+                raise CommandError(f"The server exited with status {server.returncode}")
+            status, _ = Connection(host, port).request('GET', '/api/auth/')
+            if status == 200:
+                return
+            time.sleep(0.2)
+        raise CommandError(f"No server answered on {host}:{port}")
+
+    def run(self, host, port, usernames, options):
+        names = list(options['mix'])
+        weights = [options['mix'][name] for name in names]
+        start = time.monotonic()
+        measure_from = start + options['warmup']
+        stop = measure_from + options['duration']
+        results = [[] for _ in range(options['concurrency'])]
+
+        def virtual_user(index):
+            rng = random.Random(options['seed'] * 100003 + index)
+            user = VirtualUser(Connection(host, port), rng, rng.choice(usernames), options['password'], options['prefix'])
+            while True:
+                now = time.monotonic()
+                if now >= stop:
+                    break
+                name = user.next_operation(names, weights)
+                began = time.perf_counter()
+                status = getattr(user, name)()
+                latency = time.perf_counter() - began
+                if now >= measure_from:
+                    results[index].append((name, status, latency))
+            user.connection.close()
+
+        threads = [threading.Thread(target=virtual_user, args=(index,)) for index in range(options['concurrency'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.monotonic() - measure_from
+
+        samples = [sample for thread_samples in results for sample in thread_samples]
+        return {
+            'config': {
+                'server': options['url'] or options['server'],
+                'concurrency': options['concurrency'],
+                'duration': options['duration'],
+                'warmup': options['warmup'],
+                'seed': options['seed'],
+                'seeded_users': len(usernames),
+                'mix': options['mix'],
+            },
+            'seconds': round(seconds, 3),
+            'overall': _summary([(status, latency) for _, status, latency in samples], seconds),
+            'operations': {
+                name: _summary([(status, latency) for sample_name, status, latency in samples
+                                if sample_name == name], seconds)
+                for name in names if any(sample[0] == name for sample in samples)
+            },
+        }
@@ -0,0 +1,77 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.models import Equation, GraphConfig
+
+EXPRESSIONS = [
+    "sin(x)", "cos(x)*x", "x^2 - 3", "exp(-x^2)", "sqrt(abs(x))", "tan(x)/4", "log(x^2 + 1)",
+    "sin(x)*cos(y)", "x^2 + y^2", "x*y", "exp(-(x^2 + y^2)/8)", "x^2 + y^2 + z^2 = 25",
+]
+COLORS = ["#3498db", "#e74c3c", "#2ecc71", "#9b59b6", "#f1c40f"]
+
+
+class Command(BaseCommand):
+    help = ("Seed users named <prefix><n> with saved graphs and equations for the load_test command. "
+            "Users that already exist are skipped; --delete removes every <prefix> user instead.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--graphs', type=int, default=50, help="Saved graphs per user")
+        parser.add_argument('--equations', type=int, default=10, help="Equations per graph")
+        parser.add_argument('--prefix', default='loadtest-')
+        parser.add_argument('--password', default='loadtest')
+        parser.add_argument('--batch-users', type=int, default=100,
+                            help="Users whose rows are inserted per transaction")
+        parser.add_argument('--delete', action='store_true')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if options['delete']:
+            deleted, _ = User.objects.filter(username__startswith=prefix).delete()
+            self.stdout.write(f"Deleted {deleted} rows")
+            return
+
+        start = time.perf_counter()
+        existing = set(User.objects.filter(username__startswith=prefix).values_list('username', flat=True))
+        usernames = [f'{prefix}{n}' for n in range(options['users']) if f'{prefix}{n}' not in existing]
+        # Hashing is deliberately slow: hash the shared password once
+        password = make_password(options['password'])
+        batch = options['batch_users']
+        for offset in range(0, len(usernames), batch):
+            with transaction.atomic():
+                self.seed_users(usernames[offset:offset + batch], password, options['graphs'], options['equations'])
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{min(offset + batch, len(usernames))}/{len(usernames)} users")
+
+        self.stdout.write(
+            f"Seeded {len(usernames)} users ({len(existing)} already there), "
+            f"{len(usernames) * options['graphs']} graphs and "
+            f"{len(usernames) * options['graphs'] * options['equations']} equations "
+            f"in {time.perf_counter() - start:.1f}s")
+
+    def seed_users(self, usernames, password, graphs, equations):
+        users = User.objects.bulk_create([
+            User(username=username, email=f'{username}@example.com', password=password)
+            for username in usernames
+        ])
+        configs = GraphConfig.objects.bulk_create([
+            GraphConfig(user=user, name=f"Graph {n}", is_saved=True, xStep=0.1 * (1 + n % 5))
+            for user in users
+            for n in range(graphs)
+        ], batch_size=settings.BULK_IMPORT_BATCH_SIZE)
+        Equation.objects.bulk_create([
+            Equation(
+                user_id=config.user_id,
+                graph_config=config,
+                position=position,
+                expression=EXPRESSIONS[(config.pk + position) % len(EXPRESSIONS)],
+                color=COLORS[position % len(COLORS)],
+            )
+            for config in configs
+            for position in range(equations)
+        ], batch_size=settings.BULK_IMPORT_BATCH_SIZE)
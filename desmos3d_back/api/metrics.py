@@ -0,0 +1,237 @@
+"""
+Per-view request metrics, exported in the Prometheus text format.
+
+``MetricsMiddleware`` times every request and labels it with the resolved
+view name. While a request runs, the SQL queries executed on any connection
+(through an execute wrapper installed on each connection) and the time spent
+in serializers using ``TimedSerializerMixin`` are added to it. The totals
+are kept per process, like the in-process caches: scrape every worker, or
+aggregate by ``instance``.
+
+With ``METRICS['SLOW_REQUEST_SECONDS']`` set, requests slower than that are
+logged with their slowest queries.
+"""
+import contextvars
+import heapq
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """What one request spent its time on"""
+
+    def __init__(self, keep_queries):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.serializer_seconds = 0.0
+        self.serializer_depth = 0
+        # (seconds, sql) of every query, only kept for the slow request log
+        self.query_log = [] if keep_queries else None
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.queries += 1
+        metrics.query_seconds += elapsed
+        if metrics.query_log is not None:
+            metrics.query_log.append((elapsed, sql))
+
+
+def _install(connection):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    _install(connection)
+
+
+@contextmanager
+def serializer_timer():
+    """Add the time spent inside to the current request, counting nested serializers once"""
+    metrics = _current.get()
+    if metrics is None or metrics.serializer_depth:
+        yield
+        return
+    metrics.serializer_depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serializer_seconds += time.perf_counter() - start
+        metrics.serializer_depth -= 1
+
+
+class TimedSerializerMixin:
+    """Count the time spent serializing instances towards the request's serializer time"""
+
+    def to_representation(self, instance):
+        with serializer_timer():
+            return super().to_representation(instance)
+
+
+class Registry:
+    """Process-wide per-view totals"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self.lock = threading.Lock()
+        self.views = {}
+        self.statuses = {}
+
+    def observe(self, view, method, status, seconds, metrics, response_bytes):
+        with self.lock:
+            totals = self.views.get(view)
+            if totals is None:
+                totals = self.views[view] = {
+                    'buckets': [0] * len(self.buckets), 'count': 0, 'seconds': 0.0,
+                    'queries': 0, 'query_seconds': 0.0, 'serializer_seconds': 0.0, 'bytes': 0,
+                }
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    totals['buckets'][index] += 1
+            totals['count'] += 1
+            totals['seconds'] += seconds
+            totals['queries'] += metrics.queries
+            totals['query_seconds'] += metrics.query_seconds
+            totals['serializer_seconds'] += metrics.serializer_seconds
+            totals['bytes'] += response_bytes
+            key = (view, method, status)
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+
+    def clear(self):
+        with self.lock:
+            self.views.clear()
+            self.statuses.clear()
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format"""
+        with self.lock:
+            views = {view: {**totals, 'buckets': list(totals['buckets'])} for view, totals in self.views.items()}
+            statuses = dict(self.statuses)
+
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        family('desmos3d_requests_total', 'counter', 'Requests by view, method and status code.')
+        for (view, method, status), count in sorted(statuses.items()):
+            lines.append(f'desmos3d_requests_total{{view="{_escape(view)}",method="{method}",'
+                         f'status="{status}"}} {count}')
+
+        family('desmos3d_request_duration_seconds', 'histogram', 'Request latency by view.')
+        for view, totals in sorted(views.items()):
+            label = f'view="{_escape(view)}"'
+            for bound, count in zip(self.buckets, totals['buckets']):
+                lines.append(f'desmos3d_request_duration_seconds_bucket{{{label},le="{bound:g}"}} {count}')
+            lines.append(f'desmos3d_request_duration_seconds_bucket{{{label},le="+Inf"}} {totals["count"]}')
+            lines.append(f'desmos3d_request_duration_seconds_sum{{{label}}} {totals["seconds"]:.6f}')
+            lines.append(f'desmos3d_request_duration_seconds_count{{{label}}} {totals["count"]}')
+
+        for name, key, help_text, number in [
+            ('desmos3d_sql_queries_total', 'queries', 'SQL queries executed by view.', '{}'),
+            ('desmos3d_sql_duration_seconds_total', 'query_seconds', 'Time spent in SQL queries by view.', '{:.6f}'),
+            ('desmos3d_serializer_duration_seconds_total', 'serializer_seconds',
+             'Time spent serializing instances by view.', '{:.6f}'),
+            ('desmos3d_response_bytes_total', 'bytes', 'Response body bytes by view, streams excluded.', '{}'),
+        ]:
+            family(name, 'counter', help_text)
+            for view, totals in sorted(views.items()):
+                lines.append(f'{name}{{view="{_escape(view)}"}} {number.format(totals[key])}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = Registry(settings.METRICS['BUCKETS'])
+    return _registry
+
+
+class MetricsMiddleware:
+    """Record the latency, SQL queries, serializer time and response size of every request"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Connections opened before this module was imported have no recorder yet
+        for connection in connections.all(initialized_only=True):
+            _install(connection)
+        metrics, token, start = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, metrics, start)
+        return response
+
+    async def __acall__(self, request):
+        metrics, token, start = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self.finish(request, response, metrics, start)
+        return response
+
+    def start(self):
+        metrics = RequestMetrics(keep_queries=bool(settings.METRICS['SLOW_REQUEST_SECONDS']))
+        return metrics, _current.set(metrics), time.perf_counter()
+
+    def finish(self, request, response, metrics, start):
+        seconds = time.perf_counter() - start
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else 'unresolved'
+        response_bytes = 0 if response.streaming else len(response.content)
+        get_registry().observe(view, request.method, response.status_code, seconds, metrics, response_bytes)
+
+        threshold = settings.METRICS['SLOW_REQUEST_SECONDS']
+        if threshold and seconds >= threshold:
+            slowest = heapq.nlargest(settings.METRICS['SLOW_REQUEST_QUERIES'], metrics.query_log,
+                                     key=lambda query: query[0])
+            logger.warning(
+                "Slow request %s %s (%s): %.3fs, %d queries in %.3fs, serializers %.3fs%s",
+                request.method, request.get_full_path(), view, seconds, metrics.queries,
+                metrics.query_seconds, metrics.serializer_seconds,
+                ''.join(f'\n  {elapsed * 1000:.1f}ms {sql}' for elapsed, sql in slowest),
+            )
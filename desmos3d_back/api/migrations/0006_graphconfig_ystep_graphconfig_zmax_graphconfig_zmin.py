@@ -0,0 +1,28 @@
+# Generated by Django 4.2.6 on 2026-10-18 08:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_remove_savedgraph_config_remove_savedgraph_user_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='graphconfig',
+            name='yStep',
+            field=models.FloatField(default=0.1),
+        ),
+        migrations.AddField(
+            model_name='graphconfig',
+            name='zMax',
+            field=models.FloatField(default=10),
+        ),
+        migrations.AddField(
+            model_name='graphconfig',
+            name='zMin',
+            field=models.FloatField(default=-10),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.6 on 2026-10-18 08:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_graphconfig_ystep_graphconfig_zmax_graphconfig_zmin'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='equation',
+            options={'ordering': ['position', 'id']},
+        ),
+        migrations.AddField(
+            model_name='equation',
+            name='position',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='graphconfig',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.6 on 2026-10-18 08:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_alter_equation_options_equation_position_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='graphconfig',
+            name='thumbnail',
+            field=models.FileField(blank=True, upload_to='thumbnails/'),
+        ),
+    ]
@@ -0,0 +1,91 @@
+import sqlite3
+
+from django.db import migrations, OperationalError
+
+# table -> indexed columns, see api/search.py
+INDEXED = {
+    'api_equation': ('expression',),
+    'api_graphconfig': ('name', 'description'),
+}
+
+# Triggers mirroring writes into the FTS5 tables, as of this migration
+# (api.search.sqlite_trigger_statements puts them back after table rebuilds)
+SQLITE_TRIGGERS = {
+    'api_equation': [
+        "CREATE TRIGGER IF NOT EXISTS api_equation_fts_insert AFTER INSERT ON api_equation BEGIN "
+        "INSERT INTO api_equation_fts(rowid, expression) VALUES (new.id, new.expression); END",
+        "CREATE TRIGGER IF NOT EXISTS api_equation_fts_delete AFTER DELETE ON api_equation BEGIN "
+        "INSERT INTO api_equation_fts(api_equation_fts, rowid, expression) "
+        "VALUES ('delete', old.id, old.expression); END",
+        "CREATE TRIGGER IF NOT EXISTS api_equation_fts_update AFTER UPDATE OF expression ON api_equation BEGIN "
+        "INSERT INTO api_equation_fts(api_equation_fts, rowid, expression) "
+        "VALUES ('delete', old.id, old.expression); "
+        "INSERT INTO api_equation_fts(rowid, expression) VALUES (new.id, new.expression); END",
+    ],
+    'api_graphconfig': [
+        "CREATE TRIGGER IF NOT EXISTS api_graphconfig_fts_insert AFTER INSERT ON api_graphconfig BEGIN "
+        "INSERT INTO api_graphconfig_fts(rowid, name, description) "
+        "VALUES (new.id, new.name, new.description); END",
+        "CREATE TRIGGER IF NOT EXISTS api_graphconfig_fts_delete AFTER DELETE ON api_graphconfig BEGIN "
+        "INSERT INTO api_graphconfig_fts(api_graphconfig_fts, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); END",
+        "CREATE TRIGGER IF NOT EXISTS api_graphconfig_fts_update AFTER UPDATE OF name, description "
+        "ON api_graphconfig BEGIN "
+        "INSERT INTO api_graphconfig_fts(api_graphconfig_fts, rowid, name, description) "
+        "VALUES ('delete', old.id, old.name, old.description); "
+        "INSERT INTO api_graphconfig_fts(rowid, name, description) "
+        "VALUES (new.id, new.name, new.description); END",
+    ],
+}
+
+
+def create_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        # The trigram tokenizer needs SQLite 3.34; without it search falls back to icontains
+        if sqlite3.sqlite_version_info < (3, 34):
+            return
+        try:
+            with schema_editor.connection.cursor() as cursor:
+                cursor.execute("CREATE VIRTUAL TABLE api_fts_probe USING fts5(value, tokenize='trigram')")
+                cursor.execute("DROP TABLE api_fts_probe")
+        except OperationalError:
+            return  # SQLite built without FTS5
+        for table, columns in INDEXED.items():
+            fts = f'{table}_fts'
+            schema_editor.execute(f"CREATE VIRTUAL TABLE {fts} USING fts5({', '.join(columns)}, "
+                                  f"content='{table}', content_rowid='id', tokenize='trigram')")
+            for statement in SQLITE_TRIGGERS[table]:
+                schema_editor.execute(statement)
+            schema_editor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    elif vendor == 'postgresql':
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for table, columns in INDEXED.items():
+            for column in columns:
+                # The expression Django's icontains compiles to
+                schema_editor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {table}_{column}_trgm ON {table} '
+                    f'USING gin (UPPER(("{column}")::text) gin_trgm_ops)')
+
+
+def drop_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for table, columns in INDEXED.items():
+        if vendor == 'sqlite':
+            for trigger in ('insert', 'delete', 'update'):
+                schema_editor.execute(f"DROP TRIGGER IF EXISTS {table}_fts_{trigger}")
+            schema_editor.execute(f"DROP TABLE IF EXISTS {table}_fts")
+        elif vendor == 'postgresql':
+            for column in columns:
+                schema_editor.execute(f"DROP INDEX IF EXISTS {table}_{column}_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_graphconfig_thumbnail'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.6 on 2026-10-18 08:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0009_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SharedGraph',
+            fields=[
+                ('key', models.CharField(editable=False, max_length=32, primary_key=True, serialize=False)),
+                ('content', models.TextField()),
+                ('etag', models.CharField(max_length=66)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('graph_config', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shares', to='api.graphconfig')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shared_graphs', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.6 on 2026-10-18 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_sharedgraph'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='equation',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='api_equatio_user_id_fe1e7e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='graphconfig',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='api_graphco_user_id_bddb91_idx'),
+        ),
+    ]
@@ -9,14 +9,25 @@ class GraphConfig(models.Model):
     xMax = models.FloatField(default=10)
     yMin = models.FloatField(default=-10)
     yMax = models.FloatField(default=10)
+    zMin = models.FloatField(default=-10)
+    zMax = models.FloatField(default=10)
     xStep = models.FloatField(default=0.1)
+    yStep = models.FloatField(default=0.1)
     gridVisible = models.BooleanField(default=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='graph_configs', null=True)
     description = models.TextField(blank=True, null=True)
     is_saved = models.BooleanField(default=False)
+    # Incremented by every change, for optimistic concurrency in the patch endpoint
+    version = models.PositiveIntegerField(default=0)
+    # Content-addressed preview image, see api/thumbnails.py
+    thumbnail = models.FileField(upload_to='thumbnails/', blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # A user's rows in the order of CreatedCursorPagination
+        indexes = [models.Index(fields=['user', 'created_at', 'id'])]
+
     def __str__(self):
         return self.name
 
@@ -26,8 +37,28 @@ class Equation(models.Model):
     visible = models.BooleanField(default=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='equations', null=True)
     graph_config = models.ForeignKey(GraphConfig, on_delete=models.CASCADE, related_name='equations', null=True)
+    position = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        ordering = ['position', 'id']
+        # A user's rows in the order of CreatedCursorPagination
+        indexes = [models.Index(fields=['user', 'created_at', 'id'])]
+    
+    def __str__(self):
+        return self.expression
+
+class SharedGraph(models.Model):
+    # Random, unguessable id of the public link
+    key = models.CharField(primary_key=True, max_length=32, editable=False)
+    # Deleting the graph revokes its links
+    graph_config = models.ForeignKey(GraphConfig, on_delete=models.CASCADE, related_name='shares')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='shared_graphs')
+    # The response body, rendered once when the graph is published; see api/sharing.py
+    content = models.TextField()
+    etag = models.CharField(max_length=66)
+    created_at = models.DateTimeField(auto_now_add=True)
+
     def __str__(self):
-        return self.expression
\ No newline at end of file
+        return self.key
@@ -0,0 +1,14 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class CreatedCursorPagination(CursorPagination):
+    """
+    Cursor pagination in creation order. Pages are located by an opaque
+    cursor rather than an offset, so fetching any page costs the same no
+    matter how many rows a user has. ``?page_size=`` can override PAGE_SIZE
+    up to MAX_PAGE_SIZE.
+    """
+    ordering = ('created_at', 'id')
+    page_size_query_param = 'page_size'
+    max_page_size = settings.MAX_PAGE_SIZE
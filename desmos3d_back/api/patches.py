@@ -0,0 +1,136 @@
+"""
+Batched edits of a graph config and its equations (the autosave endpoint).
+
+Operations validated by ``GraphPatchOperationSerializer`` are applied in
+order to in-memory rows, then written with at most one DELETE, one bulk
+UPDATE, one bulk INSERT and one config UPDATE. Optimistic concurrency comes
+from ``GraphConfig.version``: the patch only applies if the client's version
+is still current, and every change increments it.
+"""
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .models import Equation, GraphConfig
+from .response_cache import invalidate, collection_version_key, object_version_key
+
+
+class VersionConflict(Exception):
+    """The graph changed since the client's version"""
+
+    def __init__(self, version):
+        super().__init__(f"Graph is at version {version}")
+        self.version = version
+
+
+def _equation_ids(operations):
+    ids = set()
+    for operation in operations:
+        if 'id' in operation:
+            ids.add(operation['id'])
+        ids.update(operation.get('order', ()))
+    return ids
+
+
+def apply_patch(config, version, operations):
+    """
+    Apply ``operations`` to ``config`` if it is still at ``version``.
+
+    Returns a dict with the new ``version``, the changed ``config`` fields,
+    the added and changed ``equations`` (model instances), the ``created``
+    ids of added equations by their ``ref`` and the ``removed`` ids. Raises
+    VersionConflict, or ValidationError for operations on equations that do
+    not belong to the config and for a reorder that does not list all of its
+    equations once; nothing is written in either case.
+    """
+    with transaction.atomic():
+        now = timezone.now()
+        if not GraphConfig.objects.filter(pk=config.pk, version=version).update(
+                version=F('version') + 1, updated_at=now):
+            raise VersionConflict(GraphConfig.objects.values_list('version', flat=True).get(pk=config.pk))
+
+        equations = Equation.objects.filter(graph_config=config)
+        if any(operation['op'] == 'reorder' for operation in operations):
+            # A reorder has to list them all
+            equations = equations.in_bulk()
+        else:
+            equations = equations.in_bulk(_equation_ids(operations))
+        next_position = None
+        config_fields = set()
+        equation_fields = set()
+        changed = {}
+        added = []
+        removed = set()
+        for index, operation in enumerate(operations):
+            op = operation['op']
+            pk = operation.get('id')
+            if pk is not None and (pk not in equations or pk in removed):
+                raise ValidationError({'operations': {index: f"Equation {pk} is not part of this graph"}})
+
+            if op == 'add':
+                if next_position is None:
+                    next_position = (Equation.objects.filter(graph_config=config)
+                                     .aggregate(last=Max('position'))['last'])
+                    next_position = 0 if next_position is None else next_position + 1
+                equation = Equation(user_id=config.user_id, graph_config=config, position=next_position,
+                                    **operation['fields'])
+                next_position += 1
+                added.append((operation.get('ref'), equation))
+            elif op == 'update' and pk is None:
+                for name, value in operation['fields'].items():
+                    setattr(config, name, value)
+                config_fields.update(operation['fields'])
+            elif op == 'update':
+                equation = equations[pk]
+                for name, value in operation['fields'].items():
+                    setattr(equation, name, value)
+                equation_fields.update(operation['fields'])
+                changed[pk] = equation
+            elif op == 'remove':
+                removed.add(pk)
+                changed.pop(pk, None)
+            elif op == 'reorder':
+                missing = [pk for pk in operation['order'] if pk not in equations or pk in removed]
+                if missing:
+                    raise ValidationError({'operations': {index: f"Equations {missing} are not part of this graph"}})
+                order = operation['order']
+                if len(set(order)) != len(order) or len(order) != len(equations) - len(removed):
+                    raise ValidationError({'operations': {index: "Order must list every equation of this graph once"}})
+                for position, pk in enumerate(operation['order']):
+                    equations[pk].position = position
+                    changed[pk] = equations[pk]
+                equation_fields.add('position')
+
+        if removed:
+            # Without the per-row post_delete signals, which would bump the version
+            # and invalidate the graph once per equation; done once below instead
+            deleted = Equation.objects.filter(pk__in=removed)
+            deleted._raw_delete(deleted.db)
+        if changed:
+            for equation in changed.values():
+                equation.updated_at = now
+            Equation.objects.bulk_update(changed.values(), [*equation_fields, 'updated_at'])
+        if added:
+            Equation.objects.bulk_create([equation for _, equation in added])
+        if config_fields:
+            config.updated_at = now
+            GraphConfig.objects.filter(pk=config.pk).update(
+                updated_at=now, **{name: getattr(config, name) for name in config_fields})
+
+        config.version = version + 1
+        # Bulk writes send no signals
+        invalidate(
+            collection_version_key(config.user_id, 'graph-configs'),
+            collection_version_key(config.user_id, 'equations'),
+            object_version_key('graph-configs', config.pk),
+            *(object_version_key('equations', pk) for pk in [*changed, *removed]),
+        )
+
+    return {
+        'version': config.version,
+        'config': {name: getattr(config, name) for name in sorted(config_fields)},
+        'equations': [*changed.values(), *(equation for _, equation in added)],
+        'created': {ref: equation.id for ref, equation in added if ref is not None},
+        'removed': sorted(removed),
+    }
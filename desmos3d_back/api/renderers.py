@@ -0,0 +1,116 @@
+"""
+Renderers for responses that carry NumPy arrays (samples and meshes).
+
+Views put arrays straight into ``Response.data``; the renderer chosen from the
+``Accept`` header decides how they go over the wire:
+
+- ``application/json`` (default): flat lists, NaN and infinities become null
+- ``application/octet-stream``: little-endian Float32/Uint32 buffers after a
+  small JSON header, see ``Float32BufferRenderer``
+- ``application/msgpack``: the same structure as MessagePack
+"""
+import json
+import struct
+
+import msgpack
+import numpy as np
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .sampling import finite_or_none
+
+
+def _wire_array(array):
+    """Cast an array to the little-endian dtype used on the wire"""
+    array = np.asarray(array)
+    if np.issubdtype(array.dtype, np.integer):
+        return np.ascontiguousarray(array, dtype='<u4')
+    return np.ascontiguousarray(array, dtype='<f4')
+
+
+def replace_arrays(data, replace):
+    """Copy nested dicts and lists, passing every ndarray through ``replace``"""
+    if isinstance(data, np.ndarray):
+        return replace(data)
+    if isinstance(data, dict):
+        return {key: replace_arrays(value, replace) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [replace_arrays(value, replace) for value in data]
+    return data
+
+
+class ArrayJSONRenderer(JSONRenderer):
+    """JSON renderer that writes arrays as flat lists with null for non-finite values"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        data = replace_arrays(data, lambda array: finite_or_none(array.ravel()))
+        return super().render(data, accepted_media_type, renderer_context)
+
+
+class Float32BufferRenderer(BaseRenderer):
+    """
+    Binary layout, all little-endian::
+
+        b'D3DB'                magic
+        uint32                 header length in bytes
+        header                 UTF-8 JSON, space padded to a multiple of 4
+        buffers                raw array data, each padded to a multiple of 4
+
+    The header is the response data with every array replaced by
+    ``{"dtype": "float32" | "uint32", "shape": [...], "offset": n,
+    "byteLength": n}``, offsets being relative to the first buffer, so a
+    client can wrap each one in a typed array view without copying.
+    """
+    media_type = 'application/octet-stream'
+    format = 'bin'
+    charset = None
+    render_style = 'binary'
+
+    MAGIC = b'D3DB'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        buffers = []
+        offset = 0
+
+        def describe(array):
+            nonlocal offset
+            wire = _wire_array(array)
+            raw = wire.tobytes()
+            descriptor = {
+                'dtype': 'uint32' if wire.dtype.kind == 'u' else 'float32',
+                'shape': list(wire.shape),
+                'offset': offset,
+                'byteLength': len(raw),
+            }
+            buffers.append(raw)
+            offset += len(raw)
+            return descriptor
+
+        header = json.dumps(replace_arrays(data, describe), allow_nan=False,
+                            separators=(',', ':')).encode('utf-8')
+        header += b' ' * (-len(header) % 4)
+        return b''.join([self.MAGIC, struct.pack('<I', len(header)), header] + buffers)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    MessagePack variant of ``Float32BufferRenderer``: arrays become maps of
+    ``dtype``, ``shape`` and ``data`` (the little-endian bytes).
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        def describe(array):
+            wire = _wire_array(array)
+            return {
+                'dtype': 'uint32' if wire.dtype.kind == 'u' else 'float32',
+                'shape': list(wire.shape),
+                'data': wire.tobytes(),
+            }
+
+        return msgpack.packb(replace_arrays(data, describe), use_bin_type=True)
+
+
+ARRAY_RENDERERS = [ArrayJSONRenderer, Float32BufferRenderer, MessagePackRenderer]
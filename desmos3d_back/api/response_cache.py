@@ -0,0 +1,125 @@
+"""
+Per-user cache of serialized read responses, in Django's cache framework.
+
+Entries hold the response data and its validators, keyed by (user, request
+path, negotiated media type, version). Versions are opaque tokens stored in the cache as well: one
+per user and collection (``graph-configs``, ``equations``) for list
+endpoints, one per object for detail endpoints. Signal handlers in
+``signals.py`` replace the tokens of everything a write affects, which
+orphans the stale entries instead of searching for them; they expire after
+RESPONSE_CACHE['TIMEOUT'].
+
+A hit is answered without touching the database, with a 304 if the
+request's If-None-Match / If-Modified-Since still matches. Nothing is cached
+unless RESPONSE_CACHE['ENABLED'], which needs a cache shared by all the
+processes for invalidations to reach them.
+"""
+import datetime
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.http import parse_http_date_safe
+from rest_framework.response import Response
+
+from .conditional import conditional_response
+
+
+def _cache():
+    return caches[settings.RESPONSE_CACHE['ALIAS']]
+
+
+def collection_version_key(user_id, collection):
+    return f'response-version:{user_id}:{collection}'
+
+
+def object_version_key(collection, pk):
+    return f'response-version:{collection}:{pk}'
+
+
+def _replace_versions(version_keys):
+    token = uuid.uuid4().hex
+    _cache().set_many({key: token for key in version_keys}, timeout=None)
+
+
+def invalidate(*version_keys):
+    """
+    Give the version keys new tokens, so responses cached under the old ones
+    are never read again. This is done again when the current transaction
+    commits, in case a concurrent read cached the uncommitted state's
+    predecessor in between.
+    """
+    if version_keys and settings.RESPONSE_CACHE['ENABLED']:
+        _replace_versions(version_keys)
+        transaction.on_commit(lambda: _replace_versions(version_keys))
+
+
+def invalidate_collections(user_id, *collections):
+    invalidate(*(collection_version_key(user_id, collection) for collection in collections))
+
+
+def _versions(cache, version_keys):
+    versions = cache.get_many(version_keys)
+    missing = {key: uuid.uuid4().hex for key in version_keys if key not in versions}
+    for key, token in missing.items():
+        # add() keeps a token set concurrently by another request or an invalidation
+        if not cache.add(key, token, timeout=None):
+            token = cache.get(key, token)
+        versions[key] = token
+    return [versions[key] for key in version_keys]
+
+
+def cached_response(request, version_keys, respond):
+    """
+    Serve a read from the response cache, or build it with ``respond()`` and
+    store it if it is a 200. ``version_keys`` are the versions the response
+    depends on.
+    """
+    if not settings.RESPONSE_CACHE['ENABLED'] or not request.user.is_authenticated:
+        return respond()
+    cache = _cache()
+    versions = _versions(cache, version_keys)
+    # Each representation has its own body and ETag
+    media_type = request.accepted_renderer.media_type
+    key = 'response:{}:{}'.format(request.user.pk, hashlib.sha1('|'.join(
+        [request.get_full_path(), media_type, *versions]).encode('utf-8')).hexdigest())
+
+    entry = cache.get(key)
+    if entry is not None:
+        data, etag, last_modified = entry
+        return conditional_response(request, lambda: Response(data), etag, last_modified)
+
+    response = respond()
+    if response.status_code == 200 and isinstance(response, Response):
+        timestamp = parse_http_date_safe(response.get('Last-Modified', ''))
+        last_modified = (datetime.datetime.fromtimestamp(timestamp, datetime.timezone.utc)
+                         if timestamp is not None else None)
+        cache.set(key, (response.data, response.get('ETag'), last_modified),
+                  timeout=settings.RESPONSE_CACHE['TIMEOUT'])
+    return response
+
+
+class CachedReadMixin:
+    """
+    Serves ``list`` and ``retrieve`` of a ModelViewSet from the response
+    cache. ``cache_collection`` names the collection of the viewset's model.
+    """
+    cache_collection = None
+
+    def cached_list(self, request, respond):
+        return cached_response(
+            request, [collection_version_key(request.user.pk, self.cache_collection)], respond)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_list(request, lambda: super(CachedReadMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        respond = lambda: super(CachedReadMixin, self).retrieve(request, *args, **kwargs)
+        try:
+            pk = int(kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except ValueError:
+            return respond()
+        return cached_response(
+            request, [object_version_key(self.cache_collection, pk)], respond)
@@ -0,0 +1,259 @@
+"""
+Grid construction and sampling of compiled expressions over GraphConfig bounds.
+"""
+import numpy as np
+from django.conf import settings
+
+from .expressions import ExpressionError, Program
+
+
+def grid_count(start, stop, step, max_points=None):
+    """Number of points in ``uniform_grid(start, stop, step)``, validating the bounds"""
+    if max_points is None:
+        max_points = settings.EXPRESSION_MAX_POINTS
+    if not np.isfinite([start, stop, step]).all():
+        raise ExpressionError("Bounds must be finite numbers")
+    if stop <= start:
+        raise ExpressionError("Upper bound must be greater than lower bound")
+    if step <= 0:
+        raise ExpressionError("Step must be positive")
+    count = int(np.floor((stop - start) / step + 1e-9)) + 1
+    if count > max_points:
+        raise ExpressionError(f"Grid has {count} points, the limit is {max_points}")
+    return count
+
+
+def uniform_grid(start, stop, step, max_points=None):
+    """
+    Return ``start, start + step, ...`` up to and including ``stop``.
+
+    The grid is built from integer multiples of ``step`` so it does not
+    accumulate floating point error the way repeated addition does.
+    """
+    count = grid_count(start, stop, step, max_points)
+    return grid_axis(start, step, 0, count)
+
+
+def grid_axis(start, step, begin, end):
+    """Points ``begin`` to ``end`` of the uniform grid from ``start`` at ``step``"""
+    return start + np.arange(begin, end, dtype=np.float64) * step
+
+
+def sample_curve(compiled, x_min, x_max, x_step):
+    """Evaluate y = f(x) over a uniform grid in a single vectorized pass"""
+    if compiled.kind != 'curve':
+        raise ExpressionError("Expression is not a function of x")
+    x = uniform_grid(x_min, x_max, x_step)
+    return x, compiled.evaluate(x=x)
+
+
+# Adaptive sampling tolerances, in viewport-normalized units (the viewport is 1x1)
+ADAPTIVE_INITIAL_POINTS = 65
+ADAPTIVE_MAX_ANGLE = 0.05
+ADAPTIVE_MAX_SEGMENT = 0.02
+
+
+def sample_curve_adaptive(compiled, x_min, x_max, y_min, y_max, max_points):
+    """
+    Evaluate y = f(x) by recursive subdivision instead of a fixed step.
+
+    Starting from a coarse uniform grid, every round bisects the segments that
+    bend by more than ADAPTIVE_MAX_ANGLE, are longer than ADAPTIVE_MAX_SEGMENT
+    on screen, or cross the edge of the function's domain. All midpoints of a
+    round are evaluated in one vectorized call, and the highest scoring
+    segments win when the point budget runs out. Segments that still jump once
+    they reach the minimum width are treated as discontinuities and get a NaN
+    break inserted, so the client does not join the two sides.
+    """
+    if compiled.kind != 'curve':
+        raise ExpressionError("Expression is not a function of x")
+    if not np.isfinite([x_min, x_max, y_min, y_max]).all():
+        raise ExpressionError("Bounds must be finite numbers")
+    if x_max <= x_min or y_max <= y_min:
+        raise ExpressionError("Upper bound must be greater than lower bound")
+    max_points = min(max_points, settings.EXPRESSION_MAX_POINTS)
+    if max_points < 2:
+        raise ExpressionError("max_points must be at least 2")
+
+    x_span = x_max - x_min
+    y_span = y_max - y_min
+    min_width = x_span / (4 * max_points)
+    x = np.linspace(x_min, x_max, min(ADAPTIVE_INITIAL_POINTS, max_points))
+    y = compiled.evaluate(x=x)
+
+    while True:
+        u = (x - x_min) / x_span
+        v = (y - y_min) / y_span
+        du = np.diff(u)
+        dv = np.diff(v)
+        finite = np.isfinite(v)
+        with np.errstate(all='ignore'):
+            length = np.hypot(du, dv)
+            # Turning angle at each interior point, charged to both neighbouring segments
+            turn = np.abs(np.arctan2(du[:-1] * dv[1:] - dv[:-1] * du[1:],
+                                     du[:-1] * du[1:] + dv[:-1] * dv[1:]))
+            turn = np.nan_to_num(turn) / ADAPTIVE_MAX_ANGLE
+            bend = np.zeros_like(length)
+            bend[:-1] = turn
+            bend[1:] = np.maximum(bend[1:], turn)
+            score = np.maximum(np.nan_to_num(length) / ADAPTIVE_MAX_SEGMENT, bend)
+            # Segments entirely above or below the viewport are not worth refining
+            outside = ((v[:-1] > 1.5) & (v[1:] > 1.5)) | ((v[:-1] < -0.5) & (v[1:] < -0.5))
+        edge = finite[:-1] != finite[1:]
+        score[edge] = np.inf
+        score[outside | ~(finite[:-1] | finite[1:])] = 0
+
+        wide = np.diff(x) > min_width
+        if not wide.any():
+            break
+        refine = np.flatnonzero(wide & (score > 1))
+        budget = max_points - len(x)
+        if not len(refine) or budget <= 0:
+            break
+        if len(refine) > budget:
+            refine = refine[np.argsort(score[refine])[::-1][:budget]]
+            refine.sort()
+        mid = (x[refine] + x[refine + 1]) / 2
+        x = np.insert(x, refine + 1, mid)
+        y = np.insert(y, refine + 1, compiled.evaluate(x=mid))
+
+    breaks = _discontinuities(x, y, min_width, (y_max - y_min) * ADAPTIVE_MAX_SEGMENT)
+    if len(breaks):
+        position = np.searchsorted(x, breaks)
+        x = np.insert(x, position, breaks)
+        y = np.insert(y, position, np.nan)
+    return x, y
+
+
+def _discontinuities(x, y, min_width, min_jump):
+    """
+    Midpoints of the fully refined segments that still jump by more than
+    ``min_jump``: steeper than both neighbours by a wide margin, or sloping
+    against both of them (as ``tan`` does across an asymptote).
+    """
+    if len(x) < 4:
+        return np.empty(0)
+    dx = np.diff(x)
+    dy = np.diff(y)
+    with np.errstate(all='ignore'):
+        slope = dy / dx
+        left = slope[:-2]
+        middle = slope[1:-1]
+        right = slope[2:]
+        steeper = np.abs(middle) > 8 * np.maximum(np.abs(left), np.abs(right))
+        reversed_ = (np.sign(middle) != np.sign(left)) & (np.sign(middle) != np.sign(right))
+        jump = (
+            (dx[1:-1] <= min_width)
+            & (np.abs(dy[1:-1]) > min_jump)
+            & (steeper | reversed_)
+        )
+    index = np.flatnonzero(jump) + 1
+    return (x[index] + x[index + 1]) / 2
+
+
+def surface_shape(config, max_points=None):
+    """Point counts ``(nx, ny)`` of a config's 2D sampling grid, validating it"""
+    if max_points is None:
+        max_points = settings.EXPRESSION_MAX_POINTS
+    nx = grid_count(config.xMin, config.xMax, config.xStep, max_points)
+    ny = grid_count(config.yMin, config.yMax, config.yStep, max_points)
+    if nx * ny > max_points:
+        raise ExpressionError(f"Grid has {nx * ny} points, the limit is {max_points}")
+    return nx, ny
+
+
+def surface_grid(config, max_points=None):
+    """Return the x and y axes of a config's 2D sampling grid"""
+    nx, ny = surface_shape(config, max_points)
+    return grid_axis(config.xMin, config.xStep, 0, nx), grid_axis(config.yMin, config.yStep, 0, ny)
+
+
+def evaluate_surface(compiled, x, y):
+    """
+    Evaluate z = f(x, y) over the grid spanned by the ``x`` and ``y`` axes.
+
+    The axes are broadcast against each other, so subterms that depend on a
+    single variable (``sin(x)`` in ``sin(x) * cos(y)``) are computed once per
+    row or column rather than once per grid point.
+    """
+    if compiled.kind not in ('curve', 'surface'):
+        raise ExpressionError("Expression is not a function of x and y")
+    return compiled.evaluate(x=x[np.newaxis, :], y=y[:, np.newaxis])
+
+
+def grid_mesh(x, y, z, z_min=-np.inf, z_max=np.inf):
+    """
+    Triangulate a height field ``z[j, i] = f(x[i], y[j])``.
+
+    Returns a float32 (N, 3) vertex buffer and a uint32 (M, 3) index buffer.
+    Triangles touching a NaN, infinite or out-of-range value are dropped and
+    only vertices that pass the same test are kept.
+    """
+    ny, nx = z.shape
+    with np.errstate(invalid='ignore'):
+        valid = np.isfinite(z) & (z >= z_min) & (z <= z_max)
+
+    ids = np.arange(nx * ny, dtype=np.int64).reshape(ny, nx)
+    a = ids[:-1, :-1].ravel()
+    b = ids[:-1, 1:].ravel()
+    c = ids[1:, :-1].ravel()
+    d = ids[1:, 1:].ravel()
+    triangles = np.concatenate([
+        np.stack([a, b, c], axis=1),
+        np.stack([b, d, c], axis=1),
+    ])
+    flat_valid = valid.ravel()
+    triangles = triangles[flat_valid[triangles].all(axis=1)]
+
+    remap = np.cumsum(flat_valid) - 1
+    xx, yy = np.meshgrid(x, y)
+    vertices = np.stack([xx.ravel(), yy.ravel(), z.ravel()], axis=1)[flat_valid]
+    return vertices.astype(np.float32), remap[triangles].astype(np.uint32)
+
+
+def evaluate_batch(compiled_list, x, y=None):
+    """
+    Evaluate several expressions over shared grids with one merged program.
+
+    Curves are evaluated along the ``x`` axis and surfaces over the ``x``/``y``
+    grid. All expressions are compiled into a single ``Program``, so a subterm
+    such as ``sin(x)`` is computed once no matter how many expressions (or
+    how many places in one expression) use it; since curves and surfaces share
+    the same x axis, ``sin(x)`` is shared between them too.
+
+    Returns the list of value arrays and the merged program.
+    """
+    program = Program()
+    env = {'x': x[np.newaxis, :]}
+    if y is not None:
+        env['y'] = y[:, np.newaxis]
+    shapes = []
+    for compiled in compiled_list:
+        if compiled.kind == 'curve':
+            shapes.append((len(x),))
+        elif compiled.kind == 'surface' and y is not None:
+            shapes.append((len(y), len(x)))
+        else:
+            raise ExpressionError("Expression is not a function of x and y")
+    slots = [program.add(compiled.node) for compiled in compiled_list]
+    values = program.run(env, slots)
+    results = []
+    for value, shape in zip(values, shapes):
+        value = np.asarray(value, dtype=np.float64)
+        if len(shape) == 1:
+            value = np.broadcast_to(value, (1, len(x))).reshape(shape)
+        else:
+            value = np.broadcast_to(value, shape)
+        results.append(np.array(value))
+    return results, program
+
+
+def finite_or_none(values):
+    """Convert an array to a list, replacing NaN and infinities with None"""
+    values = np.asarray(values)
+    mask = ~np.isfinite(values)
+    if not mask.any():
+        return values.tolist()
+    result = values.astype(object)
+    result[mask] = None
+    return result.tolist()
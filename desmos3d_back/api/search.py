@@ -0,0 +1,106 @@
+"""
+Indexed substring search over equation expressions and graph config names
+and descriptions.
+
+On SQLite the rows are mirrored into FTS5 tables with the trigram tokenizer
+(``api_equation_fts`` and ``api_graphconfig_fts``), kept in sync by triggers
+so bulk writes are covered too; a word of three or more characters is looked
+up there. On PostgreSQL, trigram GIN indexes on ``UPPER(column)`` serve
+Django's ``icontains`` directly. Both are created by migration 0009. Other
+databases, and shorter words, fall back to ``icontains``.
+"""
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Equation, GraphConfig
+
+# model -> indexed fields; the SQLite FTS5 table is named after the model's table
+INDEXES = {
+    Equation: ('expression',),
+    GraphConfig: ('name', 'description'),
+}
+
+# Shortest word the trigram index can look up
+MIN_INDEXED_LENGTH = 3
+
+_fts_tables = {}
+
+
+def sqlite_trigger_statements(table, columns):
+    """Triggers mirroring writes to ``table`` into its FTS5 table"""
+    fts = f'{table}_fts'
+    names = ', '.join(columns)
+    new = ', '.join(f'new.{column}' for column in columns)
+    old = ', '.join(f'old.{column}' for column in columns)
+    delete = f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old});"
+    insert = f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new});"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {names} ON {table} "
+        f"BEGIN {delete} {insert} END",
+    ]
+
+
+def repair_sqlite_triggers(using='default', **kwargs):
+    """
+    post_migrate: SQLite migrations that alter a table rebuild it and lose its
+    triggers, so put them back and reindex if any went missing.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for model, fields in INDEXES.items():
+            table = model._meta.db_table
+            if not _has_fts_table(connection, f'{table}_fts'):
+                continue
+            cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE %s",
+                           [f'{table}_fts_%'])
+            if cursor.fetchone()[0] < 3:
+                for statement in sqlite_trigger_statements(table, fields):
+                    cursor.execute(statement)
+                cursor.execute(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
+
+
+def _has_fts_table(connection, table):
+    """Whether the FTS5 table exists: migration 0009 skips it where FTS5 or its trigram tokenizer is missing"""
+    key = (connection.alias, connection.settings_dict['NAME'], table)
+    if key not in _fts_tables:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [table])
+            _fts_tables[key] = cursor.fetchone() is not None
+    return _fts_tables[key]
+
+
+def _phrase(word):
+    """An FTS5 string matching ``word`` literally"""
+    return '"{}"'.format(word.replace('"', '""'))
+
+
+def _word_condition(queryset, word):
+    fields = INDEXES[queryset.model]
+    table = f'{queryset.model._meta.db_table}_fts'
+    connection = connections[queryset.db]
+    if (connection.vendor == 'sqlite' and len(word) >= MIN_INDEXED_LENGTH
+            and _has_fts_table(connection, table)):
+        return Q(pk__in=RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', [_phrase(word)]))
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{f'{field}__icontains': word})
+    return condition
+
+
+def search(queryset, text, extra_fields=()):
+    """
+    Rows of ``queryset`` (of an indexed model) containing every word of
+    ``text``, case-insensitively, in one of the indexed fields or, without
+    an index, one of ``extra_fields``.
+    """
+    for word in text.split():
+        condition = _word_condition(queryset, word)
+        for field in extra_fields:
+            condition |= Q(**{f'{field}__icontains': word})
+        queryset = queryset.filter(condition)
+    return queryset
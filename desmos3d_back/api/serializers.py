@@ -1,5 +1,7 @@
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth.models import User
+from .metrics import TimedSerializerMixin
 from .models import Equation, GraphConfig
 
 class UserSerializer(serializers.ModelSerializer):
@@ -18,24 +20,141 @@ class UserSerializer(serializers.ModelSerializer):
         )
         return user
 
-class EquationSerializer(serializers.ModelSerializer):
+class EquationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Equation
-        fields = ['id', 'expression', 'color', 'visible', 'graph_config', 'created_at', 'updated_at']
+        fields = ['id', 'expression', 'color', 'visible', 'graph_config', 'position', 'created_at', 'updated_at']
         read_only_fields = ['created_at', 'updated_at']
 
-class GraphConfigSerializer(serializers.ModelSerializer):
+def _name_list(value):
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+class SparseFieldsMixin:
+    """
+    Sparse fieldsets from the request's query string: ?fields=id,name limits
+    the output to the listed fields. Nested relations named in
+    ``Meta.expandable_fields`` are then left out unless listed in ``fields``
+    or in ?expand=. Without ?fields= every field is serialized.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        selected = self.selected_fields(self.context.get('request'))
+        if selected is not None:
+            for name in list(self.fields):
+                if name not in selected:
+                    self.fields.pop(name)
+
+    @classmethod
+    def selected_fields(cls, request):
+        """Names of the requested fields, or None when all of them are"""
+        params = getattr(request, 'query_params', None)
+        if not params or not params.get('fields'):
+            return None
+        expandable = set(getattr(cls.Meta, 'expandable_fields', ()))
+        return _name_list(params['fields']) | (_name_list(params.get('expand', '')) & expandable)
+
+    @classmethod
+    def includes_field(cls, request, name):
+        selected = cls.selected_fields(request)
+        return selected is None or name in selected
+
+class GraphConfigSerializer(TimedSerializerMixin, SparseFieldsMixin, serializers.ModelSerializer):
     equations = EquationSerializer(many=True, read_only=True)
     
     class Meta:
         model = GraphConfig
-        fields = ['id', 'name', 'description', 'xMin', 'xMax', 'yMin', 'yMax', 'xStep', 'gridVisible', 'is_saved', 'equations', 'created_at', 'updated_at']
-        read_only_fields = ['created_at', 'updated_at']
+        fields = ['id', 'name', 'description', 'xMin', 'xMax', 'yMin', 'yMax', 'zMin', 'zMax', 'xStep', 'yStep', 'gridVisible', 'is_saved', 'version', 'thumbnail', 'equations', 'created_at', 'updated_at']
+        read_only_fields = ['version', 'thumbnail', 'created_at', 'updated_at']
+        expandable_fields = ['equations']
+
+class SavedConfigSerializer(serializers.Serializer):
+    xMin = serializers.FloatField(default=-10)
+    xMax = serializers.FloatField(default=10)
+    yMin = serializers.FloatField(default=-10)
+    yMax = serializers.FloatField(default=10)
+    zMin = serializers.FloatField(default=-10)
+    zMax = serializers.FloatField(default=10)
+    xStep = serializers.FloatField(default=0.1)
+    yStep = serializers.FloatField(default=0.1)
+    gridVisible = serializers.BooleanField(default=True)
+
+class SavedEquationSerializer(serializers.Serializer):
+    expression = serializers.CharField(max_length=255, allow_blank=True, default='')
+    color = serializers.CharField(max_length=20, default="#3498db")
+    visible = serializers.BooleanField(default=True)
 
 class SaveGraphRequestSerializer(serializers.Serializer):
     name = serializers.CharField(max_length=100, default="Мой график")
     description = serializers.CharField(required=False, allow_blank=True)
-    config = serializers.DictField()
-    equations = serializers.ListField(
-        child=serializers.DictField()
-    )
\ No newline at end of file
+    config = SavedConfigSerializer()
+    equations = SavedEquationSerializer(many=True)
+
+class BulkImportRequestSerializer(serializers.Serializer):
+    graphs = SaveGraphRequestSerializer(many=True, allow_empty=False)
+
+    def validate_graphs(self, graphs):
+        if len(graphs) > settings.BULK_IMPORT_MAX_GRAPHS:
+            raise serializers.ValidationError(
+                f"At most {settings.BULK_IMPORT_MAX_GRAPHS} graphs can be imported at once")
+        return graphs
+
+class PatchConfigSerializer(SavedConfigSerializer):
+    name = serializers.CharField(max_length=100)
+    description = serializers.CharField(allow_blank=True, allow_null=True)
+
+class GraphPatchOperationSerializer(serializers.Serializer):
+    """
+    One edit of a graph:
+
+    - ``{"op": "add", "ref": "...", "fields": {...}}`` adds an equation
+    - ``{"op": "update", "id": n, "fields": {...}}`` changes fields of an
+      equation, or of the config itself when ``id`` is left out
+    - ``{"op": "remove", "id": n}`` deletes an equation
+    - ``{"op": "reorder", "order": [ids]}`` puts equations in this order,
+      listing every equation of the graph once
+    """
+    op = serializers.ChoiceField(choices=['add', 'update', 'remove', 'reorder'])
+    id = serializers.IntegerField(required=False)
+    ref = serializers.CharField(required=False, max_length=64)
+    fields = serializers.DictField(required=False)
+    order = serializers.ListField(child=serializers.IntegerField(), required=False, allow_empty=False)
+
+    def _fields(self, serializer_class, data, partial):
+        serializer = serializer_class(data=data.get('fields', {}), partial=partial)
+        if not serializer.is_valid():
+            raise serializers.ValidationError({'fields': serializer.errors})
+        return serializer.validated_data
+
+    def validate(self, data):
+        op = data['op']
+        if op == 'add':
+            data['fields'] = self._fields(SavedEquationSerializer, data, partial=False)
+        elif op == 'update':
+            data['fields'] = self._fields(
+                SavedEquationSerializer if 'id' in data else PatchConfigSerializer, data, partial=True)
+            if not data['fields']:
+                raise serializers.ValidationError({'fields': "No fields to update"})
+        elif op == 'remove' and 'id' not in data:
+            raise serializers.ValidationError({'id': "This field is required."})
+        elif op == 'reorder' and 'order' not in data:
+            raise serializers.ValidationError({'order': "This field is required."})
+        return data
+
+class GraphPatchRequestSerializer(serializers.Serializer):
+    version = serializers.IntegerField(min_value=0)
+    operations = GraphPatchOperationSerializer(many=True, allow_empty=False)
+
+    def validate_operations(self, operations):
+        if len(operations) > settings.GRAPH_PATCH_MAX_OPERATIONS:
+            raise serializers.ValidationError(
+                f"At most {settings.GRAPH_PATCH_MAX_OPERATIONS} operations can be applied at once")
+        return operations
+
+class EvaluateRequestSerializer(serializers.Serializer):
+    xMin = serializers.FloatField(required=False)
+    xMax = serializers.FloatField(required=False)
+    xStep = serializers.FloatField(required=False)
+    yMin = serializers.FloatField(required=False)
+    yMax = serializers.FloatField(required=False)
+    yStep = serializers.FloatField(required=False)
@@ -0,0 +1,71 @@
+"""
+Public, read-only share links to graph configs.
+
+Publishing a config renders it with its equations once, in the shape of the
+save_current body (so a viewer can save a copy of it as is), and stores the
+JSON with its hash in a ``SharedGraph`` row under a random key. A snapshot
+never changes: edits made after publishing need a new link, and publishing
+an unchanged graph again returns the existing one.
+
+Serving a link is one primary-key lookup of the stored body and its strong
+ETag, with no joins and no serializers. Responses depend on nothing in the
+request, so a CDN can keep them, but only for ``SHARED_GRAPHS['S_MAXAGE']``
+seconds (``MAX_AGE`` in browsers) before revalidating with the ETag: links
+can be revoked, by the owner or by deleting the graph, and then have to stop
+being served.
+"""
+import hashlib
+import secrets
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
+from rest_framework.renderers import JSONRenderer
+
+from .models import SharedGraph
+from .serializers import SavedConfigSerializer, SavedEquationSerializer
+
+# Random bytes in a share key: 16 URL-safe characters
+KEY_BYTES = 12
+
+
+def render_snapshot(config):
+    """The JSON body of a share of ``config`` as it is now"""
+    return JSONRenderer().render({
+        'name': config.name,
+        'description': config.description or '',
+        'config': SavedConfigSerializer(config).data,
+        'equations': SavedEquationSerializer(config.equations.all(), many=True).data,
+    }).decode('utf-8')
+
+
+def publish(config):
+    """The share of the current state of ``config``, and whether it was created now"""
+    content = render_snapshot(config)
+    etag = quote_etag(hashlib.sha256(content.encode('utf-8')).hexdigest())
+    shared = SharedGraph.objects.filter(graph_config=config, etag=etag).first()
+    if shared is not None:
+        return shared, False
+    shared = SharedGraph.objects.create(
+        key=secrets.token_urlsafe(KEY_BYTES),
+        graph_config=config,
+        user_id=config.user_id,
+        content=content,
+        etag=etag,
+    )
+    return shared, True
+
+
+def shared_graph_response(request, content, etag):
+    """The stored ``content`` of a share, or a 304 if the request's If-None-Match has ``etag``"""
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    # Not the year-long ``immutable`` the content would allow: a revoked link has
+    # to disappear, and nothing purges browser or CDN caches, so they keep it for
+    # minutes and then revalidate, which is a cheap 304 while the link is live
+    options = settings.SHARED_GRAPHS
+    response['Cache-Control'] = f"public, max-age={options['MAX_AGE']}, s-maxage={options['S_MAXAGE']}"
+    return response
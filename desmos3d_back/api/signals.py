@@ -0,0 +1,69 @@
+from django.contrib.auth.models import User
+from django.db.models import F
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from .authentication import forget_token, forget_user_tokens
+from .models import Equation, GraphConfig
+from .response_cache import invalidate, collection_version_key, object_version_key
+from .thumbnails import schedule_thumbnail
+
+
+@receiver(post_init, sender=Equation)
+def remember_graph_config(sender, instance, **kwargs):
+    instance._loaded_graph_config_id = instance.graph_config_id
+
+
+@receiver(post_save, sender=Equation)
+@receiver(post_delete, sender=Equation)
+def touch_graph_config(sender, instance, **kwargs):
+    """
+    An equation is part of its graph config's representation: bump the
+    config's updated_at and version (and the previous config's, if the
+    equation moved)
+    and drop the cached responses that include either of them.
+    """
+    config_ids = {instance.graph_config_id, instance._loaded_graph_config_id} - {None}
+    if config_ids:
+        GraphConfig.objects.filter(pk__in=config_ids).update(
+            updated_at=timezone.now(), version=F('version') + 1)
+        for pk in config_ids:
+            schedule_thumbnail(pk)
+    instance._loaded_graph_config_id = instance.graph_config_id
+    invalidate(
+        collection_version_key(instance.user_id, 'equations'),
+        object_version_key('equations', instance.pk),
+        *([collection_version_key(instance.user_id, 'graph-configs')] if config_ids else []),
+        *(object_version_key('graph-configs', pk) for pk in config_ids),
+    )
+
+
+@receiver(post_save, sender=GraphConfig)
+@receiver(post_delete, sender=GraphConfig)
+def invalidate_graph_config(sender, instance, **kwargs):
+    """Drop the cached responses that include a graph config"""
+    invalidate(
+        collection_version_key(instance.user_id, 'graph-configs'),
+        object_version_key('graph-configs', instance.pk),
+    )
+
+
+@receiver(post_save, sender=GraphConfig)
+def update_graph_thumbnail(sender, instance, **kwargs):
+    schedule_thumbnail(instance.pk)
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    """Drop a deleted or regenerated token from the authentication cache"""
+    forget_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_tokens(sender, instance, **kwargs):
+    """Cached tokens carry their user: drop them when the user changes, e.g. is deactivated"""
+    forget_user_tokens(instance.pk)
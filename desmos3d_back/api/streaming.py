@@ -0,0 +1,190 @@
+"""
+Chunked streaming of large evaluations.
+
+Generators in this module evaluate one x-range (or block of the x/y grid)
+per worker pool job and yield small dicts holding NumPy arrays. Each chunk
+builds its own slice of the axes, so peak memory depends on
+STREAM_CHUNK_POINTS rather than on the size of the grid.
+``streaming_response`` frames them as NDJSON lines or, when the client
+negotiated the binary renderer, as length-prefixed ``Float32BufferRenderer``
+messages. The first frame is a header and the last one is
+``{"done": true, "chunks": n}``, or ``{"error": ...}`` if evaluation failed
+part way through.
+"""
+import json
+import logging
+import struct
+
+import numpy as np
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from .cache import get_compiled_expression
+from .expressions import ExpressionError
+from .implicit import implicit_mesh
+from .renderers import Float32BufferRenderer, replace_arrays
+from .sampling import grid_axis, grid_count, surface_shape, finite_or_none
+from .workers import run_job, error_data
+from . import jobs
+
+logger = logging.getLogger(__name__)
+
+STREAM_CHUNK_POINTS = 65536
+
+
+def stream_curve(compiled, x_min, x_max, x_step):
+    """
+    Chunks of y = f(x) over a uniform grid, one x-range at a time. The
+    expression and grid are checked now, before any response is sent.
+    """
+    if compiled.kind != 'curve':
+        raise ExpressionError("Expression is not a function of x")
+    count = grid_count(x_min, x_max, x_step, settings.STREAMING_MAX_POINTS)
+    return _curve_chunks(compiled, x_min, x_step, count)
+
+
+def _curve_chunks(compiled, x_min, x_step, count):
+    for start in range(0, count, STREAM_CHUNK_POINTS):
+        stop = min(start + STREAM_CHUNK_POINTS, count)
+        x, y = run_job(jobs.curve_chunk, compiled.text, x_min, x_step, start, stop)
+        yield {'offset': start, 'x': x, 'y': y}
+
+
+def _bands(count, size):
+    """(start, stop) ranges of at most ``size`` points covering ``count``, sharing their edge points"""
+    if count <= size:
+        return [(0, count)]
+    return [(start, min(start + size, count)) for start in range(0, count - 1, size - 1)]
+
+
+def _blocks(config):
+    """
+    (rows, columns) ranges of about STREAM_CHUNK_POINTS points covering the
+    config's x/y grid, neighbouring blocks sharing their edge rows and columns
+    """
+    columns, rows = surface_shape(config, settings.STREAMING_MAX_POINTS)
+    width = min(columns, STREAM_CHUNK_POINTS)
+    height = max(2, STREAM_CHUNK_POINTS // width)
+    return [(row_range, column_range) for row_range in _bands(rows, height) for column_range in _bands(columns, width)]
+
+
+def _block_axes(config, rows, columns):
+    return (grid_axis(config.xMin, config.xStep, *columns),
+            grid_axis(config.yMin, config.yStep, *rows))
+
+
+def stream_surface_mesh(compiled, config):
+    """
+    Yield the mesh of z = f(x, y) over the config's grid one block at a time.
+    Indices are offset by the vertices already sent, so the blocks concatenate
+    into one mesh (vertices on block edges are repeated).
+    """
+    base = 0
+    for rows, columns in _blocks(config):
+        x, y = _block_axes(config, rows, columns)
+        vertices, indices = run_job(jobs.surface_mesh, compiled.text, x, y, config.zMin, config.zMax)
+        yield {
+            'rows': list(rows),
+            'columns': list(columns),
+            'vertices': vertices,
+            'indices': indices + np.uint32(base),
+        }
+        base += len(vertices)
+
+
+def stream_batch(items, config):
+    """
+    Yield batch evaluation results for ``items``, a list of (equation id,
+    compiled expression), over the config's grid: curves one x-range at a
+    time, then surfaces one block of the x/y grid at a time. Each group
+    shares one program.
+    """
+    curves = [(pk, c) for pk, c in items if c.kind == 'curve']
+    surfaces = [(pk, c) for pk, c in items if c.kind != 'curve']
+    if curves:
+        count = grid_count(config.xMin, config.xMax, config.xStep, settings.STREAMING_MAX_POINTS)
+        for start in range(0, count, STREAM_CHUNK_POINTS):
+            x = grid_axis(config.xMin, config.xStep, start, min(start + STREAM_CHUNK_POINTS, count))
+            values, _ = run_job(jobs.batch, [c.text for _, c in curves], x)
+            yield {
+                'offset': start,
+                'x': x,
+                'values': [{'id': pk, 'values': value} for (pk, _), value in zip(curves, values)],
+            }
+    if surfaces:
+        for rows, columns in _blocks(config):
+            values, _ = run_job(jobs.batch, [c.text for _, c in surfaces], *_block_axes(config, rows, columns))
+            yield {
+                'rows': list(rows),
+                'columns': list(columns),
+                'values': [{'id': pk, 'values': value} for (pk, _), value in zip(surfaces, values)],
+            }
+
+
+def stream_meshes(equations, config, resolution):
+    """
+    Yield the meshes of several equations of ``config``, each chunk tagged
+    with the equation id. Implicit surfaces are sent as a single chunk.
+    """
+    bounds = [config.xMin, config.xMax, config.yMin, config.yMax, config.zMin, config.zMax]
+    for equation in equations:
+        try:
+            compiled = get_compiled_expression(equation.expression)
+            if compiled.kind == 'implicit':
+                vertices, indices = implicit_mesh(compiled, bounds, resolution)
+                chunks = [{'vertices': vertices, 'indices': indices}]
+            else:
+                chunks = stream_surface_mesh(compiled, config)
+            for chunk in chunks:
+                yield {'id': equation.id, **chunk}
+        except ExpressionError as exc:
+            yield {'id': equation.id, **error_data(exc)}
+
+
+def _frames(header, chunks, encode):
+    yield encode(header)
+    sent = 0
+    try:
+        for chunk in chunks:
+            yield encode(chunk)
+            sent += 1
+    except ExpressionError as exc:
+        # Invalid input and worker pool failures (EvaluationError)
+        yield encode({**error_data(exc), 'chunks': sent})
+        return
+    except Exception:
+        # The status line is already sent: end the body with an error frame instead
+        logger.exception("Streaming failed after %d chunks", sent)
+        yield encode({'error': "Evaluation failed", 'code': 'failed', 'chunks': sent})
+        return
+    yield encode({'done': True, 'chunks': sent})
+
+
+def _ndjson(data):
+    data = replace_arrays(data, lambda array: finite_or_none(array.ravel()))
+    return json.dumps(data, allow_nan=False, separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def _length_prefixed(data):
+    message = Float32BufferRenderer().render(data)
+    return struct.pack('<I', len(message)) + message
+
+
+def wants_stream(request):
+    return request.query_params.get('stream') in ('1', 'true')
+
+
+def streaming_response(request, header, chunks):
+    """
+    Stream ``header`` and the dicts produced by ``chunks`` in the format the
+    request negotiated: length-prefixed binary messages for
+    ``application/octet-stream``, NDJSON otherwise.
+    """
+    renderer = getattr(request, 'accepted_renderer', None)
+    if renderer is not None and renderer.format == Float32BufferRenderer.format:
+        encode, content_type = _length_prefixed, Float32BufferRenderer.media_type
+    else:
+        encode, content_type = _ndjson, 'application/x-ndjson'
+    response = StreamingHttpResponse(_frames(header, chunks, encode), content_type=content_type)
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -1,3 +1,1456 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import struct
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from PIL import Image
+from rest_framework.test import APIClient
+
+from .artifacts import get_artifact_storage
+from .authentication import CachedTokenAuthentication, token_cache_key
+from .cache import LRUCache, get_cache, get_compiled_expression
+from .expressions import MAX_DEPTH, ExpressionError, compile_expression, normalize, parse
+from .metrics import get_registry
+from .implicit import implicit_mesh
+from .models import Equation, GraphConfig, SharedGraph
+from .response_cache import object_version_key
+from .renderers import ArrayJSONRenderer, Float32BufferRenderer, MessagePackRenderer
+from .sampling import evaluate_batch, evaluate_surface, grid_mesh, sample_curve_adaptive, surface_grid
+from .search import repair_sqlite_triggers, search
+from .tiles import MAX_TILES_ACROSS, viewport_curve
+from .views import GraphConfigViewSet
+from .thumbnails import render_thumbnail, update_thumbnail
+from .workers import EvaluationError, WorkerPool, error_data, map_jobs, run_job
+
+
+class ExpressionTests(TestCase):
+    def applied(self, text):
+        """Operations of the compiled expression that run per evaluation"""
+        return sum(1 for kind, _, _ in compile_expression(text).program.ops if kind == 'apply')
+
+    def test_parse(self):
+        self.assertEqual(parse("2x"), parse("2 * x"))
+        self.assertEqual(parse("(x + 1)(x - 1)"), parse("(x + 1) * (x - 1)"))
+        self.assertEqual(parse("-x^2"), ('neg', ('op', '^', ('var', 'x'), ('num', 2.0))))
+        self.assertEqual(parse("2^3^2"), parse("2^(3^2)"))
+        self.assertEqual(normalize("x**2  +sin( x )"), "x ^ 2 + sin ( x )")
+
+    def test_rejects_unsafe_and_invalid_input(self):
+        for text in ["__import__('os')", "x.real", "exec(x)", "y = ", "sin(x, x)", "", "q + 1",
+                     "(" * (MAX_DEPTH + 1) + "x" + ")" * (MAX_DEPTH + 1)]:
+            with self.assertRaises(ExpressionError, msg=text):
+                compile_expression(text)
+
+    def test_kinds(self):
+        for text, kind in [("sin(x)", 'curve'), ("y = x^2", 'curve'), ("2", 'curve'), ("x*y", 'surface'),
+                           ("z = sin(x) * cos(y)", 'surface'), ("x^2 + y^2 + z^2 = 1", 'implicit'),
+                           ("y = z", 'implicit')]:
+            self.assertEqual(compile_expression(text).kind, kind, text)
+
+    def test_program_shares_subterms_and_folds_constants(self):
+        # sin(x) once, then ^2 and +
+        self.assertEqual(self.applied("sin(x)^2 + sin(x)"), 3)
+        self.assertEqual(self.applied("x + 2 * 3 * pi"), 1)
+        compiled = compile_expression("sin(x)^2 + sin(x)")
+        x = np.linspace(-3, 3, 7)
+        np.testing.assert_allclose(compiled.evaluate(x=x), np.sin(x) ** 2 + np.sin(x))
+        # Constants are broadcast to the grid
+        self.assertEqual(compile_expression("4").evaluate(x=x).tolist(), [4.0] * 7)
+
+    def test_sample_endpoint(self):
+        user = User.objects.create_user(username='sampler', password='password')
+        client = APIClient()
+        client.force_authenticate(user)
+        config = GraphConfig.objects.create(user=user, xMin=0, xMax=1, xStep=0.25)
+        equation = Equation.objects.create(user=user, graph_config=config, expression="sin(x) / x")
+        data = client.get(f'/api/equations/{equation.id}/sample/').json()
+        self.assertEqual(data['count'], 5)
+        self.assertEqual(data['x'], [0, 0.25, 0.5, 0.75, 1])
+        # 0/0 is sent as null
+        self.assertIsNone(data['y'][0])
+        self.assertAlmostEqual(data['y'][4], np.sin(1))
+
+        equation.expression = "sin(x"
+        equation.save()
+        response = client.get(f'/api/equations/{equation.id}/sample/')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.json())
+
+
+class ExpressionCacheTests(TestCase):
+    def test_lru_eviction(self):
+        lru = LRUCache(max_entries=2, max_bytes=100, sizeof=len)
+        lru.set('a', 'x' * 10)
+        lru.set('b', 'x' * 10)
+        self.assertEqual(lru.get('a'), 'x' * 10)
+        lru.set('c', 'x' * 10)  # evicts b, the least recently used
+        self.assertNotIn('b', lru)
+        self.assertIn('a', lru)
+        lru.set('d', 'x' * 95)  # over max_bytes: only d fits
+        self.assertEqual((len(lru), 'd' in lru), (1, True))
+        self.assertEqual(lru.bytes, 95)
+        self.assertIsNone(lru.get('b'))
+        stats = lru.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (1, 1, 3))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_compiled_expressions_are_shared_by_normalized_text(self):
+        expressions = get_cache('EXPRESSION_CACHE')
+        expressions.clear()
+        self.addCleanup(expressions.clear)
+        compiled = get_compiled_expression("sin(x)")
+        self.assertIs(get_compiled_expression("sin( x )"), compiled)
+        self.assertIs(get_compiled_expression("sin(x)"), compiled)
+        self.assertEqual(expressions.stats()['hits'], 2)
+        self.assertEqual(expressions.stats()['misses'], 1)
+        with self.assertRaises(ExpressionError):
+            get_compiled_expression("sin(")
+        self.assertEqual(len(expressions), 1)
+
+    def test_cache_stats_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='user', password='password'))
+        self.assertEqual(client.get('/api/cache-stats/').status_code, 403)
+        client.force_authenticate(User.objects.create_superuser(username='admin', password='password'))
+        get_compiled_expression("cos(x)")
+        self.assertIn('hit_rate', client.get('/api/cache-stats/').json()['EXPRESSION_CACHE'])
+
+
+class AdaptiveSamplingTests(TestCase):
+    def sample(self, text, max_points=2000, bounds=(-5, 5, -10, 10)):
+        return sample_curve_adaptive(compile_expression(text), *bounds, max_points)
+
+    def test_breaks_at_asymptotes(self):
+        x, y = self.sample("tan(x)")
+        self.assertTrue((np.diff(x) > 0).all())
+        breaks = x[np.isnan(y)]
+        np.testing.assert_allclose(breaks, [-3 * np.pi / 2, -np.pi / 2, np.pi / 2, 3 * np.pi / 2], atol=1e-2)
+        # Steep parts near the asymptotes get far more points than flat ones
+        near = np.abs(np.abs(x) - np.pi / 2) < 0.5
+        far = np.abs(x) < 0.5
+        self.assertGreater(near.sum(), 3 * far.sum())
+
+    def test_point_budget(self):
+        x, y = self.sample("sin(1/x)", max_points=300, bounds=(-1, 1, -2, 2))
+        self.assertLessEqual(len(x), 300)
+        # Flat curves need no more than their segment length allows
+        x, y = self.sample("2x + 1")
+        self.assertLess(len(x), 200)
+        x, y = self.sample("x^3", max_points=20)
+        self.assertEqual(len(x), 20)
+
+    def test_domain_edge_is_refined(self):
+        x, y = self.sample("sqrt(x)", max_points=300, bounds=(-1, 1, -2, 2))
+        self.assertEqual(x[np.isfinite(y)].min(), 0)
+        self.assertFalse(np.isnan(y[x >= 0]).any())
+
+    def test_endpoint(self):
+        user = User.objects.create_user(username='adaptive', password='password')
+        client = APIClient()
+        client.force_authenticate(user)
+        config = GraphConfig.objects.create(user=user, xMin=-5, xMax=5)
+        equation = Equation.objects.create(user=user, graph_config=config, expression="tan(x)")
+        url = f'/api/equations/{equation.id}/sample/'
+        data = client.get(url, {'sampling': 'adaptive', 'max_points': 500}).json()
+        self.assertEqual(data['sampling'], 'adaptive')
+        self.assertLessEqual(data['count'], 500)
+        self.assertEqual(data['y'].count(None), 4)
+        self.assertEqual(client.get(url, {'sampling': 'adaptive', 'max_points': 'many'}).status_code, 400)
+        self.assertEqual(client.get(url, {'sampling': 'random'}).status_code, 400)
+
+
+class SurfaceMeshTests(TestCase):
+    def test_grid_mesh(self):
+        x = np.array([0.0, 1.0, 2.0])
+        y = np.array([0.0, 1.0])
+        z = np.array([[0.0, 1.0, 2.0], [3.0, 4.0, 5.0]])
+        vertices, indices = grid_mesh(x, y, z)
+        self.assertEqual((vertices.dtype, indices.dtype), (np.float32, np.uint32))
+        self.assertEqual(vertices.tolist(), [[0, 0, 0], [1, 0, 1], [2, 0, 2], [0, 1, 3], [1, 1, 4], [2, 1, 5]])
+        self.assertEqual(len(indices), 4)
+        np.testing.assert_array_equal(vertices[indices][..., 2], z.ravel()[indices])
+
+    def test_drops_non_finite_and_clipped_values(self):
+        x = np.array([0.0, 1.0, 2.0])
+        y = np.array([0.0, 1.0])
+        z = np.array([[0.0, np.nan, 2.0], [3.0, 4.0, np.inf]])
+        vertices, indices = grid_mesh(x, y, z)
+        # Every triangle touches the NaN or the infinity
+        self.assertEqual(len(indices), 0)
+        self.assertEqual(len(vertices), 4)
+        self.assertTrue(np.isfinite(vertices).all())
+
+        z = np.array([[0.0, 1.0, 2.0], [3.0, 4.0, 50.0]])
+        vertices, indices = grid_mesh(x, y, z, z_min=-10, z_max=10)
+        self.assertEqual(len(vertices), 5)
+        # Only the triangle of the second square that avoids the clipped corner is left
+        self.assertEqual(len(indices), 3)
+        self.assertLess(indices.max(), len(vertices))
+
+    def test_broadcast_evaluation(self):
+        config = GraphConfig(xMin=-1, xMax=1, xStep=0.5, yMin=0, yMax=2, yStep=1)
+        x, y = surface_grid(config)
+        z = evaluate_surface(compile_expression("sin(x) * cos(y)"), x, y)
+        self.assertEqual(z.shape, (3, 5))
+        np.testing.assert_allclose(z, np.sin(x)[np.newaxis, :] * np.cos(y)[:, np.newaxis])
+        with override_settings(EXPRESSION_MAX_POINTS=10):
+            with self.assertRaises(ExpressionError):
+                surface_grid(config)
+
+    def test_mesh_endpoint(self):
+        user = User.objects.create_user(username='mesher', password='password')
+        client = APIClient()
+        client.force_authenticate(user)
+        config = GraphConfig.objects.create(user=user, xMin=-1, xMax=1, xStep=1, yMin=-1, yMax=1, yStep=1)
+        surface = Equation.objects.create(user=user, graph_config=config, expression="sqrt(x) + y")
+        Equation.objects.create(user=user, graph_config=config, expression="x +", color="#e74c3c")
+        Equation.objects.create(user=user, graph_config=config, expression="x*y", visible=False)
+        data = client.get(f'/api/graph-configs/{config.id}/mesh/').json()
+        self.assertEqual(data['bounds'], [-1, 1, -1, 1, -10, 10])
+        valid, invalid = data['surfaces']
+        self.assertEqual(valid['id'], surface.id)
+        # sqrt(x) is NaN for x < 0: only the x >= 0 columns remain
+        self.assertEqual(valid['vertexCount'], 6)
+        self.assertEqual(len(valid['indices']), 4 * 3)
+        self.assertIn('error', invalid)
+
+
+class RendererTests(TestCase):
+    data = {
+        'count': 3,
+        'x': np.array([0.0, 0.5, 1.0]),
+        'mesh': {'vertices': np.array([[1.0, np.nan, 2.0]]), 'indices': np.array([[0, 0, 0]], dtype=np.uint32)},
+    }
+
+    def parse_binary(self, content):
+        """(header, buffers) of a Float32BufferRenderer body"""
+        self.assertEqual(content[:4], b'D3DB')
+        length, = struct.unpack('<I', content[4:8])
+        self.assertEqual(length % 4, 0)
+        header = json.loads(content[8:8 + length])
+        return header, content[8 + length:]
+
+    def test_binary_layout(self):
+        header, buffers = self.parse_binary(Float32BufferRenderer().render(self.data))
+        self.assertEqual(header['count'], 3)
+        self.assertEqual(header['x'], {'dtype': 'float32', 'shape': [3], 'offset': 0, 'byteLength': 12})
+        self.assertEqual(header['mesh']['vertices'],
+                         {'dtype': 'float32', 'shape': [1, 3], 'offset': 12, 'byteLength': 12})
+        self.assertEqual(header['mesh']['indices'],
+                         {'dtype': 'uint32', 'shape': [1, 3], 'offset': 24, 'byteLength': 12})
+        self.assertEqual(len(buffers), 36)
+        np.testing.assert_array_equal(np.frombuffer(buffers, '<f4', 3, 0), [0, 0.5, 1])
+        np.testing.assert_array_equal(np.frombuffer(buffers, '<f4', 3, 12), [1, np.nan, 2])
+        np.testing.assert_array_equal(np.frombuffer(buffers, '<u4', 3, 24), [0, 0, 0])
+
+    def test_json_and_msgpack(self):
+        data = json.loads(ArrayJSONRenderer().render(self.data))
+        self.assertEqual(data['x'], [0, 0.5, 1])
+        self.assertEqual(data['mesh']['vertices'], [1, None, 2])
+
+        data = msgpack.unpackb(MessagePackRenderer().render(self.data))
+        self.assertEqual(data['count'], 3)
+        self.assertEqual((data['x']['dtype'], data['x']['shape']), ('float32', [3]))
+        np.testing.assert_array_equal(np.frombuffer(data['x']['data'], '<f4'), [0, 0.5, 1])
+        self.assertEqual(data['mesh']['indices']['dtype'], 'uint32')
+
+    def test_accept_header(self):
+        user = User.objects.create_user(username='binary', password='password')
+        client = APIClient()
+        client.force_authenticate(user)
+        config = GraphConfig.objects.create(user=user, xMin=0, xMax=1, xStep=0.5)
+        equation = Equation.objects.create(user=user, graph_config=config, expression="2x")
+        url = f'/api/equations/{equation.id}/sample/'
+
+        self.assertEqual(client.get(url)['Content-Type'], 'application/json')
+        response = client.get(url, HTTP_ACCEPT='application/octet-stream')
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        header, buffers = self.parse_binary(response.content)
+        self.assertEqual(header['expression'], "2x")
+        y = header['y']
+        np.testing.assert_array_equal(np.frombuffer(buffers, '<f4', y['shape'][0], y['offset']), [0, 1, 2])
+        response = client.get(url, HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content)['count'], 3)
+
+
+@override_settings(EVALUATION_POOL={'WORKERS': 0})
+class ViewportTests(TestCase):
+    def setUp(self):
+        tiles = get_cache('TILE_CACHE')
+        tiles.clear()
+        self.addCleanup(tiles.clear)
+        self.user = User.objects.create_user(username='panner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.config = GraphConfig.objects.create(user=self.user)
+        self.curve = Equation.objects.create(user=self.user, graph_config=self.config, expression="sin(x)")
+        self.surface = Equation.objects.create(user=self.user, graph_config=self.config, expression="x*y")
+
+    def viewport(self, equation, **bounds):
+        return self.client.get(f'/api/equations/{equation.id}/viewport/', bounds)
+
+    def test_curve_tiles_are_cached(self):
+        first = self.viewport(self.curve, xMin=-1, xMax=1).json()
+        self.assertEqual(first['computed'], first['tiles'])
+        x = np.array(first['x'])
+        self.assertLessEqual(x[0], -1)
+        self.assertGreaterEqual(x[-1], 1)
+        np.testing.assert_allclose(first['y'], np.sin(x))
+
+        repeated = self.viewport(self.curve, xMin=-1, xMax=1).json()
+        self.assertEqual(repeated['computed'], 0)
+        self.assertEqual(repeated['y'], first['y'])
+        self.assertEqual(get_cache('TILE_CACHE').stats()['hits'], first['tiles'])
+
+        # Panning by a tile computes one new tile
+        panned = self.viewport(self.curve, xMin=-0.5, xMax=1.5).json()
+        self.assertEqual(panned['level'], first['level'])
+        self.assertEqual(panned['computed'], 1)
+
+    def test_surface(self):
+        data = self.viewport(self.surface, xMin=0, xMax=1, yMin=0, yMax=1).json()
+        self.assertGreater(data['vertexCount'], 0)
+        vertices = np.array(data['vertices']).reshape(-1, 3)
+        np.testing.assert_allclose(vertices[:, 2], vertices[:, 0] * vertices[:, 1], atol=1e-6)
+        self.assertLessEqual(data['tiles'], MAX_TILES_ACROSS ** 2)
+        self.assertEqual(self.viewport(self.surface, xMin=0, xMax=1, yMin=0, yMax=1).json()['computed'], 0)
+
+    def test_rejects_bad_viewports(self):
+        for bounds in [{'xMin': -1e15, 'xMax': 1e15}, {'xMin': -1e300, 'xMax': 1e300},
+                       {'xMin': 1, 'xMax': 1}, {'yMin': 'nan'}, {'xMax': 'inf'}, {'xMin': 'left'}]:
+            for equation in (self.curve, self.surface):
+                response = self.viewport(equation, **bounds)
+                self.assertEqual(response.status_code, 400, bounds)
+                self.assertIn('error', response.json())
+        with self.assertRaises(ExpressionError):
+            viewport_curve(compile_expression("x"), -2.0 ** 40, 2.0 ** 40)
+
+
+@override_settings(EVALUATION_POOL={'WORKERS': 0})
+class ImplicitSurfaceTests(TestCase):
+    BOUNDS = [-2, 2, -2, 2, -2, 2]
+
+    def setUp(self):
+        get_cache('IMPLICIT_CACHE').clear()
+        self.addCleanup(get_cache('IMPLICIT_CACHE').clear)
+
+    def test_sphere_is_closed_and_consistently_wound(self):
+        # 40 cells along z: three slabs to stitch
+        vertices, indices = implicit_mesh(compile_expression("x^2 + y^2 + z^2 = 1"), self.BOUNDS, 40)
+        self.assertEqual((vertices.dtype, indices.dtype), (np.float32, np.uint32))
+        self.assertGreater(len(indices), 1000)
+        np.testing.assert_allclose(np.linalg.norm(vertices, axis=1), 1, atol=0.02)
+
+        # Every directed edge appears once and its reverse once: closed, with neighbours wound alike
+        directed = np.concatenate([indices[:, [0, 1]], indices[:, [1, 2]], indices[:, [2, 0]]])
+        edges = set(map(tuple, directed.tolist()))
+        self.assertEqual(len(edges), len(directed))
+        self.assertTrue(all((b, a) in edges for a, b in edges))
+        # No duplicated seam vertices: every vertex is used
+        self.assertEqual(len(np.unique(indices)), len(vertices))
+
+        # Normals point outwards: the signed volume is positive and close to the sphere's
+        a, b, c = (vertices[indices[:, n]].astype(np.float64) for n in range(3))
+        volume = np.einsum('ij,ij->i', a, np.cross(b, c)).sum() / 6
+        self.assertAlmostEqual(volume, 4 / 3 * np.pi, delta=0.1)
+
+    def test_results_are_cached(self):
+        compiled = compile_expression("x^2 + y^2 - z = 0")
+        with mock.patch('api.implicit.map_jobs', wraps=map_jobs) as jobs:
+            first = implicit_mesh(compiled, self.BOUNDS, 8)
+            second = implicit_mesh(compiled, self.BOUNDS, 8)
+            implicit_mesh(compiled, self.BOUNDS, 10)
+        self.assertIs(first, second)
+        self.assertEqual(jobs.call_count, 2)
+
+    def test_validation(self):
+        for text, bounds, resolution in [("x + y", self.BOUNDS, 8), ("x^2 + y^2 + z^2 = 1", self.BOUNDS, 1),
+                                         ("x^2 + y^2 + z^2 = 1", [1, 0, -1, 1, -1, 1], 8),
+                                         ("x^2 + y^2 + z^2 = 1", self.BOUNDS, 10 ** 6)]:
+            with self.assertRaises(ExpressionError, msg=text):
+                implicit_mesh(compile_expression(text), bounds, resolution)
+
+    def test_mesh_endpoint(self):
+        user = User.objects.create_user(username='implicit', password='password')
+        client = APIClient()
+        client.force_authenticate(user)
+        config = GraphConfig.objects.create(user=user, xMin=-2, xMax=2, yMin=-2, yMax=2, zMin=-2, zMax=2)
+        Equation.objects.create(user=user, graph_config=config, expression="x^2 + y^2 + z^2 = 1")
+        surface, = client.get(f'/api/graph-configs/{config.id}/mesh/', {'resolution': 16}).json()['surfaces']
+        self.assertEqual(len(surface['vertices']), surface['vertexCount'] * 3)
+        self.assertEqual(max(surface['indices']), surface['vertexCount'] - 1)
+        response = client.get(f'/api/graph-configs/{config.id}/mesh/', {'resolution': 10 ** 6})
+        self.assertIn('error', response.json()['surfaces'][0])
+
+
+class BatchEvaluationTests(TestCase):
+    def test_merged_program_shares_subterms(self):
+        texts = ["sin(x)^2 + sin(x)", "cos(x) * sin(x)", "sin(x) * cos(y)"]
+        compiled = [compile_expression(text) for text in texts]
+        x = np.linspace(-2, 2, 5)
+        y = np.linspace(0, 1, 3)
+        values, program = evaluate_batch(compiled, x, y)
+        # x, sin, 2, ^, + | cos, * | y, cos, *
+        self.assertEqual(len(program.ops), 10)
+        self.assertEqual(sum(len(c.program.ops) for c in compiled), 5 + 4 + 5)
+        self.assertEqual([value.shape for value in values], [(5,), (5,), (3, 5)])
+        np.testing.assert_allclose(values[0], compiled[0].evaluate(x=x))
+        np.testing.assert_allclose(values[1], np.cos(x) * np.sin(x))
+        np.testing.assert_allclose(values[2], np.sin(x)[np.newaxis, :] * np.cos(y)[:, np.newaxis])
+
+        with self.assertRaises(ExpressionError):
+            evaluate_batch(compiled, x)
+
+    def test_evaluate_endpoint(self):
+        user = User.objects.create_user(username='batch', password='password')
+        client = APIClient()
+        client.force_authenticate(user)
+        config = GraphConfig.objects.create(user=user, xMin=0, xMax=1, xStep=0.5, yMin=0, yMax=1, yStep=1)
+        curve = Equation.objects.create(user=user, graph_config=config, expression="sin(x) + 1", position=0)
+        surface = Equation.objects.create(user=user, graph_config=config, expression="sin(x) * y", position=1)
+        implicit = Equation.objects.create(user=user, graph_config=config, expression="x^2+y^2+z^2=1",
+                                           position=2)
+        Equation.objects.create(user=user, graph_config=config, expression="cos(x)", visible=False, position=3)
+        url = f'/api/graph-configs/{config.id}/evaluate/'
+
+        data = client.post(url).json()
+        self.assertEqual(data['x'], [0, 0.5, 1])
+        self.assertEqual(data['y'], [0, 1])
+        self.assertLess(data['operations'], data['operationsWithoutSharing'])
+        by_id = {item['id']: item for item in data['equations']}
+        self.assertEqual(list(by_id), [curve.id, surface.id, implicit.id])
+        self.assertEqual(by_id[curve.id]['kind'], 'curve')
+        np.testing.assert_allclose(by_id[curve.id]['values'], np.sin([0, 0.5, 1]) + 1)
+        np.testing.assert_allclose(by_id[surface.id]['values'], [0, 0, 0, *np.sin([0, 0.5, 1])])
+        self.assertIn('error', by_id[implicit.id])
+        self.assertNotIn('values', by_id[implicit.id])
+
+        # The body overrides the bounds for this request only
+        data = client.post(url, {'xMin': 1, 'xMax': 2}, format='json').json()
+        self.assertEqual(data['x'], [1, 1.5, 2])
+        self.assertEqual(client.post(url, {'xStep': 'wide'}, format='json').status_code, 400)
+        self.assertEqual(client.post(url, {'xStep': -1}, format='json').status_code, 400)
+
+
+@override_settings(EVALUATION_POOL={'WORKERS': 0})
+class StreamingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='streamer', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.config = GraphConfig.objects.create(user=self.user, xMin=0, xMax=9, xStep=1, yMin=0, yMax=4, yStep=1,
+                                                 zMax=100)
+        self.curve = Equation.objects.create(user=self.user, graph_config=self.config, expression="2x", position=0)
+        self.surface = Equation.objects.create(user=self.user, graph_config=self.config, expression="x + 10y",
+                                               position=1)
+        chunk_points = mock.patch('api.streaming.STREAM_CHUNK_POINTS', 4)
+        chunk_points.start()
+        self.addCleanup(chunk_points.stop)
+
+    def frames(self, response):
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_sample_frames(self):
+        frames = self.frames(self.client.get(f'/api/equations/{self.curve.id}/sample/', {'stream': 1}))
+        header, *chunks, done = frames
+        self.assertEqual((header['id'], header['count']), (self.curve.id, 10))
+        self.assertEqual([chunk['offset'] for chunk in chunks], [0, 4, 8])
+        self.assertEqual(sum((chunk['x'] for chunk in chunks), []), list(range(10)))
+        self.assertEqual(sum((chunk['y'] for chunk in chunks), []), list(range(0, 20, 2)))
+        self.assertEqual(done, {'done': True, 'chunks': 3})
+
+    def test_sample_rejects_surfaces_before_streaming(self):
+        url = f'/api/equations/{self.surface.id}/sample/'
+        expected = self.client.get(url)
+        response = self.client.get(url, {'stream': 1})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), expected.json())
+
+    def test_binary_frames(self):
+        response = self.client.get(f'/api/equations/{self.curve.id}/sample/', {'stream': 1},
+                                   HTTP_ACCEPT='application/octet-stream')
+        content = b''.join(response.streaming_content)
+        messages = []
+        while content:
+            length, = struct.unpack('<I', content[:4])
+            messages.append(content[4:4 + length])
+            content = content[4 + length:]
+        self.assertEqual(len(messages), 5)
+        self.assertTrue(all(message.startswith(b'D3DB') for message in messages))
+
+    def test_surface_blocks(self):
+        frames = self.frames(self.client.post(f'/api/graph-configs/{self.config.id}/evaluate/?stream=1'))
+        header, *chunks, done = frames
+        self.assertEqual((header['yMin'], header['yStep']), (0, 1))
+        curves = [chunk for chunk in chunks if 'offset' in chunk]
+        blocks = [chunk for chunk in chunks if 'rows' in chunk]
+        self.assertEqual(len(curves) + len(blocks), done['chunks'])
+        for block in blocks:
+            (r0, r1), (c0, c1) = block['rows'], block['columns']
+            # At least two rows, so that mesh blocks have cells
+            self.assertLessEqual((r1 - r0) * (c1 - c0), 2 * 4)
+            value, = block['values']
+            expected = np.arange(c0, c1)[np.newaxis, :] + 10 * np.arange(r0, r1)[:, np.newaxis]
+            self.assertEqual(value['values'], expected.ravel().tolist())
+        covered = {(j, i) for block in blocks for j in range(*block['rows']) for i in range(*block['columns'])}
+        self.assertEqual(covered, {(j, i) for j in range(5) for i in range(10)})
+
+        # Blocks share their edges, so the mesh has every triangle of the full grid
+        frames = self.frames(self.client.get(f'/api/graph-configs/{self.config.id}/mesh/?stream=1'))
+        for equation in (self.curve, self.surface):
+            indices = sum((chunk['indices'] for chunk in frames[1:-1] if chunk['id'] == equation.id), [])
+            self.assertEqual(len(indices), 3 * 2 * 9 * 4)
+
+    def test_error_frames(self):
+        url = f'/api/equations/{self.curve.id}/sample/'
+        timeout = EvaluationError("Evaluation timed out after 1s", 'timeout')
+        with mock.patch('api.streaming.run_job', side_effect=[(np.zeros(4), np.zeros(4)), timeout]):
+            frames = self.frames(self.client.get(url, {'stream': 1}))
+        self.assertEqual(frames[-1], {'error': "Evaluation timed out after 1s", 'code': 'timeout', 'chunks': 1})
+
+        with mock.patch('api.streaming.run_job', side_effect=[(np.zeros(4), np.zeros(4)), RuntimeError]):
+            with self.assertLogs('api.streaming', 'ERROR'):
+                frames = self.frames(self.client.get(url, {'stream': 1}))
+        self.assertEqual(frames[-1], {'error': "Evaluation failed", 'code': 'failed', 'chunks': 1})
+
+        self.config.xStep = 0
+        self.config.save()
+        self.assertEqual(self.client.get(url, {'stream': 1}).status_code, 400)
+
+
+class QueryCountTests(TestCase):
+    """
+    The number of queries of the list endpoints must not grow with the number
+    of graph configs or equations a user has. Reads include one aggregate
+    query for the conditional GET validators.
+    """
+    CONFIGS = 300
+    EQUATIONS_PER_CONFIG = 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='heavy', password='password')
+        cls.other = User.objects.create_user(username='other', password='password')
+        for user in (cls.user, cls.other):
+            configs = GraphConfig.objects.bulk_create([
+                GraphConfig(user=user, name=f"Graph {i}", is_saved=i % 2 == 0)
+                for i in range(cls.CONFIGS)
+            ])
+            Equation.objects.bulk_create([
+                Equation(user=user, graph_config=config, expression=f"sin(x) + {i}")
+                for config in configs
+                for i in range(cls.EQUATIONS_PER_CONFIG)
+            ])
+        cls.config = GraphConfig.objects.filter(user=cls.user).first()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get(self, url, queries):
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_graph_config_list(self):
+        data = self.get('/api/graph-configs/?page_size=1000', 3)
+        self.assertEqual(len(data['results']), self.CONFIGS)
+        self.assertTrue(all(len(config['equations']) == self.EQUATIONS_PER_CONFIG for config in data['results']))
+
+    def test_graph_config_list_pages(self):
+        seen = []
+        url = '/api/graph-configs/'
+        while url:
+            data = self.get(url, 3)
+            self.assertLessEqual(len(data['results']), 100)
+            seen.extend(config['id'] for config in data['results'])
+            url = data['next']
+        self.assertEqual(seen, list(GraphConfig.objects.filter(user=self.user).order_by('created_at', 'id')
+                                    .values_list('id', flat=True)))
+
+    def test_pages_use_the_index(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("Checks SQLite query plans")
+        for model in (GraphConfig, Equation):
+            plan = model.objects.filter(user=self.user).order_by('created_at', 'id')[:100].explain()
+            self.assertIn('_user_id_', plan, model)
+            self.assertNotIn('TEMP B-TREE', plan, model)
+
+    def test_graph_config_sparse_fields(self):
+        data = self.get('/api/graph-configs/?fields=id,name,updated_at', 2)
+        self.assertEqual(set(data['results'][0]), {'id', 'name', 'updated_at'})
+        data = self.get('/api/graph-configs/?fields=id&expand=equations', 3)
+        self.assertEqual(set(data['results'][0]), {'id', 'equations'})
+
+    def test_graph_config_retrieve(self):
+        data = self.get(f'/api/graph-configs/{self.config.id}/', 3)
+        self.assertEqual(len(data['equations']), self.EQUATIONS_PER_CONFIG)
+
+    def test_graph_config_saved(self):
+        data = self.get('/api/graph-configs/saved/?page_size=1000', 3)
+        self.assertEqual(len(data['results']), self.CONFIGS // 2)
+        self.assertTrue(all(config['is_saved'] for config in data['results']))
+
+    def test_graph_config_update(self):
+        # config, equations, savepoint, version bump, UPDATE, release, equations of the response
+        with self.assertNumQueries(7):
+            response = self.client.patch(f'/api/graph-configs/{self.config.id}/', {'name': 'Renamed'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['equations']), self.EQUATIONS_PER_CONFIG)
+
+    def test_equation_list(self):
+        data = self.get('/api/equations/?page_size=1000', 2)
+        self.assertEqual(len(data['results']), self.CONFIGS * self.EQUATIONS_PER_CONFIG)
+        self.assertIsNone(data['next'])
+
+
+class BulkSaveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='importer', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def graph(self, i, equations=3):
+        return {
+            'name': f"Imported {i}",
+            'config': {'xMin': -i, 'xMax': i + 1},
+            'equations': [{'expression': f"x^{n}", 'visible': n % 2 == 0} for n in range(equations)],
+        }
+
+    def test_save_current_inserts_equations_at_once(self):
+        # config INSERT, equations INSERT, savepoint and release, equations SELECT for the response
+        with self.assertNumQueries(5):
+            response = self.client.post('/api/graph-configs/save_current/', self.graph(1, equations=20), format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['equations']), 20)
+        self.assertTrue(response.json()['is_saved'])
+
+    def test_bulk_import(self):
+        graphs = [self.graph(i) for i in range(1200)]
+        response = self.client.post('/api/graph-configs/bulk_import/', {'graphs': graphs}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['imported'], 1200)
+        self.assertEqual(GraphConfig.objects.filter(user=self.user, is_saved=True).count(), 1200)
+        self.assertEqual(Equation.objects.filter(user=self.user).count(), 3600)
+        config = GraphConfig.objects.get(id=response.json()['ids'][7])
+        self.assertEqual((config.name, config.xMin, config.xMax), ("Imported 7", -7, 8))
+        self.assertEqual(config.equations.filter(visible=True).count(), 2)
+
+    def test_bulk_import_validates_every_graph_first(self):
+        graphs = [self.graph(i) for i in range(10)]
+        graphs[4]['config']['xMin'] = 'left'
+        response = self.client.post('/api/graph-configs/bulk_import/', {'graphs': graphs}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('xMin', response.json()['graphs'][4]['config'])
+        self.assertFalse(GraphConfig.objects.exists())
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': False, 'ALIAS': 'default', 'TIMEOUT': 0})
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='poller', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.config = GraphConfig.objects.create(user=self.user, name="Polled", is_saved=True)
+        self.equation = Equation.objects.create(user=self.user, graph_config=self.config, expression="sin(x)")
+
+    def assertNotModified(self, url, **headers):
+        with self.assertNumQueries(1):
+            response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_list_etag(self):
+        for url in ('/api/graph-configs/', '/api/graph-configs/saved/', '/api/equations/'):
+            etag = self.client.get(url)['ETag']
+            self.assertNotModified(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_detail_etag_and_last_modified(self):
+        url = f'/api/graph-configs/{self.config.id}/'
+        response = self.client.get(url)
+        self.assertNotModified(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertNotModified(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+
+    def test_etag_changes_with_the_data(self):
+        list_etag = self.client.get('/api/graph-configs/')['ETag']
+        detail_etag = self.client.get(f'/api/graph-configs/{self.config.id}/')['ETag']
+        fields_etag = self.client.get('/api/graph-configs/?fields=id')['ETag']
+        self.assertNotEqual(list_etag, fields_etag)
+
+        # Editing an equation changes its graph config
+        self.client.patch(f'/api/equations/{self.equation.id}/', {'expression': 'cos(x)'})
+        response = self.client.get('/api/graph-configs/', HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(f'/api/graph-configs/{self.config.id}/', HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['equations'][0]['expression'], 'cos(x)')
+
+        # Deleting a row changes the collection version
+        list_etag = self.client.get('/api/equations/')['ETag']
+        self.equation.delete()
+        response = self.client.get('/api/equations/', HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_missing_object(self):
+        self.assertEqual(self.client.get('/api/graph-configs/999999/').status_code, 404)
+        self.assertEqual(self.client.get('/api/graph-configs/abc/').status_code, 404)
+
+
+@override_settings(RESPONSE_CACHE={'ENABLED': True, 'ALIAS': 'default', 'TIMEOUT': 300})
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='reader', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.config = GraphConfig.objects.create(user=self.user, name="Cached", is_saved=True)
+        self.equation = Equation.objects.create(user=self.user, graph_config=self.config, expression="sin(x)")
+
+    def assertCached(self, url):
+        first = self.client.get(url)
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(first['ETag'], second['ETag'])
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        return second.json()
+
+    def test_reads_are_cached(self):
+        for url in ('/api/graph-configs/', '/api/graph-configs/saved/', f'/api/graph-configs/{self.config.id}/',
+                    '/api/equations/', f'/api/equations/{self.equation.id}/'):
+            self.assertCached(url)
+
+    def test_cache_is_per_media_type(self):
+        url = f'/api/graph-configs/{self.config.id}/'
+        etag = self.client.get(url)['ETag']
+        html = self.client.get(url, HTTP_ACCEPT='text/html')
+        self.assertTrue(html['Content-Type'].startswith('text/html'))
+        self.assertNotEqual(html['ETag'], etag)
+        self.assertEqual(self.client.get(url, HTTP_ACCEPT='text/html', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get(url)['ETag'], etag)
+
+    def test_cache_is_per_user(self):
+        self.assertCached('/api/graph-configs/')
+        other = User.objects.create_user(username='other', password='password')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get('/api/graph-configs/').json()['results'], [])
+
+    def test_equation_changes_invalidate_configs(self):
+        detail = f'/api/graph-configs/{self.config.id}/'
+        self.assertCached('/api/graph-configs/saved/')
+        self.assertCached(detail)
+        self.client.patch(f'/api/equations/{self.equation.id}/', {'expression': 'cos(x)'})
+        self.assertEqual(self.assertCached(detail)['equations'][0]['expression'], 'cos(x)')
+        data = self.assertCached('/api/graph-configs/saved/')
+        self.assertEqual(data['results'][0]['equations'][0]['expression'], 'cos(x)')
+
+        Equation.objects.create(user=self.user, graph_config=self.config, expression="x^2")
+        self.assertEqual(len(self.assertCached(detail)['equations']), 2)
+
+    def test_config_changes_invalidate_lists(self):
+        self.assertCached('/api/graph-configs/saved/')
+        self.assertCached('/api/equations/')
+        self.config.is_saved = False
+        self.config.save()
+        self.assertEqual(self.assertCached('/api/graph-configs/saved/')['results'], [])
+        self.config.delete()
+        self.assertEqual(self.assertCached('/api/equations/')['results'], [])
+        self.assertEqual(self.client.get(f'/api/graph-configs/{self.config.id}/').status_code, 404)
+
+    def test_bulk_saves_invalidate_lists(self):
+        self.assertCached('/api/graph-configs/')
+        response = self.client.post('/api/graph-configs/save_current/', {
+            'config': {}, 'equations': [{'expression': 'x'}]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(self.assertCached('/api/graph-configs/')['results']), 2)
+
+    def test_disabled_without_a_shared_cache(self):
+        url = f'/api/graph-configs/{self.config.id}/'
+        with override_settings(RESPONSE_CACHE={'ENABLED': False, 'ALIAS': 'default', 'TIMEOUT': 300}):
+            cache.clear()
+            self.client.get(url)
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertTrue(queries.captured_queries)
+        self.assertIsNone(cache.get(object_version_key('graph-configs', self.config.id)))
+
+
+@override_settings(TOKEN_CACHE={'ENABLED': True, 'ALIAS': 'default', 'TIMEOUT': 60})
+class CachedTokenAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='token', password='password')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_token_lookup_is_cached(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/auth/').status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/auth/').status_code, 200)
+
+    @override_settings(TOKEN_CACHE={'ENABLED': False, 'ALIAS': 'default', 'TIMEOUT': 60})
+    def test_disabled_without_a_shared_cache(self):
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                self.assertEqual(self.client.get('/api/auth/').status_code, 200)
+
+    def test_cache_holds_no_credentials(self):
+        self.client.get('/api/auth/')
+        values = cache.get(token_cache_key(self.token.key))
+        self.assertEqual(values, {'id': self.user.pk, 'username': 'token', 'is_active': True,
+                                  'is_staff': False, 'is_superuser': False})
+        user, token = CachedTokenAuthentication().authenticate_credentials(self.token.key)
+        self.assertEqual((user.pk, token.key, token.user_id), (self.user.pk, self.token.key, self.user.pk))
+        self.assertEqual(user.get_deferred_fields(), {'password', 'last_login', 'first_name', 'last_name',
+                                                      'email', 'date_joined'})
+
+    def test_cached_user_can_write(self):
+        self.client.get('/api/auth/')
+        # The insert and the equations of the response, the user is not loaded
+        with self.assertNumQueries(2):
+            response = self.client.post('/api/graph-configs/', {'name': "Mine"}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(GraphConfig.objects.get(name="Mine").user, self.user)
+        user, _ = CachedTokenAuthentication().authenticate_credentials(self.token.key)
+        user.first_name = "Renamed"
+        user.save()
+        self.assertTrue(User.objects.get(pk=self.user.pk).check_password('password'))
+
+    def test_deleted_token_is_rejected(self):
+        self.client.get('/api/auth/')
+        self.token.delete()
+        self.assertEqual(self.client.get('/api/auth/').status_code, 401)
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get('/api/auth/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/auth/').status_code, 401)
+
+    def test_regenerated_token(self):
+        response = self.client.post('/api/auth/login/', {'username': 'token', 'password': 'password'})
+        self.assertEqual(response.json()['token'], self.token.key)
+        self.client.get('/api/auth/')
+        self.token.delete()
+        self.assertEqual(self.client.get('/api/auth/').status_code, 401)
+        self.client.credentials()
+        key = self.client.post('/api/auth/token/', {'username': 'token', 'password': 'password'}).json()['token']
+        self.assertNotEqual(key, self.token.key)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {key}')
+        self.assertEqual(self.client.get('/api/auth/').status_code, 200)
+
+
+@override_settings(EVALUATION_POOL={'WORKERS': 0})
+class AsyncEndpointTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='async', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.config = GraphConfig.objects.create(user=self.user, xStep=0.5, yStep=0.5)
+        self.curve = Equation.objects.create(user=self.user, graph_config=self.config, expression="sin(x)")
+        Equation.objects.create(user=self.user, graph_config=self.config, expression="x*y")
+
+    def test_matches_sync_endpoints(self):
+        for sync_url, async_url, method in [
+            (f'/api/equations/{self.curve.id}/sample/', f'/api/async/equations/{self.curve.id}/sample/', 'get'),
+            (f'/api/graph-configs/{self.config.id}/mesh/', f'/api/async/graph-configs/{self.config.id}/mesh/', 'get'),
+            (f'/api/graph-configs/{self.config.id}/evaluate/',
+             f'/api/async/graph-configs/{self.config.id}/evaluate/', 'post'),
+        ]:
+            expected = getattr(self.client, method)(sync_url)
+            response = getattr(self.client, method)(async_url)
+            self.assertEqual(response.status_code, 200, async_url)
+            self.assertEqual(response.json(), expected.json())
+
+    def test_errors_match_sync_endpoints(self):
+        for suffix, method, data in [
+            (f'equations/{self.curve.id}/sample/?sampling=spline', 'get', None),
+            (f'equations/{self.curve.id}/sample/?sampling=adaptive&max_points=x', 'get', None),
+            (f'graph-configs/{self.config.id}/evaluate/', 'post', {'xStep': 'wide'}),
+        ]:
+            expected = getattr(self.client, method)('/api/' + suffix, data, format='json')
+            response = getattr(self.client, method)('/api/async/' + suffix, data, format='json')
+            self.assertEqual(response.status_code, 400, suffix)
+            self.assertEqual(response.json(), expected.json())
+
+    def test_uses_artifacts(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        get_cache('ARTIFACTS').clear()
+        self.addCleanup(get_cache('ARTIFACTS').clear)
+        with override_settings(ARTIFACTS={
+                'ENABLED': True, 'STORAGE': 'django.core.files.storage.FileSystemStorage',
+                'OPTIONS': {'location': root.name}, 'MIN_POINTS': 0, 'REDIRECT': False, 'MAX_ENTRIES': 100}):
+            for suffix in (f'equations/{self.curve.id}/sample/', f'graph-configs/{self.config.id}/mesh/'):
+                with mock.patch('api.async_views.arun_job') as job:
+                    expected = self.client.get('/api/' + suffix, HTTP_ACCEPT='application/octet-stream')
+                    response = self.client.get('/api/async/' + suffix, HTTP_ACCEPT='application/octet-stream')
+                    job.assert_not_called()
+                self.assertEqual(response.content, expected.content)
+                self.assertEqual(response['ETag'], expected['ETag'])
+
+    def test_requires_the_owner(self):
+        url = f'/api/async/equations/{self.curve.id}/sample/'
+        self.assertEqual(APIClient().get(url).status_code, 401)
+        self.client.force_authenticate(User.objects.create_user(username='other', password='password'))
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+def _spin(seconds):
+    """Busy Python loop: a worker pool job that uses CPU time"""
+    end = time.process_time() + seconds
+    while time.process_time() < end:
+        pass
+    return seconds
+
+
+class WorkerPoolTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.pool = WorkerPool(workers=1, timeout=5, cpu_time=1, memory_bytes=None, max_jobs=0, queue_timeout=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+        super().tearDownClass()
+
+    def assertFails(self, code, func, *args, **kwargs):
+        with self.assertRaises(EvaluationError) as raised:
+            self.pool.run(func, *args, **kwargs)
+        self.assertEqual(raised.exception.code, code)
+        self.assertEqual(error_data(raised.exception)['code'], code)
+        return raised.exception
+
+    def test_failures_are_reported_and_workers_replaced(self):
+        self.assertEqual(self.pool.run(sum, [1, 2, 3]), 6)
+        self.assertFails('timeout', time.sleep, 30, timeout=0.5)
+        self.assertFails('cpu_limit', _spin, 30)
+        self.assertEqual(self.assertFails('worker_crashed', os._exit, 1).status_code, 503)
+        self.assertFails('failed', int, 'not a number')
+        with self.assertRaises(ExpressionError):
+            self.pool.run(compile_expression, "sin(")
+        # The worker that ran out of CPU time or crashed was replaced
+        self.assertEqual(self.pool.run(_spin, 0.1), 0.1)
+        self.assertEqual(self.pool.stats()['idle'], 1)
+
+    def test_unpicklable_arguments_keep_the_slot(self):
+        for _ in range(3):
+            with self.assertRaises(Exception):
+                self.pool.run(len, lambda: None)
+            with self.assertRaises(Exception):
+                asyncio.run(self.pool.arun(len, lambda: None))
+        self.assertEqual(self.pool.run(len, [1, 2]), 2)
+
+    def test_busy(self):
+        async def two_jobs():
+            return await asyncio.gather(self.pool.arun(time.sleep, 2), self.pool.arun(sum, []),
+                                        return_exceptions=True)
+
+        slow, busy = asyncio.run(two_jobs())
+        self.assertIsNone(slow)
+        self.assertEqual(busy.code, 'busy')
+
+    def test_cancelling_kills_the_worker(self):
+        pool = WorkerPool(workers=1, timeout=30, cpu_time=30, memory_bytes=None, max_jobs=0, queue_timeout=5)
+        self.addCleanup(pool.close)
+
+        async def cancel_slow_job():
+            await pool.arun(sum, [])  # start the worker
+            job = asyncio.ensure_future(pool.arun(time.sleep, 30))
+            await asyncio.sleep(0.5)
+            job.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await job
+            return await pool.arun(sum, [1, 2, 3])
+
+        start = time.perf_counter()
+        self.assertEqual(asyncio.run(cancel_slow_job()), 6)
+        self.assertLess(time.perf_counter() - start, 15)
+        self.assertEqual(pool.stats()['recycled'], 1)
+
+    def test_cancelling_while_starting_kills_the_new_worker(self):
+        pool = WorkerPool(workers=1, timeout=30, cpu_time=30, memory_bytes=None, max_jobs=0, queue_timeout=5)
+        self.addCleanup(pool.close)
+        started = []
+        start = pool._start
+
+        def slow_start():
+            time.sleep(0.5)
+            started.append(start())
+            return started[-1]
+
+        async def cancel_while_starting():
+            with mock.patch.object(pool, '_start', slow_start):
+                job = asyncio.ensure_future(pool.arun(sum, []))
+                await asyncio.sleep(0.1)
+                job.cancel()
+                with self.assertRaises(asyncio.CancelledError):
+                    await job
+                # The slot comes back once the start finishes
+                return await pool.arun(sum, [1, 2, 3])
+
+        self.assertEqual(asyncio.run(cancel_while_starting()), 6)
+        self.assertEqual(len(started), 2)
+        self.assertFalse(started[0].process.is_alive())
+        self.assertEqual(pool.stats()['recycled'], 1)
+
+
+class GraphPatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='editor', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.config = GraphConfig.objects.create(user=self.user, name="Edited")
+        self.first, self.second, self.third = [
+            Equation.objects.create(user=self.user, graph_config=self.config, expression=expression)
+            for expression in ("sin(x)", "cos(x)", "tan(x)")
+        ]
+        self.url = f'/api/graph-configs/{self.config.id}/patch/'
+
+    def version(self):
+        return GraphConfig.objects.get(pk=self.config.pk).version
+
+    def patch(self, operations, version=None):
+        return self.client.post(self.url, {
+            'version': self.version() if version is None else version,
+            'operations': operations,
+        }, format='json')
+
+    def test_operations(self):
+        detail = self.client.get(f'/api/graph-configs/{self.config.id}/').json()
+        version = self.version()
+        response = self.patch([
+            {'op': 'update', 'id': self.first.id, 'fields': {'expression': 'sin(2x)'}},
+            {'op': 'update', 'fields': {'xMax': 20, 'name': 'Renamed'}},
+            {'op': 'remove', 'id': self.second.id},
+            {'op': 'add', 'ref': 'new-1', 'fields': {'expression': 'x^2', 'color': '#000000'}},
+            {'op': 'reorder', 'order': [self.third.id, self.first.id]},
+        ])
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertGreater(data['version'], version)
+        self.assertEqual(data['version'], self.version())
+        self.assertEqual(data['config'], {'name': 'Renamed', 'xMax': 20.0})
+        self.assertEqual(data['removed'], [self.second.id])
+        self.assertEqual(sorted(equation['id'] for equation in data['equations']),
+                         sorted([self.first.id, self.third.id, data['created']['new-1']]))
+
+        detail = self.client.get(f'/api/graph-configs/{self.config.id}/').json()
+        self.assertEqual(detail['name'], 'Renamed')
+        self.assertEqual(detail['version'], data['version'])
+        self.assertEqual([equation['expression'] for equation in detail['equations']],
+                         ['tan(x)', 'sin(2x)', 'x^2'])
+
+    def test_stale_version_conflicts(self):
+        version = self.version()
+        self.assertEqual(self.patch([{'op': 'remove', 'id': self.first.id}], version).status_code, 200)
+        response = self.patch([{'op': 'remove', 'id': self.second.id}], version)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['version'], self.version())
+        self.assertTrue(Equation.objects.filter(pk=self.second.id).exists())
+
+    def test_full_updates_move_the_version_on(self):
+        url = f'/api/graph-configs/{self.config.id}/'
+        version = self.version()
+        response = self.client.put(url, {'name': "Replaced"}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['version'], version + 1)
+        self.assertEqual(self.version(), version + 1)
+
+    def test_full_update_racing_a_patch_conflicts(self):
+        url = f'/api/graph-configs/{self.config.id}/'
+        read = GraphConfigViewSet.get_object
+
+        def get_object(view):
+            config = read(view)
+            if view.action == 'update':
+                # A patch lands between the read and the write
+                self.patch([{'op': 'update', 'fields': {'name': 'Patched'}}])
+            return config
+
+        with mock.patch.object(GraphConfigViewSet, 'get_object', get_object):
+            response = self.client.put(url, {'name': "Replaced"}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['version'], self.version())
+        self.assertEqual(GraphConfig.objects.get(pk=self.config.pk).name, 'Patched')
+
+    def test_reorder_lists_every_equation_once(self):
+        self.patch([{'op': 'reorder', 'order': [self.first.id, self.second.id, self.third.id]}])
+        version = self.version()
+        for order in ([self.third.id], [self.first.id, self.first.id, self.second.id, self.third.id]):
+            response = self.patch([{'op': 'reorder', 'order': order}])
+            self.assertEqual(response.status_code, 400, order)
+            self.assertIn('every equation', str(response.json()))
+        self.assertEqual(self.version(), version)
+        self.assertEqual(list(self.config.equations.values_list('position', flat=True)), [0, 1, 2])
+
+        response = self.patch([
+            {'op': 'remove', 'id': self.second.id},
+            {'op': 'reorder', 'order': [self.third.id, self.first.id]},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(self.config.equations.values_list('id', 'position')),
+                         [(self.third.id, 0), (self.first.id, 1)])
+
+    def test_removals_move_the_version_on_once(self):
+        version = self.version()
+        # config, savepoint, version bump, equations, DELETE, release
+        with self.assertNumQueries(6):
+            response = self.patch([{'op': 'remove', 'id': equation.id}
+                                   for equation in (self.first, self.second, self.third)], version)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['version'], version + 1)
+        self.assertEqual(self.version(), version + 1)
+        self.assertFalse(self.config.equations.exists())
+
+    def test_invalid_operations_change_nothing(self):
+        other = GraphConfig.objects.create(user=self.user)
+        foreign = Equation.objects.create(user=self.user, graph_config=other, expression="x")
+        version = self.version()
+        response = self.patch([
+            {'op': 'remove', 'id': self.first.id},
+            {'op': 'update', 'id': foreign.id, 'fields': {'expression': 'y'}},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.version(), version)
+        self.assertTrue(Equation.objects.filter(pk=self.first.id).exists())
+
+        response = self.patch([{'op': 'update', 'id': self.first.id, 'fields': {'visible': 'maybe'}}])
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('visible', str(response.json()))
+
+    def test_query_count(self):
+        operations = [{'op': 'update', 'id': equation.id, 'fields': {'color': '#ffffff'}}
+                      for equation in (self.first, self.second, self.third)]
+        operations += [{'op': 'add', 'fields': {'expression': f'x+{i}'}} for i in range(10)]
+        version = self.version()
+        # config, savepoint, version bump, equations, last position, UPDATE, INSERT, release
+        with self.assertNumQueries(8):
+            response = self.patch(operations, version)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['equations']), 13)
+
+
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name, EVALUATION_POOL={'WORKERS': 0})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user(username='gallery', password='password')
+        self.config = GraphConfig.objects.create(user=self.user)
+        for expression, color in (("sin(x)", "#ff0000"), ("x^2+y^2+z^2=25", "#00ff00"), ("x*y", "#0000ff")):
+            Equation.objects.create(user=self.user, graph_config=self.config, expression=expression, color=color)
+
+    def test_render(self):
+        png = render_thumbnail([-10, 10, -10, 10, -10, 10], True,
+                               [("sin(x)", "#ff0000"), ("x^2+y^2+z^2=25", "#00ff00"), ("x +", "#000000")], 64)
+        image = Image.open(io.BytesIO(png))
+        self.assertEqual((image.format, image.size), ('PNG', (64, 64)))
+        colors = {color for _, color in image.convert('RGB').getcolors(64 * 64)}
+        self.assertIn((255, 0, 0), colors)
+        self.assertIn((0, 255, 0), colors)
+
+    def test_unchanged_graphs_are_not_rendered_again(self):
+        with mock.patch('api.thumbnails.render_thumbnail', wraps=render_thumbnail) as render:
+            update_thumbnail(self.config.pk)
+            update_thumbnail(self.config.pk)
+            self.assertEqual(render.call_count, 1)
+            config = GraphConfig.objects.get(pk=self.config.pk)
+            self.assertTrue(default_storage.exists(config.thumbnail.name))
+
+            # A copy with the same content shares the stored image
+            copy = GraphConfig.objects.create(user=self.user, name="Copy")
+            for equation in self.config.equations.all():
+                Equation.objects.create(user=self.user, graph_config=copy, expression=equation.expression,
+                                        color=equation.color)
+            update_thumbnail(copy.pk)
+            self.assertEqual(render.call_count, 1)
+            self.assertEqual(GraphConfig.objects.get(pk=copy.pk).thumbnail.name, config.thumbnail.name)
+
+            Equation.objects.filter(graph_config=self.config, expression="x*y").update(visible=False)
+            update_thumbnail(self.config.pk)
+            self.assertEqual(render.call_count, 2)
+            self.assertNotEqual(GraphConfig.objects.get(pk=self.config.pk).thumbnail.name, config.thumbnail.name)
+
+    def test_serialized_url(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = f'/api/graph-configs/{self.config.id}/'
+        self.assertIsNone(client.get(url).json()['thumbnail'])
+        update_thumbnail(self.config.pk)
+        thumbnail = client.get(url).json()['thumbnail']
+        self.assertRegex(thumbnail, r'^http://testserver/media/thumbnails/[0-9a-f]{64}\.png$')
+
+
+class ArtifactTests(TestCase):
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        self.artifacts = {
+            'ENABLED': True,
+            'STORAGE': 'django.core.files.storage.FileSystemStorage',
+            'OPTIONS': {'location': root.name, 'base_url': '/media/artifacts/'},
+            'MIN_POINTS': 0,
+            'REDIRECT': False,
+            'MAX_ENTRIES': 100,
+        }
+        settings_override = override_settings(ARTIFACTS=self.artifacts, EVALUATION_POOL={'WORKERS': 0})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        get_cache('ARTIFACTS').clear()
+        self.addCleanup(get_cache('ARTIFACTS').clear)
+        self.user = User.objects.create_user(username='artifacts', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.config = GraphConfig.objects.create(user=self.user, xStep=0.5, yStep=0.5)
+        self.curve = Equation.objects.create(user=self.user, graph_config=self.config, expression="sin(x)")
+        Equation.objects.create(user=self.user, graph_config=self.config, expression="x*y")
+
+    def get(self, url):
+        return self.client.get(url, HTTP_ACCEPT='application/octet-stream')
+
+    def test_repeat_requests_use_the_stored_artifact(self):
+        url = f'/api/equations/{self.curve.id}/sample/'
+        with mock.patch('api.views.run_job', wraps=run_job) as job:
+            first = self.get(url)
+            self.assertEqual(first.status_code, 200)
+            self.assertTrue(first.content.startswith(b'D3DB'))
+            self.assertEqual(self.get(url).content, first.content)
+            # As after a restart, or on another node
+            get_cache('ARTIFACTS').clear()
+            self.assertEqual(self.get(url).content, first.content)
+            self.assertEqual(job.call_count, 1)
+
+            # Equal expressions share the artifact, other bounds do not
+            other = Equation.objects.create(user=self.user, graph_config=self.config, expression="sin( x )")
+            self.assertEqual(self.get(f'/api/equations/{other.id}/sample/').content, first.content)
+            self.assertEqual(job.call_count, 1)
+            GraphConfig.objects.filter(pk=self.config.pk).update(xMax=5)
+            self.assertNotEqual(self.get(url).content, first.content)
+            self.assertEqual(job.call_count, 2)
+
+        # JSON responses are computed as before
+        self.assertEqual(self.client.get(url).json()['id'], self.curve.id)
+
+    def test_mesh_and_redirect(self):
+        self.artifacts['REDIRECT'] = True
+        response = self.get(f'/api/graph-configs/{self.config.id}/mesh/')
+        self.assertEqual(response.status_code, 302)
+        self.assertRegex(response['Location'], r'^/media/artifacts/meshes/[0-9a-f]{64}\.d3db$')
+        name = response['Location'][len('/media/artifacts/'):]
+        with get_artifact_storage().open(name) as artifact:
+            self.assertTrue(artifact.read().startswith(b'D3DB'))
+
+    def test_small_and_invalid_requests_are_not_stored(self):
+        self.artifacts['MIN_POINTS'] = 10 ** 6
+        self.assertEqual(self.get(f'/api/equations/{self.curve.id}/sample/').status_code, 200)
+        self.artifacts['MIN_POINTS'] = 0
+        invalid = Equation.objects.create(user=self.user, graph_config=self.config, expression="x +")
+        self.assertEqual(self.get(f'/api/equations/{invalid.id}/sample/').status_code, 400)
+        self.assertEqual(get_artifact_storage().listdir('')[1], [])
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        get_registry().clear()
+        self.user = User.objects.create_user(username='observed', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        config = GraphConfig.objects.create(user=self.user)
+        Equation.objects.create(user=self.user, graph_config=config, expression="sin(x)")
+
+    def test_metrics_endpoint(self):
+        self.client.get('/api/graph-configs/')
+        self.client.get('/api/graph-configs/')
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+
+        self.client.force_authenticate(User.objects.create_superuser(username='admin', password='password'))
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('desmos3d_requests_total{view="graph-config-list",method="GET",status="200"} 2\n', text)
+        self.assertIn('desmos3d_request_duration_seconds_bucket{view="graph-config-list",le="+Inf"} 2\n', text)
+        self.assertIn('desmos3d_requests_total{view="metrics",method="GET",status="403"} 1\n', text)
+        values = {line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1])
+                  for line in text.splitlines() if not line.startswith('#')}
+        self.assertGreater(values['desmos3d_sql_queries_total{view="graph-config-list"}'], 0)
+        self.assertGreater(values['desmos3d_serializer_duration_seconds_total{view="graph-config-list"}'], 0)
+        self.assertGreater(values['desmos3d_response_bytes_total{view="graph-config-list"}'], 0)
+
+    @override_settings(METRICS={'BUCKETS': (1,), 'SLOW_REQUEST_SECONDS': 1e-9, 'SLOW_REQUEST_QUERIES': 2})
+    def test_slow_request_log(self):
+        with self.assertLogs('api.metrics', 'WARNING') as logs:
+            self.client.get('/api/equations/')
+        self.assertIn('Slow request GET /api/equations/ (equation-list)', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    def test_rejected_registrations_are_logged(self):
+        for body in ({'username': '', 'password': 'password'}, ['username'], 'username'):
+            with self.assertLogs('api.views', 'INFO') as logs:
+                response = self.client.post('/api/auth/register/', body, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn("Registration rejected", logs.output[0])
+            self.assertNotIn('password', logs.output[0])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='searcher', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.config = GraphConfig.objects.create(user=self.user, name="Waves", description="Sine and cosine",
+                                                 is_saved=True)
+        GraphConfig.objects.create(user=self.user, name="Paraboloid")
+        for expression in ("sin(x)*cos(y)", "x^2 + y^2", "tan(x)"):
+            Equation.objects.create(user=self.user, graph_config=self.config, expression=expression)
+        other = User.objects.create_user(username='other', password='password')
+        Equation.objects.create(user=other, expression="cos(x)")
+
+    def expressions(self, search):
+        response = self.client.get('/api/equations/', {'search': search})
+        self.assertEqual(response.status_code, 200)
+        return sorted(equation['expression'] for equation in response.json()['results'])
+
+    def test_equation_search(self):
+        self.assertIn('MATCH', str(search(Equation.objects.all(), 'cos').query))
+        self.assertEqual(self.expressions('COS'), ['sin(x)*cos(y)'])
+        self.assertEqual(self.expressions('sin cos(y'), ['sin(x)*cos(y)'])
+        self.assertEqual(self.expressions('x^'), ['x^2 + y^2'])
+        self.assertEqual(self.expressions('"'), [])
+
+        # Bulk writes reach the index through the triggers
+        Equation.objects.filter(expression="tan(x)").update(expression="cosh(x)")
+        self.assertEqual(self.expressions('cos'), ['cosh(x)', 'sin(x)*cos(y)'])
+        Equation.objects.filter(expression="cosh(x)").delete()
+        self.assertEqual(self.expressions('cos'), ['sin(x)*cos(y)'])
+
+    def test_graph_config_search(self):
+        def names(url, search):
+            return [config['name'] for config in self.client.get(url, {'search': search}).json()['results']]
+
+        self.assertEqual(names('/api/graph-configs/', 'sine'), ['Waves'])
+        self.assertEqual(names('/api/graph-configs/', 'bolo'), ['Paraboloid'])
+        self.assertEqual(names('/api/graph-configs/saved/', 'wav'), ['Waves'])
+        self.assertEqual(names('/api/graph-configs/saved/', 'bolo'), [])
+
+    def test_admin_search(self):
+        self.client.force_login(User.objects.create_superuser(username='admin', password='password'))
+        response = self.client.get('/admin/api/equation/', {'q': 'cos'})
+        self.assertContains(response, 'sin(x)*cos(y)')
+        self.assertEqual(response.context['cl'].result_count, 2)
+        response = self.client.get('/admin/api/graphconfig/', {'q': 'searcher'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+        response = self.client.get('/admin/api/graphconfig/', {'q': 'searcher wave'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+    def test_repair_triggers(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER api_equation_fts_insert")
+        Equation.objects.create(user=self.user, expression="acos(x)")
+        repair_sqlite_triggers()
+        Equation.objects.create(user=self.user, expression="cos(2x)")
+        self.assertEqual(self.expressions('cos'), ['acos(x)', 'cos(2x)', 'sin(x)*cos(y)'])
+
+
+class SharedGraphTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='sharer', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.config = GraphConfig.objects.create(user=self.user, name="Waves", xMax=5)
+        Equation.objects.create(user=self.user, graph_config=self.config, expression="sin(x)", position=0)
+        Equation.objects.create(user=self.user, graph_config=self.config, expression="x*y",
+                                color="#e74c3c", position=1)
+        self.url = f'/api/graph-configs/{self.config.id}/share/'
+
+    def test_publish_and_fetch(self):
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 201)
+        key = response.json()['key']
+        self.assertEqual(response.json()['url'], f'http://testserver/api/shared/{key}/')
+
+        anonymous = APIClient()
+        with self.assertNumQueries(1):
+            shared = anonymous.get(f'/api/shared/{key}/', HTTP_AUTHORIZATION='Token invalid')
+        self.assertEqual(shared.status_code, 200)
+        self.assertEqual(shared['Cache-Control'], 'public, max-age=60, s-maxage=600')
+        self.assertRegex(shared['ETag'], r'^"[0-9a-f]{64}"$')
+        # Nothing the response varies with but the CORS origin
+        self.assertNotRegex(shared.get('Vary', ''), '(?i)accept|cookie|authorization')
+        data = shared.json()
+        self.assertEqual(data['name'], "Waves")
+        self.assertEqual(data['config']['xMax'], 5)
+        self.assertEqual([eq['expression'] for eq in data['equations']], ["sin(x)", "x*y"])
+        self.assertEqual(data['equations'][1]['color'], "#e74c3c")
+
+        with self.assertNumQueries(1):
+            revalidated = anonymous.get(f'/api/shared/{key}/', HTTP_IF_NONE_MATCH=shared['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated['ETag'], shared['ETag'])
+
+        # The body saves a copy as is
+        copy = self.client.post('/api/graph-configs/save_current/', data, format='json')
+        self.assertEqual(copy.status_code, 201)
+        self.assertEqual(len(copy.json()['equations']), 2)
+
+    def test_snapshots_are_immutable(self):
+        first = self.client.post(self.url).json()
+        # Publishing an unchanged graph again gives the same link
+        again = self.client.post(self.url)
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.json()['key'], first['key'])
+
+        self.config.equations.filter(position=0).update(expression="cos(x)")
+        second = self.client.post(self.url).json()
+        self.assertNotEqual(second['key'], first['key'])
+        self.assertNotEqual(second['etag'], first['etag'])
+        self.assertEqual(self.client.get(f"/api/shared/{first['key']}/").json()['equations'][0]['expression'],
+                         "sin(x)")
+        self.assertEqual(self.client.get(f"/api/shared/{second['key']}/").json()['equations'][0]['expression'],
+                         "cos(x)")
+
+        # Deleting the graph revokes its links
+        self.config.delete()
+        self.assertFalse(SharedGraph.objects.exists())
+        self.assertEqual(self.client.get(f"/api/shared/{first['key']}/").status_code, 404)
+
+    def test_revoke_and_permissions(self):
+        key = self.client.post(self.url).json()['key']
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user(username='other-sharer', password='password'))
+        self.assertEqual(other.post(self.url).status_code, 404)
+        self.assertEqual(other.delete(self.url).status_code, 404)
+
+        self.assertEqual(self.client.delete(self.url).json(), {'revoked': 1})
+        self.assertFalse(SharedGraph.objects.exists())
+        response = self.client.get(f'/api/shared/{key}/')
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('Cache-Control', response)
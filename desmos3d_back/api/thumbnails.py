@@ -0,0 +1,200 @@
+"""
+PNG previews of graph configs for the saved-graphs gallery.
+
+A thumbnail is a top-down view of the config's x/y bounds: curves y = f(x)
+are drawn as lines, surfaces z = f(x, y) as a height-shaded fill and
+implicit surfaces F(x, y, z) = 0 as their z = 0 cross-section. It is
+rendered by an evaluation job and stored through the default file storage
+under ``thumbnails/<digest>.png``, the digest covering everything that
+affects the picture, so an unchanged graph is never rendered twice.
+
+Rendering happens in a background thread after the saving transaction
+commits (see ``schedule_thumbnail``); ``GraphConfig.thumbnail`` is set when
+the file is stored.
+"""
+import hashlib
+import io
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image
+
+from .cache import get_compiled_expression
+from .expressions import ExpressionError
+from .workers import run_job
+
+logger = logging.getLogger(__name__)
+
+# Part of every digest: bump it when the rendering changes to re-render all thumbnails
+RENDER_VERSION = 1
+BACKGROUND = (255, 255, 255)
+GRID_COLOR = (230, 230, 230)
+AXIS_COLOR = (150, 150, 150)
+DEFAULT_COLOR = (52, 152, 219)  # #3498db, the default equation color
+GRID_LINES = 8
+
+
+def _parse_color(color):
+    """RGB of a #rrggbb or #rgb color, or the default equation color"""
+    value = (color or '').lstrip('#')
+    if len(value) == 3:
+        value = ''.join(c * 2 for c in value)
+    try:
+        return tuple(bytes.fromhex(value)) if len(value) == 6 else DEFAULT_COLOR
+    except ValueError:
+        return DEFAULT_COLOR
+
+
+def _grid_step(span):
+    """A 1, 2 or 5 times power of ten step giving about GRID_LINES lines across ``span``"""
+    raw = span / GRID_LINES
+    power = 10.0 ** np.floor(np.log10(raw))
+    return power * min((1, 2, 5, 10), key=lambda factor: abs(factor * power - raw))
+
+
+def _draw_grid(image, x, y):
+    for axis, values in ((1, x), (0, y)):
+        step = _grid_step(abs(values[-1] - values[0]))
+        cells = np.floor(values / step)
+        lines = np.flatnonzero(np.diff(cells)) + 1
+        zero = np.flatnonzero(np.diff(np.sign(values)))
+        for positions, color in ((lines, GRID_COLOR), (zero, AXIS_COLOR)):
+            if axis == 1:
+                image[:, positions] = color
+            else:
+                image[positions, :] = color
+
+
+def _draw_curve(image, x_min, x_max, y_min, y_max, compiled, color):
+    height, width, _ = image.shape
+    oversample = 4
+    xs = np.linspace(x_min, x_max, width * oversample)
+    rows = (y_max - compiled.evaluate(x=xs)) / (y_max - y_min) * (height - 1)
+    columns = np.arange(len(xs)) // oversample
+    low = np.minimum(rows[:-1], rows[1:])
+    high = np.maximum(rows[:-1], rows[1:])
+    # Skip non-finite samples and near-vertical jumps (asymptotes)
+    keep = np.isfinite(low) & np.isfinite(high) & (high - low < height / 2) & (high >= 0) & (low <= height - 1)
+    for column, start, stop in zip(columns[:-1][keep], np.floor(low[keep]), np.ceil(high[keep])):
+        image[max(int(start), 0):min(int(stop), height - 1) + 1, column] = color
+
+
+def render_thumbnail(bounds, grid_visible, equations, size):
+    """
+    Evaluation job: PNG bytes of a ``size`` x ``size`` preview of the
+    ``equations``, a list of (expression, color), inside ``bounds``
+    (xMin, xMax, yMin, yMax, zMin, zMax). Invalid equations are skipped.
+    """
+    x_min, x_max, y_min, y_max, z_min, z_max = bounds
+    image = np.empty((size, size, 3), dtype=np.float64)
+    image[:] = BACKGROUND
+    x = np.linspace(x_min, x_max, size)
+    y = np.linspace(y_max, y_min, size)  # top row first
+    if grid_visible:
+        _draw_grid(image, x, y)
+
+    with np.errstate(all='ignore'):
+        for expression, color in equations:
+            try:
+                compiled = get_compiled_expression(expression)
+            except ExpressionError:
+                continue
+            rgb = np.array(_parse_color(color), dtype=np.float64)
+            if compiled.kind == 'curve':
+                _draw_curve(image, x_min, x_max, y_min, y_max, compiled, rgb)
+            elif compiled.kind == 'surface':
+                z = compiled.evaluate(x=x[np.newaxis, :], y=y[:, np.newaxis])
+                inside = np.isfinite(z) & (z >= z_min) & (z <= z_max)
+                # Higher points are drawn more opaque
+                alpha = 0.25 + 0.6 * (z[inside] - z_min) / max(z_max - z_min, 1e-300)
+                image[inside] = image[inside] * (1 - alpha[:, np.newaxis]) + rgb * alpha[:, np.newaxis]
+            else:
+                field = compiled.evaluate(x=x[np.newaxis, :], y=y[:, np.newaxis], z=np.float64(0))
+                negative = field < 0
+                edge = np.zeros_like(negative)
+                edge[:, 1:] |= negative[:, 1:] != negative[:, :-1]
+                edge[1:, :] |= negative[1:, :] != negative[:-1, :]
+                image[edge & np.isfinite(field)] = rgb
+
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(image, 0, 255).astype(np.uint8)).save(buffer, format='PNG', optimize=True)
+    return buffer.getvalue()
+
+
+def _render_arguments(config):
+    equations = [(equation.expression, equation.color)
+                 for equation in config.equations.all() if equation.visible]
+    bounds = [config.xMin, config.xMax, config.yMin, config.yMax, config.zMin, config.zMax]
+    return bounds, config.gridVisible, equations, settings.THUMBNAILS['SIZE']
+
+
+def thumbnail_name(config):
+    """Storage name of the thumbnail of ``config`` in its current state"""
+    key = json.dumps([RENDER_VERSION, *_render_arguments(config)], separators=(',', ':'))
+    return 'thumbnails/{}.png'.format(hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+
+def update_thumbnail(config_id):
+    """Render and store the thumbnail of a config if it changed, and point the config at it"""
+    from .models import GraphConfig
+    from .response_cache import invalidate, collection_version_key, object_version_key
+
+    config = GraphConfig.objects.prefetch_related('equations').filter(pk=config_id).first()
+    if config is None:
+        return
+    name = thumbnail_name(config)
+    if config.thumbnail.name == name:
+        return
+    if not default_storage.exists(name):
+        png = run_job(render_thumbnail, *_render_arguments(config))
+        stored = default_storage.save(name, ContentFile(png))
+        if stored != name:
+            # Rendered concurrently by another process: keep one copy
+            default_storage.delete(stored)
+    # A plain UPDATE: the thumbnail is not an edit, so the version (and post_save) stay out of it,
+    # but updated_at moves for conditional GETs
+    GraphConfig.objects.filter(pk=config_id).update(thumbnail=name, updated_at=timezone.now())
+    invalidate(collection_version_key(config.user_id, 'graph-configs'),
+               object_version_key('graph-configs', config_id))
+
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def _run(config_id):
+    with _lock:
+        _pending.discard(config_id)
+    try:
+        update_thumbnail(config_id)
+    except Exception:
+        logger.exception("Rendering the thumbnail of graph config %s failed", config_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_thumbnail(config_id):
+    """Render the thumbnail of a config in the background once the current transaction commits"""
+    if not settings.THUMBNAILS['ENABLED']:
+        return
+
+    def submit():
+        global _executor
+        with _lock:
+            if config_id in _pending:
+                return
+            _pending.add(config_id)
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='thumbnails')
+        _executor.submit(_run, config_id)
+
+    transaction.on_commit(submit)
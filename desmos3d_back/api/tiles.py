@@ -0,0 +1,156 @@
+"""
+Tile-based evaluation for pan and zoom.
+
+The plane is split into power-of-two tiles: at level ``L`` a tile is
+``2 ** -L`` units wide and tile ``i`` covers ``[i * w, (i + 1) * w]``. A
+viewport picks the level at which it spans a few tiles, so zooming walks the
+levels of a binary tree (quadtree for surfaces) and panning reuses the tiles
+already computed. Tiles are keyed by (expression digest, level, index) in the
+process-wide TILE_CACHE, and a viewport request evaluates only the missing
+ones, in a single worker pool job.
+"""
+import math
+
+import numpy as np
+
+from .cache import get_cache, get_compiled_expression
+from .expressions import ExpressionError
+from .sampling import grid_mesh
+from .workers import run_job
+
+# Samples along each tile edge; both edges are included so neighbours share a point
+CURVE_TILE_SAMPLES = 256
+SURFACE_TILE_SAMPLES = 64
+# Target number of tiles across the viewport
+TILES_ACROSS = 4
+# Tiles are at least 1/8 of the viewport wide, and the viewport may straddle one more
+MAX_TILES_ACROSS = 2 * TILES_ACROSS + 1
+MIN_LEVEL = -30
+MAX_LEVEL = 40
+
+
+def tile_level(span):
+    """Zoom level whose tiles are between 1/8 and 1/4 of ``span`` wide"""
+    if not math.isfinite(span) or span <= 0:
+        raise ExpressionError("Viewport must have a positive finite size")
+    if span > 2.0 ** -MIN_LEVEL * TILES_ACROSS:
+        raise ExpressionError(f"Viewport is wider than {2.0 ** -MIN_LEVEL * TILES_ACROSS:g}")
+    level = math.ceil(math.log2(TILES_ACROSS / span))
+    return min(MAX_LEVEL, level)
+
+
+def tile_range(low, high, level):
+    """Indices of the tiles at ``level`` that intersect ``[low, high]``"""
+    width = 2.0 ** -level
+    tiles = range(math.floor(low / width), math.floor(high / width) + 1)
+    if len(tiles) > MAX_TILES_ACROSS:
+        raise ExpressionError(f"Viewport spans {len(tiles)} tiles, the limit is {MAX_TILES_ACROSS}")
+    return tiles
+
+
+def tile_axis(index, level, samples):
+    """Sample coordinates of tile ``index``, computed exactly from integers"""
+    return (index * samples + np.arange(samples + 1)) * (2.0 ** -level / samples)
+
+
+def compute_tiles(text, kind, level, indices, samples):
+    """
+    Evaluation job: values of curve tiles (``indices`` of ``i``) or surface
+    tiles (``indices`` of ``(i, j)``) at ``level``.
+    """
+    compiled = get_compiled_expression(text)
+    results = []
+    for index in indices:
+        if kind == 'curve':
+            results.append(compiled.evaluate(x=tile_axis(index, level, samples)))
+        else:
+            i, j = index
+            x = tile_axis(i, level, samples)
+            y = tile_axis(j, level, samples)
+            results.append(compiled.evaluate(x=x[np.newaxis, :], y=y[:, np.newaxis]))
+    return results
+
+
+def _tiles(compiled, kind, level, indices, samples, info):
+    """Return tile values from TILE_CACHE, computing all missing tiles in one job"""
+    cache = get_cache('TILE_CACHE')
+    keys = [(kind, compiled.digest, level, index) for index in indices]
+    missing = object()
+    values = [cache.get(key, missing) for key in keys]
+    todo = [position for position, value in enumerate(values) if value is missing]
+    if todo:
+        computed = run_job(compute_tiles, compiled.text, kind, level,
+                           [indices[position] for position in todo], samples)
+        for position, value in zip(todo, computed):
+            value.setflags(write=False)
+            cache.set(keys[position], value)
+            values[position] = value
+    info['tiles'] += len(indices)
+    info['computed'] += len(todo)
+    return values
+
+
+def viewport_curve(compiled, x_min, x_max):
+    """
+    Sample y = f(x) across a viewport from cached tiles.
+
+    Returns ``(x, y, info)`` where ``info`` holds the level and the number of
+    tiles used and computed. The samples are cropped to the viewport, keeping
+    one point beyond each edge so the curve reaches the border.
+    """
+    if compiled.kind != 'curve':
+        raise ExpressionError("Expression is not a function of x")
+    level = tile_level(x_max - x_min)
+    n = CURVE_TILE_SAMPLES
+    info = {'level': level, 'tiles': 0, 'computed': 0}
+    columns = list(tile_range(x_min, x_max, level))
+    values = _tiles(compiled, 'curve', level, columns, n, info)
+    xs, ys = [], []
+    for position, (i, y) in enumerate(zip(columns, values)):
+        start = 0 if position == 0 else 1
+        xs.append(tile_axis(i, level, n)[start:])
+        ys.append(y[start:])
+    x = np.concatenate(xs)
+    y = np.concatenate(ys)
+    crop = _crop(x, x_min, x_max)
+    return x[crop], y[crop], info
+
+
+def _crop(axis, low, high):
+    """Slice of ``axis`` covering ``[low, high]`` plus one sample beyond each end"""
+    start = max(np.searchsorted(axis, low, side='right') - 1, 0)
+    stop = np.searchsorted(axis, high, side='left') + 1
+    return slice(start, stop)
+
+
+def viewport_surface(compiled, x_min, x_max, y_min, y_max, z_min, z_max):
+    """
+    Mesh z = f(x, y) across a viewport from cached quadtree tiles.
+
+    Both axes use the level of the larger side and the grid is cropped like
+    in ``viewport_curve``. Returns ``(vertices, indices, info)`` with the
+    buffers produced by ``grid_mesh``.
+    """
+    if compiled.kind not in ('curve', 'surface'):
+        raise ExpressionError("Expression is not a function of x and y")
+    level = tile_level(max(x_max - x_min, y_max - y_min))
+    n = SURFACE_TILE_SAMPLES
+    info = {'level': level, 'tiles': 0, 'computed': 0}
+    columns = tile_range(x_min, x_max, level)
+    rows = tile_range(y_min, y_max, level)
+    values = iter(_tiles(compiled, 'surface', level, [(i, j) for j in rows for i in columns], n, info))
+    grid = []
+    for row_position, j in enumerate(rows):
+        line = []
+        for column_position, i in enumerate(columns):
+            z = next(values)
+            line.append(z[0 if row_position == 0 else 1:, 0 if column_position == 0 else 1:])
+        grid.append(line)
+
+    x = np.concatenate([tile_axis(i, level, n)[0 if p == 0 else 1:] for p, i in enumerate(columns)])
+    y = np.concatenate([tile_axis(j, level, n)[0 if p == 0 else 1:] for p, j in enumerate(rows)])
+    columns_crop = _crop(x, x_min, x_max)
+    rows_crop = _crop(y, y_min, y_max)
+    z = np.block(grid)[rows_crop, columns_crop]
+    vertices, indices = grid_mesh(x[columns_crop], y[rows_crop], z, z_min, z_max)
+    return vertices, indices, info
@@ -3,8 +3,9 @@ from rest_framework.routers import DefaultRouter
 from .views import (
     EquationViewSet, GraphConfigViewSet, default_data, 
     register_user, login_user, CustomAuthToken, test_auth_endpoint,
-    list_routes
+    list_routes, cache_stats, metrics, shared_graph
 )
+from . import async_views
 
 router = DefaultRouter()
 router.register(r'equations', EquationViewSet, basename='equation')
@@ -14,6 +15,14 @@ urlpatterns = [
     path('', include(router.urls)),
     path('default-data/', default_data, name='default-data'),
     path('routes/', list_routes, name='list-routes'),  # List all routes for debugging
+    path('cache-stats/', cache_stats, name='cache-stats'),
+    path('metrics/', metrics, name='metrics'),
+    path('shared/<str:key>/', shared_graph, name='shared-graph'),
+    
+    # Async variants of the compute-heavy endpoints, for ASGI deployments
+    path('async/equations/<int:pk>/sample/', async_views.sample, name='async-equation-sample'),
+    path('async/graph-configs/<int:pk>/mesh/', async_views.mesh, name='async-graph-config-mesh'),
+    path('async/graph-configs/<int:pk>/evaluate/', async_views.evaluate, name='async-graph-config-evaluate'),
     
     # Auth endpoints
     path('auth/', test_auth_endpoint, name='auth-test'),  # Test endpoint
@@ -1,22 +1,206 @@
+import logging
+import math
+
 from rest_framework import viewsets, status, permissions
-from rest_framework.decorators import api_view, permission_classes, action
+from rest_framework.decorators import (
+    api_view, permission_classes, authentication_classes, renderer_classes, action
+)
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
+from django.conf import settings
 from django.contrib.auth import authenticate
-from .models import Equation, GraphConfig
+from django.db import transaction
+from django.db.models import F, Max
+from django.http import HttpResponse
+from django.urls import reverse
+from .models import Equation, GraphConfig, SharedGraph
 from .serializers import (
     EquationSerializer, GraphConfigSerializer, UserSerializer, 
-    SaveGraphRequestSerializer
+    SaveGraphRequestSerializer, BulkImportRequestSerializer, EvaluateRequestSerializer,
+    GraphPatchRequestSerializer
 )
+from .conditional import ConditionalGetMixin
+from .patches import apply_patch, VersionConflict
+from .response_cache import CachedReadMixin, invalidate_collections
+from .search import search
+from .sharing import publish, shared_graph_response
+from .thumbnails import schedule_thumbnail
+from .expressions import ExpressionError
+from .artifacts import artifact_expression, artifact_name, artifact_response, wants_artifact
+from .cache import get_compiled_expression, all_cache_stats
+from .metrics import get_registry
+from .sampling import grid_count, uniform_grid, surface_grid, surface_shape
+from .tiles import viewport_curve, viewport_surface
+from .implicit import implicit_mesh
+from .workers import run_job, error_data
+from . import jobs
+from .renderers import ARRAY_RENDERERS
+from .streaming import (
+    wants_stream, streaming_response, stream_curve, stream_meshes, stream_batch
+)
+
+logger = logging.getLogger(__name__)
 
 # Create your views here.
 
-class EquationViewSet(viewsets.ModelViewSet):
+def _int_param(request, name, default):
+    """Read an integer query parameter, reporting bad input as an ExpressionError"""
+    try:
+        return int(request.query_params.get(name, default))
+    except (TypeError, ValueError):
+        raise ExpressionError(f"{name} must be an integer")
+
+def _error_response(exc):
+    """400 for invalid expressions, or the status of a worker pool failure"""
+    return Response(error_data(exc), status=getattr(exc, 'status_code', status.HTTP_400_BAD_REQUEST))
+
+def _float_param(request, name, default):
+    """Read a finite float query parameter, reporting bad input as an ExpressionError"""
+    try:
+        value = float(request.query_params.get(name, default))
+    except (TypeError, ValueError):
+        raise ExpressionError(f"{name} must be a number")
+    if not math.isfinite(value):
+        raise ExpressionError(f"{name} must be a finite number")
+    return value
+
+def _expression_kind(text):
+    """Kind of an expression, or None if it is invalid"""
+    try:
+        return get_compiled_expression(text).kind
+    except ExpressionError:
+        return None
+
+def _sample_job(request, config, compiled):
+    """
+    The ?sampling mode, the evaluation job sampling ``compiled`` over the
+    config in that mode, and about how many points it returns
+    """
+    sampling = request.query_params.get('sampling', 'uniform')
+    if sampling == 'uniform':
+        points = grid_count(config.xMin, config.xMax, config.xStep)
+        job = (jobs.sample_uniform, compiled.text, config.xMin, config.xMax, config.xStep)
+    elif sampling == 'adaptive':
+        points = _int_param(request, 'max_points', settings.ADAPTIVE_SAMPLING_MAX_POINTS)
+        job = (jobs.sample_adaptive, compiled.text,
+               config.xMin, config.xMax, config.yMin, config.yMax, points)
+    else:
+        raise ExpressionError(f"Unknown sampling mode {sampling!r}")
+    return sampling, job, points
+
+def _samples_artifact_name(sampling, job):
+    return artifact_name('samples', *job[1:], sampling)
+
+def _samples(config, sampling, x, y):
+    """Fields of a sample response after the equation's"""
+    return {
+        'sampling': sampling,
+        'xMin': config.xMin,
+        'xMax': config.xMax,
+        'xStep': config.xStep,
+        'count': len(x),
+        'x': x,
+        'y': y
+    }
+
+def _mesh_bounds(config):
+    return [config.xMin, config.xMax, config.yMin, config.yMax, config.zMin, config.zMax]
+
+def _mesh_points(equations, x, y, resolution):
+    """About how many samples meshing ``equations`` takes"""
+    implicit = sum(_expression_kind(equation.expression) == 'implicit' for equation in equations)
+    return len(x) * len(y) * (len(equations) - implicit) + resolution ** 3 * implicit
+
+def _meshes_artifact_name(config, expressions, resolution):
+    return artifact_name('meshes', expressions, _mesh_bounds(config), config.xStep, config.yStep, resolution)
+
+def _surface(vertices, indices):
+    return {'vertexCount': len(vertices), 'vertices': vertices, 'indices': indices}
+
+def _meshes(config, equations, surfaces):
+    """Mesh response from the surfaces (or errors) of ``equations``"""
+    return {
+        'id': config.id,
+        'bounds': _mesh_bounds(config),
+        'surfaces': [
+            {
+                'id': equation.id,
+                'expression': equation.expression,
+                **({} if 'error' in surface else {'color': equation.color}),
+                **surface
+            }
+            for equation, surface in zip(equations, surfaces)
+        ]
+    }
+
+def _meshes_artifact(config, expressions, surfaces):
+    return {
+        'bounds': _mesh_bounds(config),
+        'surfaces': [
+            {'expression': expression, **surface}
+            for expression, surface in zip(expressions, surfaces)
+        ]
+    }
+
+def _evaluate_config(request, config):
+    """Apply the request's overrides of the config's bounds and steps"""
+    serializer = EvaluateRequestSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    for name, value in serializer.validated_data.items():
+        setattr(config, name, value)
+
+def _compile_batch(equations):
+    """
+    The response items of ``equations``, with the error of those that cannot
+    be evaluated, and the compiled expressions of the others
+    """
+    items = []
+    compiled_list = []
+    for equation in equations:
+        item = {'id': equation.id, 'expression': equation.expression}
+        try:
+            compiled = get_compiled_expression(equation.expression)
+            if compiled.kind == 'implicit':
+                raise ExpressionError("Implicit equations are only available from the mesh endpoint")
+            item['kind'] = compiled.kind
+            compiled_list.append(compiled)
+        except ExpressionError as exc:
+            item.update(error_data(exc))
+        items.append(item)
+    return items, compiled_list
+
+def _batch_job(config, compiled_list):
+    """The evaluation job of ``compiled_list`` over the config's shared grid"""
+    if any(compiled.kind == 'surface' for compiled in compiled_list):
+        x, y = surface_grid(config)
+    else:
+        x, y = uniform_grid(config.xMin, config.xMax, config.xStep), None
+    return (jobs.batch, [compiled.text for compiled in compiled_list], x, y)
+
+def _evaluated(config, items, compiled_list, job, values, operations):
+    """Evaluate response from the result of ``_batch_job``"""
+    values = iter(values)
+    for item in items:
+        if 'error' not in item:
+            item['values'] = next(values)
+    _, _, x, y = job
+    return {
+        'id': config.id,
+        'x': x,
+        'y': y,
+        'operations': operations,
+        'operationsWithoutSharing': sum(len(compiled.program.ops) for compiled in compiled_list),
+        'equations': items
+    }
+
+class EquationViewSet(CachedReadMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     """
     API endpoint for CRUD operations on equations
     """
     serializer_class = EquationSerializer
+    cache_collection = 'equations'
     
     def get_queryset(self):
         """
@@ -24,17 +208,101 @@ class EquationViewSet(viewsets.ModelViewSet):
         for the currently authenticated user.
         """
         user = self.request.user
-        return Equation.objects.filter(user=user)
+        queryset = Equation.objects.filter(user=user)
+        if self.action == 'list' and self.request.query_params.get('search'):
+            queryset = search(queryset, self.request.query_params['search'])
+        return queryset
     
     def perform_create(self, serializer):
-        """Save the user when creating a new equation"""
-        serializer.save(user=self.request.user)
+        """Save the user when creating a new equation, after the config's other equations"""
+        config = serializer.validated_data.get('graph_config')
+        if config is not None and 'position' not in serializer.validated_data:
+            last = config.equations.aggregate(last=Max('position'))['last']
+            serializer.save(user=self.request.user, position=0 if last is None else last + 1)
+        else:
+            serializer.save(user=self.request.user)
+    
+    @action(detail=True, methods=['get'], renderer_classes=ARRAY_RENDERERS)
+    def sample(self, request, pk=None):
+        """
+        Samples the equation over its graph config's xMin..xMax, either at
+        xStep or, with ?sampling=adaptive&max_points=N, by adaptive subdivision.
+        Uniform sampling can be streamed in chunks with ?stream=1.
+        """
+        equation = self.get_object()
+        config = equation.graph_config or GraphConfig()
+        try:
+            compiled = get_compiled_expression(equation.expression)
+            if request.query_params.get('sampling', 'uniform') == 'uniform' and wants_stream(request):
+                chunks = stream_curve(compiled, config.xMin, config.xMax, config.xStep)
+                return streaming_response(request, {
+                    'id': equation.id,
+                    'expression': equation.expression,
+                    'sampling': 'uniform',
+                    'xMin': config.xMin,
+                    'xMax': config.xMax,
+                    'xStep': config.xStep,
+                    'count': grid_count(config.xMin, config.xMax, config.xStep, settings.STREAMING_MAX_POINTS)
+                }, chunks)
+            sampling, job, points = _sample_job(request, config, compiled)
+            if wants_artifact(request, points):
+                return artifact_response(_samples_artifact_name(sampling, job), lambda: {
+                    'expression': compiled.text, **_samples(config, sampling, *run_job(*job))})
+            x, y = run_job(*job)
+        except ExpressionError as exc:
+            return _error_response(exc)
+        
+        return Response({
+            'id': equation.id,
+            'expression': equation.expression,
+            **_samples(config, sampling, x, y)
+        })
 
-class GraphConfigViewSet(viewsets.ModelViewSet):
+    @action(detail=True, methods=['get'], renderer_classes=ARRAY_RENDERERS)
+    def viewport(self, request, pk=None):
+        """
+        Evaluates the equation over the viewport given by ?xMin&xMax&yMin&yMax
+        (defaulting to its graph config) from cached power-of-two tiles.
+        Curves y = f(x) return samples, surfaces z = f(x, y) return a mesh.
+        """
+        equation = self.get_object()
+        config = equation.graph_config or GraphConfig()
+        try:
+            bounds = {
+                name: _float_param(request, name, getattr(config, name))
+                for name in ('xMin', 'xMax', 'yMin', 'yMax')
+            }
+            compiled = get_compiled_expression(equation.expression)
+            if bounds['xMax'] <= bounds['xMin'] or bounds['yMax'] <= bounds['yMin']:
+                raise ExpressionError("Upper bound must be greater than lower bound")
+            if compiled.kind == 'curve':
+                x, y, info = viewport_curve(compiled, bounds['xMin'], bounds['xMax'])
+                data = {'count': len(x), 'x': x, 'y': y}
+            else:
+                vertices, indices, info = viewport_surface(
+                    compiled, bounds['xMin'], bounds['xMax'], bounds['yMin'], bounds['yMax'],
+                    config.zMin, config.zMax)
+                data = {'vertexCount': len(vertices), 'vertices': vertices, 'indices': indices}
+        except ExpressionError as exc:
+            return _error_response(exc)
+        
+        return Response({
+            'id': equation.id,
+            'expression': equation.expression,
+            'kind': compiled.kind,
+            **bounds,
+            **info,
+            **data
+        })
+
+class GraphConfigViewSet(CachedReadMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     """
     API endpoint for CRUD operations on graph configurations
     """
     serializer_class = GraphConfigSerializer
+    cache_collection = 'graph-configs'
+    # Actions that respond with GraphConfigSerializer data, nested equations included
+    SERIALIZED_ACTIONS = ('list', 'retrieve', 'update', 'partial_update', 'saved')
     
     def get_queryset(self):
         """
@@ -42,20 +310,191 @@ class GraphConfigViewSet(viewsets.ModelViewSet):
         for the currently authenticated user.
         """
         user = self.request.user
-        return GraphConfig.objects.filter(user=user)
+        queryset = GraphConfig.objects.filter(user=user)
+        if self.action in ('list', 'saved') and self.request.query_params.get('search'):
+            queryset = search(queryset, self.request.query_params['search'])
+        if (self.action in self.SERIALIZED_ACTIONS
+                and GraphConfigSerializer.includes_field(self.request, 'equations')):
+            # Fetch the nested equations of every config in one extra query
+            queryset = queryset.prefetch_related('equations')
+        return queryset
     
     def perform_create(self, serializer):
         """Save the user when creating a new graph config"""
         serializer.save(user=self.request.user)
     
+    def update(self, request, *args, **kwargs):
+        try:
+            return super().update(request, *args, **kwargs)
+        except VersionConflict as exc:
+            return Response({'error': str(exc), 'version': exc.version}, status=status.HTTP_409_CONFLICT)
+    
+    def perform_update(self, serializer):
+        """
+        Full updates are changes too: move the version on, like apply_patch,
+        unless another write moved it since the config was read
+        """
+        config = serializer.instance
+        with transaction.atomic():
+            if not GraphConfig.objects.filter(pk=config.pk, version=config.version).update(
+                    version=F('version') + 1):
+                raise VersionConflict(GraphConfig.objects.values_list('version', flat=True).get(pk=config.pk))
+            serializer.save(version=config.version + 1)
+    
     @action(detail=False, methods=['get'])
     def saved(self, request):
         """
-        Returns all saved graph configurations for the user
+        Returns the saved graph configurations of the user, one page at a time
         """
         queryset = self.get_queryset().filter(is_saved=True)
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        
+        def respond():
+            page = self.paginate_queryset(queryset)
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        
+        return self.cached_list(request, lambda: self.conditional_list(request, queryset, respond))
+    
+    @action(detail=True, methods=['post'], url_path='patch')
+    def patch_graph(self, request, pk=None):
+        """
+        Applies a batch of edits to the config and its equations in one
+        transaction: {"version": n, "operations": [...]}, see
+        GraphPatchOperationSerializer. Responds with the new version and only
+        the rows that changed, or 409 with the current version if the graph
+        changed since version n.
+        """
+        config = self.get_object()
+        serializer = GraphPatchRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            result = apply_patch(config, serializer.validated_data['version'],
+                                 serializer.validated_data['operations'])
+        except VersionConflict as exc:
+            return Response({'error': str(exc), 'version': exc.version}, status=status.HTTP_409_CONFLICT)
+        # Bulk writes send no signals
+        schedule_thumbnail(config.pk)
+        
+        return Response({
+            **result,
+            'equations': EquationSerializer(result['equations'], many=True).data
+        })
+    
+    @action(detail=True, methods=['post', 'delete'])
+    def share(self, request, pk=None):
+        """
+        POST publishes the config as it is now at a public, read-only link
+        (the existing one if nothing changed since it was last published);
+        DELETE revokes every link to it.
+        """
+        config = self.get_object()
+        if request.method == 'DELETE':
+            revoked, _ = config.shares.all().delete()
+            return Response({'revoked': revoked})
+        
+        shared, created = publish(config)
+        return Response({
+            'key': shared.key,
+            'url': request.build_absolute_uri(reverse('shared-graph', args=[shared.key])),
+            'etag': shared.etag,
+            'created_at': shared.created_at
+        }, status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+    
+    @action(detail=True, methods=['get'], renderer_classes=ARRAY_RENDERERS)
+    def mesh(self, request, pk=None):
+        """
+        Triangle meshes for every visible equation: z = f(x, y) is evaluated
+        over the config's x/y grid and clipped to zMin..zMax, implicit
+        F(x, y, z) = 0 is polygonized inside the bounding box with
+        ?resolution=N cells per axis. ?stream=1 sends the meshes in chunks.
+        """
+        config = self.get_object()
+        bounds = _mesh_bounds(config)
+        stream = wants_stream(request)
+        try:
+            if stream:
+                # The stream builds the axes a block at a time
+                surface_shape(config, settings.STREAMING_MAX_POINTS)
+            else:
+                x, y = surface_grid(config)
+            resolution = _int_param(request, 'resolution', settings.IMPLICIT_SURFACE_RESOLUTION)
+        except ExpressionError as exc:
+            return _error_response(exc)
+        
+        if stream:
+            equations = list(config.equations.filter(visible=True))
+            return streaming_response(request, {
+                'id': config.id,
+                'bounds': bounds,
+                'xStep': config.xStep,
+                'yStep': config.yStep,
+                'equations': [
+                    {'id': equation.id, 'expression': equation.expression, 'color': equation.color}
+                    for equation in equations
+                ]
+            }, stream_meshes(equations, config, resolution))
+        
+        equations = list(config.equations.filter(visible=True))
+        
+        def surfaces(expressions):
+            for expression in expressions:
+                try:
+                    compiled = get_compiled_expression(expression)
+                    if compiled.kind == 'implicit':
+                        vertices, indices = implicit_mesh(compiled, bounds, resolution)
+                    else:
+                        vertices, indices = run_job(jobs.surface_mesh, compiled.text, x, y,
+                                                    config.zMin, config.zMax)
+                except ExpressionError as exc:
+                    yield error_data(exc)
+                    continue
+                yield _surface(vertices, indices)
+        
+        if wants_artifact(request, _mesh_points(equations, x, y, resolution)):
+            expressions = [artifact_expression(equation.expression) for equation in equations]
+            return artifact_response(_meshes_artifact_name(config, expressions, resolution),
+                                     lambda: _meshes_artifact(config, expressions, surfaces(expressions)))
+        
+        return Response(_meshes(config, equations, surfaces(equation.expression for equation in equations)))
+    
+    @action(detail=True, methods=['post'], renderer_classes=ARRAY_RENDERERS)
+    def evaluate(self, request, pk=None):
+        """
+        Evaluates every visible equation of the config in one call: curves
+        along the x axis, surfaces over the x/y grid. The body may override
+        xMin, xMax, xStep, yMin, yMax and yStep for this request, and
+        ?stream=1 sends the values in chunks.
+        """
+        config = self.get_object()
+        _evaluate_config(request, config)
+        equations, compiled_list = _compile_batch(config.equations.filter(visible=True))
+        
+        try:
+            if wants_stream(request):
+                # Validate the grid; the stream builds the axes a chunk at a time
+                if any(compiled.kind == 'surface' for compiled in compiled_list):
+                    surface_shape(config, settings.STREAMING_MAX_POINTS)
+                else:
+                    grid_count(config.xMin, config.xMax, config.xStep, settings.STREAMING_MAX_POINTS)
+                items = [(item['id'], compiled) for item, compiled in zip(
+                    [item for item in equations if 'error' not in item], compiled_list)]
+                return streaming_response(request, {
+                    'id': config.id,
+                    'xMin': config.xMin,
+                    'xMax': config.xMax,
+                    'xStep': config.xStep,
+                    'yMin': config.yMin,
+                    'yMax': config.yMax,
+                    'yStep': config.yStep,
+                    'equations': equations
+                }, stream_batch(items, config))
+            job = _batch_job(config, compiled_list)
+            values, operations = run_job(*job)
+        except ExpressionError as exc:
+            return _error_response(exc)
+        
+        return Response(_evaluated(config, equations, compiled_list, job, values, operations))
     
     @action(detail=False, methods=['post'])
     def save_current(self, request):
@@ -64,31 +503,9 @@ class GraphConfigViewSet(viewsets.ModelViewSet):
         """
         serializer = SaveGraphRequestSerializer(data=request.data)
         if serializer.is_valid():
-            # Create graph config
-            config_data = serializer.validated_data['config']
-            graph_config = GraphConfig.objects.create(
-                user=request.user,
-                name=serializer.validated_data['name'],
-                description=serializer.validated_data.get('description', ''),
-                xMin=config_data.get('xMin', -10),
-                xMax=config_data.get('xMax', 10),
-                yMin=config_data.get('yMin', -10),
-                yMax=config_data.get('yMax', 10),
-                xStep=config_data.get('xStep', 0.1),
-                gridVisible=config_data.get('gridVisible', True),
-                is_saved=True
-            )
-            
-            # Create equations
-            equations_data = serializer.validated_data['equations']
-            for eq_data in equations_data:
-                Equation.objects.create(
-                    user=request.user,
-                    graph_config=graph_config,
-                    expression=eq_data.get('expression', ''),
-                    color=eq_data.get('color', '#3498db'),
-                    visible=eq_data.get('visible', True)
-                )
+            with transaction.atomic():
+                graph_config, = _save_graphs(request.user, [serializer.validated_data])
+                schedule_thumbnail(graph_config.pk)
             
             return Response(
                 GraphConfigSerializer(graph_config).data, 
@@ -96,6 +513,56 @@ class GraphConfigViewSet(viewsets.ModelViewSet):
             )
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    @action(detail=False, methods=['post'])
+    def bulk_import(self, request):
+        """
+        Import many saved graphs at once. The body is {"graphs": [...]} with
+        items shaped like the save_current body; all of them are validated
+        before anything is written, and then inserted in one transaction.
+        """
+        serializer = BulkImportRequestSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        graphs = serializer.validated_data['graphs']
+        batch_size = settings.BULK_IMPORT_BATCH_SIZE
+        ids = []
+        with transaction.atomic():
+            for start in range(0, len(graphs), batch_size):
+                configs = _save_graphs(request.user, graphs[start:start + batch_size])
+                ids.extend(config.id for config in configs)
+        
+        return Response({
+            'imported': len(ids),
+            'equations': sum(len(graph['equations']) for graph in graphs),
+            'ids': ids
+        }, status=status.HTTP_201_CREATED)
+
+def _save_graphs(user, graphs):
+    """
+    Insert validated SaveGraphRequestSerializer data as saved graph configs
+    with their equations: one INSERT for the configs and one (batched) for all
+    of the equations. Call inside a transaction.
+    """
+    configs = GraphConfig.objects.bulk_create([
+        GraphConfig(
+            user=user,
+            name=graph['name'],
+            description=graph.get('description', ''),
+            is_saved=True,
+            **graph['config']
+        )
+        for graph in graphs
+    ])
+    Equation.objects.bulk_create([
+        Equation(user=user, graph_config=config, position=position, **eq_data)
+        for config, graph in zip(configs, graphs)
+        for position, eq_data in enumerate(graph['equations'])
+    ], batch_size=settings.BULK_IMPORT_BATCH_SIZE)
+    # bulk_create sends no signals
+    invalidate_collections(user.pk, 'graph-configs', 'equations')
+    return configs
 
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
@@ -108,7 +575,10 @@ def default_data(request):
         "xMax": 10,
         "yMin": -10,
         "yMax": 10,
+        "zMin": -10,
+        "zMax": 10,
         "xStep": 0.1,
+        "yStep": 0.1,
         "gridVisible": True
     }
     
@@ -132,15 +602,27 @@ def default_data(request):
         "equations": default_equations
     })
 
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([permissions.AllowAny])
+@renderer_classes([JSONRenderer])
+def shared_graph(request, key):
+    """
+    A published graph, for anyone with the link: the body stored when it was
+    published, read with one primary-key lookup. No authentication, so that
+    the response is the same for every request and can be cached publicly.
+    """
+    shared = SharedGraph.objects.filter(pk=key).values_list('content', 'etag').first()
+    if shared is None:
+        return Response({'error': 'Shared graph not found'}, status=status.HTTP_404_NOT_FOUND)
+    return shared_graph_response(request._request, *shared)
+
 @api_view(['POST'])
 @permission_classes([permissions.AllowAny])
 def register_user(request):
     """
     Register a new user and return auth token
     """
-    print(request.data)
-
-
     serializer = UserSerializer(data=request.data)
     if serializer.is_valid():
         user = serializer.save()
@@ -152,7 +634,8 @@ def register_user(request):
             'email': user.email
         }, status=status.HTTP_201_CREATED)
     
-    print(serializer.errors)
+    # The body may be any JSON value, only the errors are known to be safe to read
+    logger.info("Registration rejected: %s", serializer.errors)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['POST'])
@@ -203,6 +686,23 @@ def test_auth_endpoint(request):
         }
     })
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def cache_stats(request):
+    """
+    Hit, miss and eviction counters of the in-process caches
+    """
+    return Response(all_cache_stats())
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def metrics(request):
+    """
+    Per-view request counts, latency histograms, SQL, serializer and
+    response size totals of this process, in the Prometheus text format
+    """
+    return HttpResponse(get_registry().render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @api_view(['GET'])
 @permission_classes([permissions.AllowAny])
 def list_routes(request):
@@ -0,0 +1,364 @@
+"""
+Isolated worker processes for expression evaluation.
+
+Evaluation jobs run in a small pool of long-lived worker processes, never in
+the WSGI/ASGI worker itself. Every job gets a wall-clock timeout (enforced by
+the parent, which kills the worker) and a CPU-time budget (enforced in the
+worker through RLIMIT_CPU); every worker runs under an RLIMIT_AS address
+space cap. Workers that time out, crash or reach MAX_JOBS are replaced, and
+failures are raised in the caller as an ``EvaluationError`` with a
+machine-readable ``code``. Async views await jobs with ``arun_job``, which
+also kills the worker when the awaiting task is cancelled.
+
+With ``EVALUATION_POOL['WORKERS'] = 0`` jobs run inline in the calling
+process, without isolation.
+"""
+import asyncio
+import atexit
+import math
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .expressions import ExpressionError
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class EvaluationError(ExpressionError):
+    """
+    An evaluation job failed in the worker pool. ``code`` is one of
+    ``timeout``, ``cpu_limit``, ``memory_limit``, ``worker_crashed``,
+    ``busy`` or ``failed``.
+    """
+    status_code = 422
+
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+        if code in ('busy', 'worker_crashed'):
+            self.status_code = 503
+
+
+def error_data(exc):
+    """Response payload for an ExpressionError, with the failure code of pool errors"""
+    data = {'error': str(exc)}
+    if isinstance(exc, EvaluationError):
+        data['code'] = exc.code
+    return data
+
+
+class _CPULimitExceeded(Exception):
+    pass
+
+
+def _raise_cpu_limit(signum, frame):
+    raise _CPULimitExceeded()
+
+
+def _cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _worker_main(conn, memory_bytes):
+    """Job loop of a worker process: receive (func, args, cpu_time), send the outcome back"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'desmos3d.settings')
+    import django
+    django.setup()
+
+    if resource is not None:
+        if memory_bytes:
+            _, hard = resource.getrlimit(resource.RLIMIT_AS)
+            resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, hard))
+        signal.signal(signal.SIGXCPU, _raise_cpu_limit)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if job is None:
+            return
+        func, args, cpu_time = job
+        if resource is not None and cpu_time:
+            _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+            resource.setrlimit(resource.RLIMIT_CPU, (math.ceil(_cpu_seconds() + cpu_time), hard))
+        try:
+            outcome = ('ok', func(*args))
+        except _CPULimitExceeded:
+            outcome = ('error', 'cpu_limit', f"Evaluation exceeded {cpu_time}s of CPU time")
+        except MemoryError:
+            outcome = ('error', 'memory_limit', "Evaluation exceeded the memory limit")
+        except ExpressionError as exc:
+            outcome = ('error', 'invalid', str(exc))
+        except Exception as exc:
+            outcome = ('error', 'failed', f"Evaluation failed: {exc.__class__.__name__}")
+        finally:
+            if resource is not None and cpu_time:
+                _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+                resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+        try:
+            conn.send(outcome)
+        except MemoryError:
+            conn.send(('error', 'memory_limit', "Result exceeded the memory limit"))
+
+
+class _Worker:
+    def __init__(self, context, memory_bytes):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main, args=(child_conn, memory_bytes), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class WorkerPool:
+    """
+    A fixed number of worker processes, each running one job at a time.
+    Callers block until a worker is idle (up to ``queue_timeout`` seconds).
+    """
+
+    def __init__(self, workers, timeout, cpu_time, memory_bytes, max_jobs, queue_timeout):
+        self.size = workers
+        self.timeout = timeout
+        self.cpu_time = cpu_time
+        self.memory_bytes = memory_bytes
+        self.max_jobs = max_jobs
+        self.queue_timeout = queue_timeout
+        self._context = multiprocessing.get_context('spawn')
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self.started = 0
+        self.recycled = 0
+        for _ in range(workers):
+            self._idle.put(None)  # started lazily on first use
+
+    def _start(self):
+        with self._lock:
+            self.started += 1
+        return _Worker(self._context, self.memory_bytes)
+
+    def _release(self, worker, healthy=True):
+        if worker is not None and (not healthy or (self.max_jobs and worker.jobs >= self.max_jobs)):
+            if healthy:
+                worker.stop()
+            else:
+                worker.kill()
+            with self._lock:
+                self.recycled += 1
+            worker = None
+        self._idle.put(worker)
+
+    def _discard_started(self, starting):
+        """Done callback of a worker start nobody waits for any more: free its slot"""
+        if not starting.cancelled() and starting.exception() is None:
+            self._release(starting.result(), healthy=False)
+        else:
+            self._idle.put(None)
+
+    def _ensure_started(self, worker):
+        if worker is None or not worker.process.is_alive():
+            try:
+                worker = self._start()
+            except Exception:
+                self._idle.put(None)
+                raise
+        return worker
+
+    def _outcome(self, worker):
+        """Read the outcome of the job running in ``worker`` and release it"""
+        try:
+            outcome = worker.conn.recv()
+        except (EOFError, OSError):
+            self._release(worker, healthy=False)
+            raise EvaluationError("Evaluation worker crashed", 'worker_crashed')
+        except BaseException:
+            # e.g. a result that cannot be unpickled: never lose the worker's slot
+            self._release(worker, healthy=False)
+            raise
+        self._release(worker)
+
+        if outcome[0] == 'ok':
+            return outcome[1]
+        _, code, message = outcome
+        if code == 'invalid':
+            raise ExpressionError(message)
+        raise EvaluationError(message, code)
+
+    def run(self, func, *args, timeout=None):
+        """Run ``func(*args)`` in a worker and return its result"""
+        try:
+            worker = self._idle.get(timeout=self.queue_timeout)
+        except queue.Empty:
+            raise EvaluationError("All evaluation workers are busy", 'busy')
+        worker = self._ensure_started(worker)
+        timeout = timeout or self.timeout
+        worker.jobs += 1
+        try:
+            worker.conn.send((func, args, self.cpu_time))
+            ready = worker.conn.poll(timeout)
+        except (EOFError, OSError):
+            ready = True  # recv reports the crash
+        except BaseException:
+            # e.g. arguments that cannot be pickled: never lose the worker's slot
+            self._release(worker, healthy=False)
+            raise
+        if not ready:
+            self._release(worker, healthy=False)
+            raise EvaluationError(f"Evaluation timed out after {timeout}s", 'timeout')
+        return self._outcome(worker)
+
+    async def arun(self, func, *args, timeout=None):
+        """
+        ``run`` for async views. Waits for the result without holding a
+        thread, and kills the worker if the awaiting task is cancelled, e.g.
+        because the client disconnected.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.queue_timeout
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+                break
+            except queue.Empty:
+                if loop.time() >= deadline:
+                    raise EvaluationError("All evaluation workers are busy", 'busy')
+                await asyncio.sleep(0.01)
+        if worker is None or not worker.process.is_alive():
+            starting = loop.run_in_executor(None, self._start)
+            try:
+                worker = await asyncio.shield(starting)
+            except asyncio.CancelledError:
+                # The thread goes on starting the process: kill it when it is up
+                starting.add_done_callback(self._discard_started)
+                raise
+            except BaseException:
+                self._idle.put(None)
+                raise
+        timeout = timeout or self.timeout
+        worker.jobs += 1
+        ready = loop.create_future()
+        fileno = worker.conn.fileno()
+        try:
+            worker.conn.send((func, args, self.cpu_time))
+            loop.add_reader(fileno, lambda: ready.done() or ready.set_result(None))
+            try:
+                await asyncio.wait_for(ready, timeout)
+            finally:
+                loop.remove_reader(fileno)
+        except asyncio.TimeoutError:
+            self._release(worker, healthy=False)
+            raise EvaluationError(f"Evaluation timed out after {timeout}s", 'timeout')
+        except (EOFError, OSError):
+            pass  # recv reports the crash
+        except BaseException:
+            self._release(worker, healthy=False)
+            raise
+        return self._outcome(worker)
+
+    def map(self, func, arg_tuples):
+        """Run ``func`` over several argument tuples in parallel, keeping their order"""
+        arg_tuples = list(arg_tuples)
+        if len(arg_tuples) <= 1:
+            return [self.run(func, *args) for args in arg_tuples]
+        with ThreadPoolExecutor(max_workers=min(self.size, len(arg_tuples))) as threads:
+            return list(threads.map(lambda args: self.run(func, *args), arg_tuples))
+
+    def close(self):
+        self._closed = True
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            if worker is not None:
+                worker.stop()
+
+    def stats(self):
+        return {
+            'workers': self.size,
+            'started': self.started,
+            'recycled': self.recycled,
+            'idle': self._idle.qsize(),
+        }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """The process-wide worker pool configured by EVALUATION_POOL, or None when disabled"""
+    global _pool
+    options = settings.EVALUATION_POOL
+    if not options['WORKERS']:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool(
+                workers=options['WORKERS'],
+                timeout=options['TIMEOUT'],
+                cpu_time=options['CPU_TIME'],
+                memory_bytes=options['MEMORY_MB'] * 1024 * 1024,
+                max_jobs=options['MAX_JOBS'],
+                queue_timeout=options['QUEUE_TIMEOUT'],
+            )
+            atexit.register(_pool.close)
+        return _pool
+
+
+def run_job(func, *args):
+    """Run an evaluation job in the worker pool (or inline when the pool is disabled)"""
+    pool = get_pool()
+    if pool is None:
+        return func(*args)
+    return pool.run(func, *args)
+
+
+async def arun_job(func, *args):
+    """
+    ``run_job`` for async views. Without a pool the job runs in a thread and
+    cannot be cancelled.
+    """
+    pool = get_pool()
+    if pool is None:
+        return await asyncio.to_thread(func, *args)
+    return await pool.arun(func, *args)
+
+
+async def amap_jobs(func, arg_tuples):
+    """``map_jobs`` for async views"""
+    return await asyncio.gather(*(arun_job(func, *args) for args in arg_tuples))
+
+
+def map_jobs(func, arg_tuples):
+    """Run several evaluation jobs in parallel across the pool, keeping their order"""
+    pool = get_pool()
+    if pool is None:
+        return [func(*args) for args in arg_tuples]
+    return pool.map(func, arg_tuples)
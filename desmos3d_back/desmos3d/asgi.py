@@ -7,10 +7,65 @@ For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
 
+import asyncio
 import os
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'desmos3d.settings')
 
-application = get_asgi_application()
+
+class CancelOnDisconnect:
+    """
+    Cancel the handling of an HTTP request when the client disconnects before
+    the response is complete, which Django 4.2's ASGI handler does not do.
+    Async views see ``asyncio.CancelledError`` at their next ``await``.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        body_read = asyncio.Event()
+
+        async def receive_body():
+            message = await receive()
+            if message['type'] != 'http.request' or not message.get('more_body', False):
+                body_read.set()
+            return message
+
+        response_sent = False
+
+        async def send_response(message):
+            nonlocal response_sent
+            await send(message)
+            if message['type'] == 'http.response.body' and not message.get('more_body', False):
+                response_sent = True
+
+        task = asyncio.ensure_future(self.app(scope, receive_body, send_response))
+        disconnected = False
+
+        async def watch():
+            nonlocal disconnected
+            # Django stops reading once it has the body; listen for the disconnect from there
+            await body_read.wait()
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            if not response_sent:
+                disconnected = True
+                task.cancel()
+
+        watcher = asyncio.ensure_future(watch())
+        try:
+            await task
+        except asyncio.CancelledError:
+            if not disconnected:
+                raise
+        finally:
+            watcher.cancel()
+
+
+application = CancelOnDisconnect(get_asgi_application())
@@ -10,3 +10,15 @@ class StaticRootS3Boto3Storage(S3Boto3Storage):
 class MediaRootS3Boto3Storage(S3Boto3Storage):
     location = 'media'
     default_acl = 'public-read'
+
+
+class ArtifactS3Boto3Storage(S3Boto3Storage):
+    """Precomputed evaluation results (api/artifacts.py): content-addressed, so cached for good"""
+    location = 'artifacts'
+    default_acl = 'public-read'
+    file_overwrite = True
+    object_parameters = {
+        **settings.AWS_S3_OBJECT_PARAMETERS,
+        'CacheControl': 'public, max-age=31536000, immutable',
+        'ContentType': 'application/octet-stream',
+    }
@@ -48,6 +48,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -98,6 +99,64 @@ if 'DATABASE_URL' in os.environ:
     )
 
 
+# Cache framework: local memory by default, Redis when REDIS_URL is set. The
+# response and token caches are invalidated by signal handlers, which only reach
+# the other processes through a shared cache, so they are off without Redis.
+SHARED_CACHE = 'REDIS_URL' in os.environ
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+if SHARED_CACHE:
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+
+# Serialized responses of the equation and graph config reads, per user
+RESPONSE_CACHE = {
+    'ENABLED': os.environ.get('RESPONSE_CACHE_ENABLED', str(SHARED_CACHE)) == 'True',
+    'ALIAS': 'default',
+    'TIMEOUT': int(os.environ.get('RESPONSE_CACHE_TIMEOUT', 300)),
+}
+
+# Request metrics served at /api/metrics/, see api/metrics.py. Requests slower than
+# SLOW_REQUEST_SECONDS (0 disables the log) are logged with their slowest queries.
+METRICS = {
+    'BUCKETS': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    'SLOW_REQUEST_SECONDS': float(os.environ.get('SLOW_REQUEST_SECONDS', 0)),
+    'SLOW_REQUEST_QUERIES': int(os.environ.get('SLOW_REQUEST_QUERIES', 5)),
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api': {'handlers': ['console'], 'level': os.environ.get('API_LOG_LEVEL', 'INFO')},
+    },
+}
+
+# Graph previews, see api/thumbnails.py
+THUMBNAILS = {
+    'ENABLED': os.environ.get('THUMBNAILS_ENABLED', 'True') == 'True',
+    'SIZE': int(os.environ.get('THUMBNAIL_SIZE', 128)),
+}
+
+# Resolved API tokens, see api/authentication.py
+TOKEN_CACHE = {
+    'ENABLED': os.environ.get('TOKEN_CACHE_ENABLED', str(SHARED_CACHE)) == 'True',
+    'ALIAS': 'default',
+    'TIMEOUT': int(os.environ.get('TOKEN_CACHE_TIMEOUT', 60)),
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -158,6 +217,33 @@ else:
     STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
     STATICFILES_STORAGE = 'desmos3d.cdn.backends.StaticRootS3Boto3Storage'
     DEFAULT_FILE_STORAGE = 'desmos3d.cdn.backends.MediaRootS3Boto3Storage'
+
+# Precomputed binary samples and meshes, see api/artifacts.py. Requests of at least
+# MIN_POINTS points are stored once; REDIRECT sends clients to the stored file instead
+# of serving it, MAX_ENTRIES names known to exist are remembered per process.
+ARTIFACTS = {
+    'ENABLED': os.environ.get('ARTIFACTS_ENABLED', 'True') == 'True',
+    'STORAGE': 'django.core.files.storage.FileSystemStorage',
+    'OPTIONS': {
+        'location': os.path.join(MEDIA_ROOT, 'artifacts'),
+        'base_url': f'{MEDIA_URL}artifacts/',
+    },
+    'MIN_POINTS': int(os.environ.get('ARTIFACT_MIN_POINTS', 100_000)),
+    'REDIRECT': os.environ.get('ARTIFACT_REDIRECT', str(not DEVELOPMENT_MODE)) == 'True',
+    'MAX_ENTRIES': int(os.environ.get('ARTIFACT_CACHE_MAX_ENTRIES', 10000)),
+}
+if not DEVELOPMENT_MODE:
+    ARTIFACTS['STORAGE'] = 'desmos3d.cdn.backends.ArtifactS3Boto3Storage'
+    ARTIFACTS['OPTIONS'] = {}
+
+# Public share links, see api/sharing.py
+SHARED_GRAPHS = {
+    # How long browsers and shared caches (CDNs) may serve a link without
+    # revalidating it: a revoked link stays visible there for that long
+    'MAX_AGE': int(os.environ.get('SHARED_GRAPH_MAX_AGE', 60)),
+    'S_MAXAGE': int(os.environ.get('SHARED_GRAPH_S_MAXAGE', 600)),
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -209,7 +295,54 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     ],
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.CreatedCursorPagination',
+    'PAGE_SIZE': int(os.environ.get('PAGE_SIZE', 100)),
+}
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 1000))
+
+# Expression evaluation settings
+EXPRESSION_MAX_POINTS = int(os.environ.get('EXPRESSION_MAX_POINTS', 1_000_000))
+STREAMING_MAX_POINTS = int(os.environ.get('STREAMING_MAX_POINTS', 100_000_000))
+ADAPTIVE_SAMPLING_MAX_POINTS = int(os.environ.get('ADAPTIVE_SAMPLING_MAX_POINTS', 2000))
+
+# Process-wide LRU cache of compiled expressions, keyed by normalized text
+EXPRESSION_CACHE = {
+    'MAX_ENTRIES': int(os.environ.get('EXPRESSION_CACHE_MAX_ENTRIES', 1024)),
+    'MAX_BYTES': int(os.environ.get('EXPRESSION_CACHE_MAX_BYTES', 8 * 1024 * 1024)),
+}
+
+# Process-wide LRU cache of viewport tiles, keyed by (expression, level, tile index)
+TILE_CACHE = {
+    'MAX_ENTRIES': int(os.environ.get('TILE_CACHE_MAX_ENTRIES', 20000)),
+    'MAX_BYTES': int(os.environ.get('TILE_CACHE_MAX_BYTES', 128 * 1024 * 1024)),
+}
+
+# Implicit surfaces F(x, y, z) = 0: cells per axis
+IMPLICIT_SURFACE_RESOLUTION = int(os.environ.get('IMPLICIT_SURFACE_RESOLUTION', 64))
+IMPLICIT_SURFACE_MAX_RESOLUTION = int(os.environ.get('IMPLICIT_SURFACE_MAX_RESOLUTION', 256))
+IMPLICIT_CACHE = {
+    'MAX_ENTRIES': int(os.environ.get('IMPLICIT_CACHE_MAX_ENTRIES', 256)),
+    'MAX_BYTES': int(os.environ.get('IMPLICIT_CACHE_MAX_BYTES', 256 * 1024 * 1024)),
 }
+
+# Isolated evaluation worker processes (WORKERS = 0 evaluates inline, without limits).
+# TIMEOUT is wall-clock and CPU_TIME is CPU seconds per job, MEMORY_MB caps each
+# worker's address space, MAX_JOBS recycles workers after that many jobs.
+EVALUATION_POOL = {
+    'WORKERS': int(os.environ.get('EVALUATION_WORKERS', os.cpu_count() or 1)),
+    'TIMEOUT': float(os.environ.get('EVALUATION_TIMEOUT', 10)),
+    'CPU_TIME': int(os.environ.get('EVALUATION_CPU_TIME', 10)),
+    'MEMORY_MB': int(os.environ.get('EVALUATION_MEMORY_MB', 2048)),
+    'MAX_JOBS': int(os.environ.get('EVALUATION_MAX_JOBS', 1000)),
+    'QUEUE_TIMEOUT': float(os.environ.get('EVALUATION_QUEUE_TIMEOUT', 5)),
+}
+
+# Bulk graph import: graphs per request, and rows per INSERT statement
+BULK_IMPORT_MAX_GRAPHS = int(os.environ.get('BULK_IMPORT_MAX_GRAPHS', 5000))
+BULK_IMPORT_BATCH_SIZE = int(os.environ.get('BULK_IMPORT_BATCH_SIZE', 500))
+
+# Operations accepted by one graph-configs/{id}/patch/ request
+GRAPH_PATCH_MAX_OPERATIONS = int(os.environ.get('GRAPH_PATCH_MAX_OPERATIONS', 500))
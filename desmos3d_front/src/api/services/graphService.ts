@@ -1,5 +1,24 @@
 import api from '../config';
-import { EquationData, GraphConfigData, DefaultDataResponse, SaveGraphRequest } from '../types';
+import {
+  EquationData, GraphConfigData, DefaultDataResponse, SaveGraphRequest, Page,
+  GraphPatchOperation, GraphPatchResponse, ShareResponse
+} from '../types';
+
+/**
+ * Fetch every item of a cursor-paginated list, following `next` until the last page
+ * @param url List URL
+ * @returns Items of all pages, in order
+ */
+async function getAllPages<T>(url: string): Promise<T[]> {
+  const items: T[] = [];
+  let next: string | null = url;
+  while (next) {
+    const response: { data: Page<T> } = await api.get<Page<T>>(next);
+    items.push(...response.data.results);
+    next = response.data.next;
+  }
+  return items;
+}
 
 export const graphService = {
   /**
@@ -13,12 +32,11 @@ export const graphService = {
   
   // Equation related methods
   /**
-   * Get all equations
+   * Get all equations, page by page
    * @returns List of equations
    */
   async getEquations(): Promise<EquationData[]> {
-    const response = await api.get<EquationData[]>('/equations/');
-    return response.data;
+    return getAllPages<EquationData>('/equations/');
   },
   
   /**
@@ -62,21 +80,19 @@ export const graphService = {
   
   // Graph configuration related methods
   /**
-   * Get all graph configurations
+   * Get all graph configurations, page by page
    * @returns List of graph configurations
    */
   async getGraphConfigs(): Promise<GraphConfigData[]> {
-    const response = await api.get<GraphConfigData[]>('/graph-configs/');
-    return response.data;
+    return getAllPages<GraphConfigData>('/graph-configs/');
   },
   
   /**
-   * Get saved graph configurations
+   * Get all saved graph configurations, page by page
    * @returns List of saved graph configurations
    */
   async getSavedGraphs(): Promise<GraphConfigData[]> {
-    const response = await api.get<GraphConfigData[]>('/graph-configs/saved/');
-    return response.data;
+    return getAllPages<GraphConfigData>('/graph-configs/saved/');
   },
   
   /**
@@ -118,6 +134,38 @@ export const graphService = {
     await api.delete(`/graph-configs/${id}/`);
   },
   
+  /**
+   * Apply a batch of edits to a graph configuration and its equations
+   * @param id Configuration ID
+   * @param version Version the edits are based on; a stale version is rejected with 409
+   * @param operations Edits to apply, in order
+   * @returns New version and the changed rows
+   */
+  async patchGraph(id: number, version: number, operations: GraphPatchOperation[]): Promise<GraphPatchResponse> {
+    const response = await api.post<GraphPatchResponse>(`/graph-configs/${id}/patch/`, { version, operations });
+    return response.data;
+  },
+  
+  /**
+   * Publish a graph configuration at a public, read-only link
+   * @param id Configuration ID
+   * @returns Key and URL of the link
+   */
+  async shareGraph(id: number): Promise<ShareResponse> {
+    const response = await api.post<ShareResponse>(`/graph-configs/${id}/share/`);
+    return response.data;
+  },
+  
+  /**
+   * Get a published graph; needs no login
+   * @param key Key of the share link
+   * @returns Graph state as it was when published
+   */
+  async getSharedGraph(key: string): Promise<SaveGraphRequest> {
+    const response = await api.get<SaveGraphRequest>(`/shared/${key}/`);
+    return response.data;
+  },
+  
   /**
    * Save current graph state
    * @param data Current graph state
@@ -30,6 +30,7 @@ export interface EquationData {
   color: string;
   visible: boolean;
   graph_config?: number;
+  position?: number;
   created_at?: string;
   updated_at?: string;
 }
@@ -46,11 +47,20 @@ export interface GraphConfigData {
   xStep: number;
   gridVisible: boolean;
   is_saved?: boolean;
+  version?: number;
+  thumbnail?: string | null;
   equations?: EquationData[];
   created_at?: string;
   updated_at?: string;
 }
 
+// One page of a cursor-paginated list
+export interface Page<T> {
+  next: string | null;
+  previous: string | null;
+  results: T[];
+}
+
 // Default data response type
 export interface DefaultDataResponse {
   config: {
@@ -86,4 +96,27 @@ export interface SaveGraphRequest {
     color: string;
     visible: boolean;
   }[];
-} 
\ No newline at end of file
+} 
+// One edit in a graph patch request
+export type GraphPatchOperation =
+  | { op: 'add'; ref?: string; fields: Partial<Omit<EquationData, 'id'>> }
+  | { op: 'update'; id?: number; fields: Record<string, unknown> }
+  | { op: 'remove'; id: number }
+  | { op: 'reorder'; order: number[] };
+
+// Result of a graph patch: the new version and only the rows that changed
+export interface GraphPatchResponse {
+  version: number;
+  config: Partial<GraphConfigData>;
+  equations: EquationData[];
+  created: Record<string, number>;
+  removed: number[];
+}
+
+// A published, read-only link to a graph
+export interface ShareResponse {
+  key: string;
+  url: string;
+  etag: string;
+  created_at: string;
+}